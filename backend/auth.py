@@ -1,6 +1,9 @@
 """
 JWT Authentication utilities
 """
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -10,7 +13,9 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
-from backend.database import get_db, User
+from backend.database import AsyncSessionLocal, User
+from backend.config import AUTH_CACHE_TTL, AUTH_CACHE_SIZE, BCRYPT_ROUNDS, BCRYPT_POOL_SIZE
+from backend.cache import TTLCache
 
 # JWT settings
 SECRET_KEY = "your-secret-key-change-in-production"  # TODO: Move to environment variable
@@ -20,6 +25,13 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30 * 24 * 60  # 30 days
 # HTTP Bearer token scheme
 security = HTTPBearer()
 
+# bcrypt takes hundreds of milliseconds per call and releases the GIL,
+# so it runs in a bounded thread pool instead of blocking the event loop
+bcrypt_executor = ThreadPoolExecutor(max_workers=BCRYPT_POOL_SIZE, thread_name_prefix="bcrypt")
+
+# Verified JWT -> User (detached instance), so authenticated requests skip the user query
+principal_cache = TTLCache("auth_principals", maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against a bcrypt hash"""
@@ -36,11 +48,23 @@ def get_password_hash(password: str) -> str:
     """Hash a password using bcrypt"""
     # Generate salt and hash password
     password_bytes = password.encode('utf-8')
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password_bytes, salt)
     return hashed.decode('utf-8')
 
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password in the bcrypt thread pool; use this from async code"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(bcrypt_executor, verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash in the bcrypt thread pool; use this from async code"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(bcrypt_executor, get_password_hash, password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token"""
     to_encode = data.copy()
@@ -53,38 +77,65 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: AsyncSession = Depends(get_db)
-) -> User:
-    """Get current authenticated user from JWT token"""
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+async def user_from_token(token: str) -> User | None:
+    """User of a valid JWT, or None (cached per token for AUTH_CACHE_TTL seconds)"""
+    user = principal_cache.get(token)
+    if user is not None:
+        return user
     
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
+        return None
+    username: str = payload.get("sub")
+    if username is None:
+        return None
     
     # Get user from database
-    result = await db.execute(select(User).where(User.username == username))
-    user = result.scalar_one_or_none()
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(User).where(User.username == username))
+        user = result.scalar_one_or_none()
     
     if user is None:
-        raise credentials_exception
+        return None
     
+    # Never keep a principal past the token expiry
+    ttl = min(AUTH_CACHE_TTL, payload.get("exp", 0) - time.time())
+    if ttl > 0:
+        principal_cache.set(token, user, ttl=ttl)
+    return user
+
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+) -> User:
+    """Get current authenticated user from JWT token (cached per token for AUTH_CACHE_TTL seconds)"""
+    user = await user_from_token(credentials.credentials)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
 
 
+def invalidate_user(username: str) -> int:
+    """Drop cached principals of a user; call whenever a user is changed or removed"""
+    return principal_cache.invalidate_where(lambda token, user: user.username == username)
+
+
 async def get_current_active_user(
     current_user: User = Depends(get_current_user)
 ) -> User:
     """Get current active user (can be extended with is_active check)"""
     return current_user
+
+
+async def get_current_superuser(
+    current_user: User = Depends(get_current_active_user)
+) -> User:
+    """Current user if it is a superuser (admin-only routes)"""
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Superuser required")
+    return current_user
@@ -0,0 +1,57 @@
+"""
+Periodic background tasks started by the FastAPI lifespan
+"""
+import asyncio
+from typing import Awaitable, Callable
+import logging
+
+logger = logging.getLogger(__name__)
+
+_tasks: dict[str, asyncio.Task] = {}
+
+
+async def _run_periodic(name: str, func: Callable[[], Awaitable], interval: float, initial_delay: float) -> None:
+    if initial_delay:
+        await asyncio.sleep(initial_delay)
+    while True:
+        try:
+            await func()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Background task '{name}' failed: {e}", exc_info=True)
+        await asyncio.sleep(interval)
+
+
+def start_periodic(name: str, func: Callable[[], Awaitable], interval: float, initial_delay: float = 0) -> None:
+    """Run `func` every `interval` seconds until stop_all() is called. Disabled when interval <= 0"""
+    if interval <= 0:
+        logger.info(f"Background task '{name}' is disabled")
+        return
+    if name in _tasks and not _tasks[name].done():
+        return
+    _tasks[name] = asyncio.create_task(_run_periodic(name, func, interval, initial_delay), name=name)
+    logger.info(f"Background task '{name}' started (every {interval:g}s)")
+
+
+def run_once(name: str, func: Callable[[], Awaitable]) -> None:
+    """Run `func` once in the background unless a task with the same name is still running"""
+    if name in _tasks and not _tasks[name].done():
+        return
+
+    async def _run() -> None:
+        try:
+            await func()
+        except Exception as e:
+            logger.error(f"Background task '{name}' failed: {e}", exc_info=True)
+
+    _tasks[name] = asyncio.create_task(_run(), name=name)
+
+
+async def stop_all() -> None:
+    """Cancel all periodic tasks and wait for them to finish"""
+    tasks = list(_tasks.values())
+    _tasks.clear()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
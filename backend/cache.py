@@ -0,0 +1,221 @@
+"""
+In-process caches with TTLs and hit/miss counters
+"""
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Every cache registers itself here so stats can be reported in one place
+cache_registry: dict[str, "TTLCache | StaleWhileRevalidateCache"] = {}
+
+_MISSING = object()
+
+
+def cache_key(*parts: Any) -> str:
+    """Stable cache key from endpoint names and JSON-like request bodies"""
+    return json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False, separators=(",", ":"))
+
+
+class TTLCache:
+    """
+    Bounded LRU cache where every entry expires after a TTL.
+
+    Not thread-safe; meant to be used from the event loop only.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 300):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        cache_registry[name] = self
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return a fresh cached value or `default`"""
+        entry = self._entries.get(key, _MISSING)
+        if entry is _MISSING or entry[0] <= time.monotonic():
+            if entry is not _MISSING:
+                del self._entries[key]
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        """Store a value, evicting the least recently used entries over `maxsize`"""
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable = _MISSING) -> int:
+        """Drop one key, or every entry when no key is given. Returns the number of dropped entries"""
+        if key is _MISSING:
+            count = len(self._entries)
+            self._entries.clear()
+            return count
+        return 1 if self._entries.pop(key, _MISSING) is not _MISSING else 0
+
+    def invalidate_where(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        """Drop every entry for which predicate(key, value) is true"""
+        keys = [key for key, (_, value) in self._entries.items() if predicate(key, value)]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+class _Entry:
+    __slots__ = ("value", "fresh_until", "stale_until")
+
+    def __init__(self, value: Any, fresh_until: float, stale_until: float):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+
+class StaleWhileRevalidateCache:
+    """
+    Async read-through cache with per-entity TTLs and stale-while-revalidate.
+
+    Entries are keyed by entity (e.g. REGOS endpoint) plus normalized request params.
+    A fresh entry is returned as is. An expired entry younger than `stale_ttl` is
+    still returned immediately while one background task reloads it. Older or
+    missing entries are loaded inline, with concurrent misses for the same key
+    sharing one load. Cached values are shared: callers must not mutate them.
+    """
+
+    def __init__(self, name: str, ttls: dict[str, float], default_ttl: float = 300, stale_ttl: float = 3600):
+        self.name = name
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+        self.stale_ttl = stale_ttl
+        self._entries: dict[str, _Entry] = {}
+        self._entities: dict[str, str] = {}
+        self._loading: dict[str, tuple[str, asyncio.Task]] = {}  # key -> (entity, load task)
+        self._refresh_tasks: set[asyncio.Task] = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        cache_registry[name] = self
+
+    def _store(self, key: str, entity: str, value: Any) -> None:
+        now = time.monotonic()
+        ttl = self.ttls.get(entity, self.default_ttl)
+        self._entries[key] = _Entry(value, now + ttl, now + ttl + self.stale_ttl)
+        self._entities[key] = entity
+
+    async def _load(self, key: str, entity: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run loader once per key; concurrent callers await the same result.
+
+        The load runs in its own task, so a caller that is cancelled does not
+        cancel it for the others.
+        """
+        loading = self._loading.get(key)
+        if loading is None:
+            task = asyncio.create_task(self._run_load(key, entity, loader))
+            self._loading[key] = (entity, task)
+            task.add_done_callback(lambda done: self._load_done(key, done))
+        else:
+            task = loading[1]
+        return await asyncio.shield(task)
+
+    async def _run_load(self, key: str, entity: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        value = await loader()
+        # invalidate() unregisters in-flight loads: a value loaded before it must not be stored
+        loading = self._loading.get(key)
+        if loading is not None and loading[1] is asyncio.current_task():
+            self._store(key, entity, value)
+        return value
+
+    def _load_done(self, key: str, task: asyncio.Task) -> None:
+        loading = self._loading.get(key)
+        if loading is not None and loading[1] is task:
+            del self._loading[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved in case every caller was cancelled
+            task.exception()
+
+    async def _refresh(self, key: str, entity: str, loader: Callable[[], Awaitable[Any]]) -> None:
+        try:
+            await self._load(key, entity, loader)
+            self.refreshes += 1
+        except Exception as e:
+            self.refresh_errors += 1
+            logger.warning(f"Background refresh of {entity} failed, serving stale data: {e}")
+
+    async def get_or_load(self, entity: str, params: Any, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for entity+params, loading or refreshing it as needed"""
+        key = cache_key(entity, params)
+        entry = self._entries.get(key)
+        now = time.monotonic()
+
+        if entry is not None and now < entry.fresh_until:
+            self.hits += 1
+            return entry.value
+
+        if entry is not None and now < entry.stale_until:
+            self.stale_hits += 1
+            if key not in self._loading:
+                task = asyncio.create_task(self._refresh(key, entity, loader))
+                self._refresh_tasks.add(task)
+                task.add_done_callback(self._refresh_tasks.discard)
+            return entry.value
+
+        self.misses += 1
+        return await self._load(key, entity, loader)
+
+    def invalidate(self, entity: str | None = None) -> int:
+        """Drop all entries of one entity, or everything. Returns the number of dropped entries"""
+        keys = [key for key, key_entity in self._entities.items() if entity is None or key_entity == entity]
+        for key in keys:
+            self._entries.pop(key, None)
+            del self._entities[key]
+        # Loads already in flight still answer their callers but no longer store their result
+        for key in [key for key, (key_entity, _) in self._loading.items() if entity is None or key_entity == entity]:
+            del self._loading[key]
+        return len(keys)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        per_entity: dict[str, int] = {}
+        for entity in self._entities.values():
+            per_entity[entity] = per_entity.get(entity, 0) + 1
+        return {
+            "size": len(self._entries),
+            "entities": per_entity,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "hit_rate": round((self.hits + self.stale_hits) / lookups, 4) if lookups else None,
+        }
+
+
+def all_cache_stats() -> dict:
+    """Stats of every registered cache, keyed by cache name"""
+    return {name: cache.stats() for name, cache in cache_registry.items()}
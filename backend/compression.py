@@ -0,0 +1,244 @@
+"""
+Response compression (brotli when installed and accepted, otherwise gzip) and
+ETag revalidation helpers
+"""
+import gzip
+import hashlib
+import re
+import zlib
+from typing import Any
+import logging
+
+from fastapi import Request, Response
+
+from backend.config import COMPRESSION_MIN_SIZE, COMPRESSION_GZIP_LEVEL, COMPRESSION_BROTLI_QUALITY
+from backend.json_codec import dumps
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml", "image/svg+xml")
+# Streamed to the browser as events arrive; compressing would buffer them
+UNCOMPRESSED_TYPES = ("text/event-stream",)
+
+# A compressed representation gets its own strong ETag: "<hash>-gzip" / "<hash>-br"
+ENCODING_SUFFIXES = {"gzip": "-gzip", "br": "-br"}
+
+
+def accepted_encodings(accept_encoding: str) -> dict[str, float]:
+    """Accept-Encoding as {coding: q}"""
+    encodings = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        match = re.search(r"q=([0-9.]+)", params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        encodings[coding.strip().lower()] = q
+    return encodings
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """Best supported coding the client accepts (brotli first), or None"""
+    encodings = accepted_encodings(accept_encoding)
+    for coding in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if encodings.get(coding, encodings.get("*", 0)) > 0:
+            return coding
+    return None
+
+
+class _Compressor:
+    def __init__(self, coding: str):
+        self.coding = coding
+        if coding == "br":
+            self._compressor = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+        else:
+            # wbits 31: gzip container
+            self._compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.coding == "br":
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        if self.coding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def compress(data: bytes, coding: str) -> bytes:
+    if coding == "br":
+        return brotli.compress(data, quality=COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(data, COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses for clients that accept it.
+
+    Skips responses that already have a Content-Encoding (e.g. Didox listings
+    streamed through as gzip), non-text types, event streams and bodies under
+    COMPRESSION_MIN_SIZE. Streamed bodies are compressed chunk by chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = if_none_match = ""
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+            elif name == b"if-none-match":
+                if_none_match = value.decode("latin-1")
+        coding = choose_encoding(accept_encoding)
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = {name.lower(): value for name, value in message.get("headers", [])}
+                content_type = headers.get(b"content-type", b"").decode("latin-1").lower()
+                passthrough = (
+                    b"content-encoding" in headers
+                    or message["status"] < 200
+                    or message["status"] in (204, 304)
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or content_type.startswith(UNCOMPRESSED_TYPES)
+                )
+                if passthrough:
+                    if message["status"] == 304 and b"etag" in headers:
+                        message = self._revalidated(message, coding, if_none_match)
+                    await send(message)
+                else:
+                    # Wait for the first body chunk to know whether it is worth compressing
+                    start_message = message
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                first, start_message = start_message, None
+                if not more_body and len(body) < COMPRESSION_MIN_SIZE:
+                    passthrough = True
+                    await send(first)
+                    await send(message)
+                    return
+                if not more_body:
+                    body = compress(body, coding)
+                else:
+                    compressor = _Compressor(coding)
+                    body = compressor.compress(body)
+                await send({**first, "headers": self._encoded_headers(first["headers"], coding, None if more_body else len(body))})
+            elif compressor is not None:
+                body = compressor.compress(body)
+                if not more_body:
+                    body += compressor.finish()
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+    @staticmethod
+    def _revalidated(message: dict, coding: str, if_none_match: str) -> dict:
+        """A 304 repeats the ETag the client holds, so the -gzip / -br variant if it sent that one"""
+        headers = []
+        for name, value in message.get("headers", []):
+            if name.lower() == b"etag":
+                suffixed = _suffixed_etag(value.decode("latin-1"), coding)
+                if suffixed in if_none_match:
+                    value = suffixed.encode("latin-1")
+            headers.append((name, value))
+        return {**message, "headers": headers}
+
+    @staticmethod
+    def _encoded_headers(raw_headers, coding: str, length: int | None) -> list[tuple[bytes, bytes]]:
+        headers = []
+        vary = None
+        for name, value in raw_headers:
+            lower = name.lower()
+            if lower == b"content-length":
+                continue
+            if lower == b"vary":
+                vary = value
+                continue
+            if lower == b"etag":
+                value = _suffixed_etag(value.decode("latin-1"), coding).encode("latin-1")
+            headers.append((name, value))
+        headers.append((b"content-encoding", coding.encode("latin-1")))
+        if length is not None:
+            headers.append((b"content-length", str(length).encode("latin-1")))
+        if vary is None:
+            vary = b"Accept-Encoding"
+        elif b"accept-encoding" not in vary.lower():
+            vary += b", Accept-Encoding"
+        headers.append((b"vary", vary))
+        return headers
+
+
+def _suffixed_etag(etag: str, coding: str) -> str:
+    """Strong ETag of the compressed representation"""
+    if etag.startswith("W/") or not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}{ENCODING_SUFFIXES[coding]}"'
+
+
+def payload_etag(body: bytes) -> str:
+    """Strong ETag from a hash of the response body"""
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    If-None-Match check (weak comparison, as RFC 9110 requires for it); accepts
+    the -gzip / -br ETags of the compressed representations too
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip().removeprefix("W/")
+        for suffix in ENCODING_SUFFIXES.values():
+            if candidate.endswith(f'{suffix}"'):
+                candidate = f'{candidate[:-len(suffix) - 1]}"'
+                break
+        if candidate == etag:
+            return True
+    return False
+
+
+def etag_response(request: Request, content: Any) -> Response:
+    """
+    JSON response with a strong ETag; 304 without a body when the client's
+    If-None-Match already has this payload. Cache-Control makes browsers revalidate
+    every time rather than reuse the response unchecked.
+    """
+    body = dumps(content)
+    etag = payload_etag(body)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
@@ -1,27 +1,78 @@
 """
-Database setup and models using SQLAlchemy with aiosqlite
+Database setup and models using SQLAlchemy with aiosqlite (or asyncpg via DATABASE_URL)
 """
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base, sessionmaker
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Index, UniqueConstraint, event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from datetime import datetime
 import os
+import time
 from pathlib import Path
 
+from backend.config import DATABASE_URL as CONFIGURED_DATABASE_URL
+from backend.config import DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, SQLITE_BUSY_TIMEOUT_MS
+from backend.metrics import db_query_duration_seconds, register_collector
+
 # Base class for models
 Base = declarative_base()
 
 # Database path
 DB_PATH = Path(__file__).parent.parent / "database.db"
-DATABASE_URL = f"sqlite+aiosqlite:///{DB_PATH}"
+DATABASE_URL = CONFIGURED_DATABASE_URL or f"sqlite+aiosqlite:///{DB_PATH}"
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
 
-# Create async engine
+# Create async engine (aiosqlite defaults to NullPool; a queue pool keeps connections and their pragmas)
 engine = create_async_engine(
     DATABASE_URL,
     echo=False,
-    future=True
+    future=True,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_pre_ping=not IS_SQLITE,
 )
 
+
+if IS_SQLITE:
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """WAL lets readers run alongside a writer; busy_timeout makes writers wait instead of failing"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the execution context: a statement that raises never reaches after_cursor_execute,
+    # so nothing is left behind on the pooled connection
+    context._query_started = time.perf_counter()
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _observe_query_time(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_query_started", None)
+    if started is None:
+        return
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    db_query_duration_seconds.observe(time.perf_counter() - started, operation=operation)
+
+
+@register_collector
+def _pool_metrics():
+    """Connection pool usage for /metrics"""
+    pool = engine.pool
+    return [
+        ("db_pool_size", "gauge", "Configured connection pool size", [({}, pool.size())]),
+        ("db_pool_checked_out", "gauge", "Connections currently in use", [({}, pool.checkedout())]),
+        ("db_pool_overflow", "gauge", "Connections open beyond the pool size", [({}, max(0, pool.overflow()))]),
+    ]
+
+
 # Create async session factory
 AsyncSessionLocal = async_sessionmaker(
     engine,
@@ -62,6 +113,118 @@ class Token(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
 
+class SyncState(Base):
+    """Key/value state of background syncs (watermarks, last run times)"""
+    __tablename__ = "sync_state"
+    
+    key = Column(String, primary_key=True)
+    value = Column(Text, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
+class RegosPartner(Base):
+    """Local index of REGOS partners (Partner/Get) keyed by TIN/PINFL"""
+    __tablename__ = "regos_partners"
+    
+    id = Column(Integer, primary_key=True)  # REGOS partner id
+    tin = Column(String, nullable=True, index=True)
+    pinfl = Column(String, nullable=True, index=True)
+    name = Column(String, nullable=True)
+    fullname = Column(String, nullable=True)
+    deleted_mark = Column(Boolean, default=False, nullable=False)
+    content_hash = Column(String, nullable=False)  # sha256 of the REGOS payload, skips unchanged rows on sync
+    payload = Column(Text, nullable=False)  # Raw REGOS partner JSON
+    synced_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
+class RegosItem(Base):
+    """Local mirror of the REGOS item catalog (Item/Get) used to answer Item/Match locally"""
+    __tablename__ = "regos_items"
+    
+    id = Column(Integer, primary_key=True)  # REGOS item id
+    code = Column(String, nullable=True, index=True)
+    articul = Column(String, nullable=True, index=True)
+    icps = Column(String, nullable=True, index=True)
+    name = Column(String, nullable=True, index=True)
+    group_id = Column(Integer, nullable=True)
+    deleted_mark = Column(Boolean, default=False, nullable=False)
+    content_hash = Column(String, nullable=False)  # sha256 of the REGOS payload, skips unchanged rows on sync
+    payload = Column(Text, nullable=False)  # Raw REGOS item JSON
+    synced_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
+class RegosItemBarcode(Base):
+    """Barcodes of mirrored REGOS items (an item may have several)"""
+    __tablename__ = "regos_item_barcodes"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    item_id = Column(Integer, nullable=False, index=True)
+    barcode = Column(String, nullable=False, index=True)
+
+
+class DidoxDocument(Base):
+    """Local mirror of a user's Didox document list, kept fresh by updated_unix"""
+    __tablename__ = "didox_documents"
+    __table_args__ = (
+        UniqueConstraint("user_id", "owner", "doc_id", name="uq_didox_documents_user_owner_doc"),
+        # Keyset pagination: newest first within one user's incoming/outgoing list
+        Index("ix_didox_documents_listing", "user_id", "owner", "created_unix", "doc_id"),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, nullable=False)
+    owner = Column(Integer, nullable=False)  # 1 = outgoing, 0 = incoming
+    doc_id = Column(String, nullable=False, index=True)
+    doctype = Column(String, nullable=True)
+    doc_status = Column(Integer, nullable=True)
+    doc_date = Column(String, nullable=True)  # YYYY-MM-DD
+    created_date = Column(String, nullable=True)  # YYYY-MM-DD, filtered by date_from/date_to like Didox
+    created_unix = Column(Integer, nullable=False, default=0)
+    updated_unix = Column(Integer, nullable=False, default=0)
+    partner_tin = Column(String, nullable=True, index=True)
+    partner_company = Column(String, nullable=True)
+    payload = Column(Text, nullable=False)  # Raw Didox list row JSON
+    synced_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
+class DidoxDocumentDetail(Base):
+    """Persistent cache of Didox document detail payloads (partner API documents/{doc_id})"""
+    __tablename__ = "didox_document_details"
+    __table_args__ = (
+        UniqueConstraint("user_id", "doc_id", name="uq_didox_document_details_user_doc"),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, nullable=False)
+    doc_id = Column(String, nullable=False, index=True)
+    content_hash = Column(String, nullable=False)  # sha256 of the payload
+    doc_status = Column(Integer, nullable=True)
+    expires_at = Column(DateTime, nullable=True)  # None for final documents: kept until invalidated or evicted
+    size = Column(Integer, nullable=False)  # Payload size in bytes, counted against DIDOX_DETAIL_CACHE_MAX_MB
+    payload = Column(Text, nullable=False)  # Raw Didox detail JSON
+    fetched_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    accessed_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)  # LRU eviction order
+
+
+class ImportJob(Base):
+    """Background import job with per-stage progress"""
+    __tablename__ = "import_jobs"
+    
+    id = Column(String, primary_key=True)  # uuid4 hex
+    user_id = Column(Integer, nullable=False, index=True)
+    kind = Column(String, nullable=False)  # Handler name, e.g. "import_document"
+    status = Column(String, nullable=False, default="queued", index=True)  # queued, running, succeeded, failed
+    stage = Column(String, nullable=True)  # Pipeline stage currently running
+    progress = Column(Text, nullable=False, default="{}")  # JSON: stage -> "running" | "done" plus counters
+    params = Column(Text, nullable=False)  # JSON job input
+    result = Column(Text, nullable=True)  # JSON job output
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
 async def init_db():
     """Initialize database - create tables"""
     async with engine.begin() as conn:
@@ -69,7 +232,7 @@ async def init_db():
 
 
 async def get_db():
-    """Dependency to get database session"""
+    """Dependency to get database session (committed at the end of the request)"""
     async with AsyncSessionLocal() as session:
         try:
             yield session
@@ -79,3 +242,9 @@ async def get_db():
             raise
         finally:
             await session.close()
+
+
+async def get_read_db():
+    """Dependency for read-only requests: no transaction is committed at the end"""
+    async with AsyncSessionLocal() as session:
+        yield session
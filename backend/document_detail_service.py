@@ -0,0 +1,225 @@
+"""
+Service for the persistent Didox document detail cache
+"""
+import hashlib
+from datetime import datetime, timedelta
+import logging
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete, func
+from sqlalchemy.exc import IntegrityError
+
+from backend.cache import cache_registry
+from backend.config import (
+    PARTNER_TOKEN,
+    DIDOX_PARTNER_BASE_URL,
+    DIDOX_FINAL_STATUSES,
+    DIDOX_DETAIL_CACHE_TTL,
+    DIDOX_DETAIL_CACHE_MAX_MB,
+)
+from backend.database import AsyncSessionLocal, DidoxDocumentDetail
+from backend.json_codec import dumps_str as json_dumps, loads as json_loads
+from backend.upstream import SingleFlight
+from didox.api import didox_async_api_request
+
+logger = logging.getLogger(__name__)
+
+# Hits only refresh accessed_at when it is older than this, so reads rarely write
+ACCESS_TOUCH_INTERVAL = timedelta(seconds=60)
+
+
+async def fetch_document_detail(user_key: str, doc_id: str) -> dict:
+    """Get full document detail (with productlist) from the Didox partner API"""
+    return await didox_async_api_request(
+        endpoint=f"documents/{doc_id}",
+        request_data=None,
+        user_key=user_key,
+        partner_auth=PARTNER_TOKEN,
+        base_url=DIDOX_PARTNER_BASE_URL,
+        method="GET"
+    )
+
+
+def document_status(detail: dict) -> int | None:
+    """doc_status of a Didox document detail payload"""
+    document = (detail.get("data") or {}).get("document") or {}
+    status = document.get("doc_status", document.get("status"))
+    return int(status) if isinstance(status, (int, str)) and str(status).isdigit() else None
+
+
+class DocumentDetailCache:
+    """
+    Database-backed cache of document details per user.
+
+    Documents in a final status (DIDOX_FINAL_STATUSES) never change and are kept
+    until the document mirror reports a change or LRU eviction removes them;
+    other documents are reused for DIDOX_DETAIL_CACHE_TTL seconds. The total
+    payload size is capped at DIDOX_DETAIL_CACHE_MAX_MB.
+
+    Rows are keyed by (user_id, doc_id): the content hash is only known after
+    fetching, so it detects unchanged refetches rather than addressing rows.
+    """
+
+    def __init__(self, name: str = "didox_document_details"):
+        self.name = name
+        self.max_bytes = int(DIDOX_DETAIL_CACHE_MAX_MB * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.unchanged_refetches = 0
+        self.evictions = 0
+        # Running payload size of the table, None until summed
+        self._total_bytes: int | None = None
+        # Not an upstream: kept out of upstream_status and its metrics, reported in stats() instead
+        self._flight = SingleFlight(name, register=False)
+        cache_registry[name] = self
+
+    async def get(self, user_id: int, user_key: str, doc_id: str) -> dict:
+        """Return the document detail from the cache, fetching it from Didox when missing or expired"""
+        async with AsyncSessionLocal() as db:
+            row = await self._select(db, user_id, doc_id)
+            now = datetime.utcnow()
+
+            if row is not None and (row.expires_at is None or row.expires_at > now):
+                self.hits += 1
+                if now - row.accessed_at >= ACCESS_TOUCH_INTERVAL:
+                    row.accessed_at = now
+                    await db.commit()
+                return json_loads(row.payload)
+
+            self.misses += 1
+
+        # Concurrent misses on one document (opened twice, parallel imports) share a single fetch and write
+        return await self._flight.do(f"{user_id}:{doc_id}", lambda: self._fetch(user_id, user_key, doc_id))
+
+    @staticmethod
+    async def _select(db: AsyncSession, user_id: int, doc_id: str) -> DidoxDocumentDetail | None:
+        return (await db.execute(
+            select(DidoxDocumentDetail).where(
+                DidoxDocumentDetail.user_id == user_id,
+                DidoxDocumentDetail.doc_id == doc_id,
+            )
+        )).scalar_one_or_none()
+
+    async def _fetch(self, user_id: int, user_key: str, doc_id: str) -> dict:
+        # Fetch outside the session so no transaction stays open during the Didox round trip
+        detail = await fetch_document_detail(user_key, doc_id)
+        await self._store(user_id, doc_id, detail, datetime.utcnow())
+        return detail
+
+    async def _store(self, user_id: int, doc_id: str, detail: dict, now: datetime) -> None:
+        payload = json_dumps(detail)
+        content_hash = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        size = len(payload.encode("utf-8"))
+        status = document_status(detail)
+        expires_at = None if status in DIDOX_FINAL_STATUSES else now + timedelta(seconds=DIDOX_DETAIL_CACHE_TTL)
+
+        async with AsyncSessionLocal() as db:
+            row = await self._select(db, user_id, doc_id)
+            if row is None:
+                db.add(DidoxDocumentDetail(
+                    user_id=user_id,
+                    doc_id=doc_id,
+                    content_hash=content_hash,
+                    payload=payload,
+                    size=size,
+                    fetched_at=now,
+                    doc_status=status,
+                    expires_at=expires_at,
+                    accessed_at=now,
+                ))
+                try:
+                    await db.commit()
+                    self._add_bytes(size)
+                except IntegrityError:
+                    # Stored meanwhile by another worker process: update its row instead
+                    await db.rollback()
+                    row = await self._select(db, user_id, doc_id)
+            if row is not None:
+                if row.content_hash == content_hash:
+                    self.unchanged_refetches += 1
+                else:
+                    self._add_bytes(size - row.size)
+                    row.content_hash = content_hash
+                    row.payload = payload
+                    row.size = size
+                    row.fetched_at = now
+                row.doc_status = status
+                row.expires_at = expires_at
+                row.accessed_at = now
+                await db.commit()
+            await self._evict(db)
+
+    def _add_bytes(self, delta: int) -> None:
+        if self._total_bytes is not None:
+            self._total_bytes += delta
+
+    async def _evict(self, db: AsyncSession) -> None:
+        """Delete least recently used details until the cache is back under 90% of its size cap"""
+        if self._total_bytes is None:
+            # Summed once at startup and after invalidations; stores keep the running total
+            self._total_bytes = (await db.execute(
+                select(func.coalesce(func.sum(DidoxDocumentDetail.size), 0))
+            )).scalar_one()
+        if self._total_bytes <= self.max_bytes:
+            return
+        # Other worker processes write to the same table, so recount before deleting anything
+        total = (await db.execute(select(func.coalesce(func.sum(DidoxDocumentDetail.size), 0)))).scalar_one()
+        self._total_bytes = total
+        if total <= self.max_bytes:
+            return
+        target = total - int(self.max_bytes * 0.9)
+        victims = []
+        freed = 0
+        result = await db.execute(
+            select(DidoxDocumentDetail.id, DidoxDocumentDetail.size).order_by(DidoxDocumentDetail.accessed_at)
+        )
+        for row_id, size in result:
+            victims.append(row_id)
+            freed += size
+            if freed >= target:
+                break
+        for i in range(0, len(victims), 500):
+            await db.execute(delete(DidoxDocumentDetail).where(DidoxDocumentDetail.id.in_(victims[i:i + 500])))
+        await db.commit()
+        self._total_bytes -= freed
+        self.evictions += len(victims)
+        logger.info(f"Evicted {len(victims)} cached document details ({freed} bytes)")
+
+    async def invalidate(self, user_id: int | None = None, doc_ids: list[str] | None = None) -> int:
+        """Drop cached details of the given documents (all documents when doc_ids is None)"""
+        query = delete(DidoxDocumentDetail)
+        self._total_bytes = None
+        if user_id is not None:
+            query = query.where(DidoxDocumentDetail.user_id == user_id)
+        if doc_ids is None:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(query)
+                await db.commit()
+                return result.rowcount
+        dropped = 0
+        async with AsyncSessionLocal() as db:
+            for i in range(0, len(doc_ids), 500):
+                result = await db.execute(query.where(DidoxDocumentDetail.doc_id.in_(doc_ids[i:i + 500])))
+                dropped += result.rowcount
+            await db.commit()
+        return dropped
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "unchanged_refetches": self.unchanged_refetches,
+            "evictions": self.evictions,
+            "coalesced_fetches": self._flight.saved,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+document_detail_cache = DocumentDetailCache()
+
+
+async def get_document_detail(user_id: int, user_key: str, doc_id: str) -> dict:
+    """Document detail for a user, served from the persistent cache when possible"""
+    return await document_detail_cache.get(user_id, user_key, doc_id)
@@ -0,0 +1,413 @@
+"""
+Service for the local Didox document mirror: a periodic re-list of recently created
+documents that writes only rows whose updated_unix or status moved, plus a daily full re-scan
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+import logging
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete, func, and_, or_
+
+from backend.config import (
+    PARTNER_TOKEN,
+    DIDOX_DOCUMENT_SYNC_PAGE_SIZE,
+    DIDOX_DOCUMENT_SYNC_LOOKBACK_DAYS,
+    DIDOX_DOCUMENT_FULL_SYNC_INTERVAL,
+)
+from backend.database import AsyncSessionLocal, DidoxDocument, SyncState, Token
+from backend.document_detail_service import document_detail_cache
+from backend.json_codec import dumps_str as json_dumps, loads as json_loads
+from didox.api import didox_async_api_request
+
+logger = logging.getLogger(__name__)
+
+OWNERS = (1, 0)  # Outgoing, incoming
+
+# One sync per user at a time (background loop, manual trigger and first-visit sync share it)
+_user_locks: dict[int, asyncio.Lock] = {}
+
+
+def _watermark_key(user_id: int, owner: int) -> str:
+    return f"didox_documents.{user_id}.{owner}.watermark"
+
+
+def _full_sync_key(user_id: int) -> str:
+    return f"didox_documents.{user_id}.last_full_sync"
+
+
+def _company_key(user_id: int) -> str:
+    return f"didox_documents.{user_id}.tax_id"
+
+
+def _int(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _document_fields(document: dict) -> dict:
+    return {
+        "doctype": document.get("doctype"),
+        "doc_status": document.get("doc_status"),
+        "doc_date": document.get("doc_date"),
+        "created_date": document.get("created"),
+        "created_unix": _int(document.get("created_unix")),
+        "updated_unix": _int(document.get("updated_unix")),
+        "partner_tin": document.get("partnerTin"),
+        "partner_company": document.get("partnerCompany"),
+        "payload": json_dumps(document),
+    }
+
+
+async def upsert_documents(db: AsyncSession, user_id: int, owner: int, documents: list[dict]) -> list[str]:
+    """
+    Insert new documents and update those whose updated_unix moved.
+
+    Returns:
+        list: doc_ids that were inserted or changed
+    """
+    documents = [document for document in documents if document.get("doc_id")]
+    if not documents:
+        return []
+    result = await db.execute(
+        select(DidoxDocument).where(
+            DidoxDocument.user_id == user_id,
+            DidoxDocument.owner == owner,
+            DidoxDocument.doc_id.in_([document["doc_id"] for document in documents]),
+        )
+    )
+    existing = {row.doc_id: row for row in result.scalars()}
+
+    changed = []
+    for document in documents:
+        fields = _document_fields(document)
+        row = existing.get(document["doc_id"])
+        if row is None:
+            row = DidoxDocument(user_id=user_id, owner=owner, doc_id=document["doc_id"], **fields)
+            db.add(row)
+            existing[row.doc_id] = row
+        elif row.updated_unix != fields["updated_unix"] or row.doc_status != fields["doc_status"]:
+            for key, value in fields.items():
+                setattr(row, key, value)
+        else:
+            continue
+        changed.append(document["doc_id"])
+    await db.flush()
+    return changed
+
+
+async def _get_state(db: AsyncSession, key: str) -> str | None:
+    state = await db.get(SyncState, key)
+    return state.value if state else None
+
+
+async def _set_state(db: AsyncSession, key: str, value: str) -> None:
+    state = await db.get(SyncState, key)
+    if state is None:
+        state = SyncState(key=key)
+        db.add(state)
+    state.value = value
+
+
+async def _sync_owner(
+    db: AsyncSession,
+    user_id: int,
+    user_key: str,
+    owner: int,
+    full: bool,
+    page_size: int,
+) -> dict:
+    """Sync one user's outgoing or incoming list; returns counters for the summary"""
+    watermark_key = _watermark_key(user_id, owner)
+    watermark = await _get_state(db, watermark_key)
+    watermark = int(watermark) if watermark else None
+
+    params = {"owner": owner, "limit": page_size}
+    if not full and watermark is not None:
+        # The list can only be filtered by creation date, so re-list a window of recently
+        # created documents; older documents that change are picked up by the full re-scan
+        since = datetime.utcfromtimestamp(watermark) - timedelta(days=DIDOX_DOCUMENT_SYNC_LOOKBACK_DAYS)
+        params["dateFromCreated"] = since.strftime("%Y-%m-%d")
+
+    fetched = 0
+    changed: list[str] = []
+    seen: set[str] = set()
+    newest = watermark or 0
+    total = None
+    page = 1
+    while True:
+        response = await didox_async_api_request(
+            endpoint="documents",
+            request_data={**params, "page": page},
+            user_key=user_key,
+            partner_auth=PARTNER_TOKEN,
+            method="GET"
+        )
+        documents = response.get("data") or []
+        total = response.get("total", total)
+        if not documents:
+            break
+
+        fetched += len(documents)
+        seen.update(document["doc_id"] for document in documents if document.get("doc_id"))
+        newest = max([newest, *(_int(document.get("updated_unix")) for document in documents)])
+        changed += await upsert_documents(db, user_id, owner, documents)
+        await db.commit()
+
+        # Didox may cap the page below page_size, so a short page does not mean the list ended
+        if total is not None and len(seen) >= total:
+            break
+        page += 1
+
+    stale: list[str] = []
+    if full and (total is None or len(seen) >= total):
+        # Documents no longer listed by Didox (deleted drafts) are dropped on a full pass,
+        # but only when the pass saw the whole list
+        existing = set((await db.execute(
+            select(DidoxDocument.doc_id).where(DidoxDocument.user_id == user_id, DidoxDocument.owner == owner)
+        )).scalars())
+        stale = list(existing - seen)
+        for i in range(0, len(stale), 500):
+            await db.execute(
+                delete(DidoxDocument).where(
+                    DidoxDocument.user_id == user_id,
+                    DidoxDocument.owner == owner,
+                    DidoxDocument.doc_id.in_(stale[i:i + 500]),
+                )
+            )
+
+    await _set_state(db, watermark_key, str(newest))
+    await db.commit()
+    return {"fetched": fetched, "changed": changed, "removed": stale}
+
+
+async def sync_user_documents(
+    user_id: int,
+    user_key: str,
+    full: bool | None = None,
+    page_size: int = DIDOX_DOCUMENT_SYNC_PAGE_SIZE,
+) -> dict:
+    """
+    Bring one user's local document mirror up to date.
+
+    The Didox list can only be filtered by creation date, so an incremental pass
+    re-lists every document of both lists created in the DIDOX_DOCUMENT_SYNC_LOOKBACK_DAYS
+    days before the newest updated_unix seen so far; only rows whose updated_unix or
+    status moved are written. Older documents that change are picked up by the full
+    pass over both lists, which runs on the first sync and every
+    DIDOX_DOCUMENT_FULL_SYNC_INTERVAL seconds.
+
+    Args:
+        user_id: Local user id the documents belong to
+        user_key: Didox user_key of that user
+        full: Force (True) or skip (False) a full pass; None decides by the full sync interval
+
+    Returns:
+        dict: {"full", "fetched", "changed", "removed", "changed_doc_ids", "elapsed_seconds"}
+    """
+    lock = _user_locks.setdefault(user_id, asyncio.Lock())
+    async with lock:
+        started = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            last_full = await _get_state(db, _full_sync_key(user_id))
+            if full is None:
+                full = last_full is None or time.time() - float(last_full) >= DIDOX_DOCUMENT_FULL_SYNC_INTERVAL
+
+            fetched = 0
+            changed: list[str] = []
+            removed: list[str] = []
+            for owner in OWNERS:
+                result = await _sync_owner(db, user_id, user_key, owner, full, page_size)
+                fetched += result["fetched"]
+                removed += result["removed"]
+                changed += result["changed"]
+
+            if full:
+                await _set_state(db, _full_sync_key(user_id), str(time.time()))
+                await db.commit()
+
+        # Cached details of documents that changed or disappeared in Didox are stale now
+        if changed or removed:
+            await document_detail_cache.invalidate(user_id, changed + removed)
+
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"Didox document mirror for user {user_id} synced ({'full' if full else 'incremental'}): "
+            f"{fetched} fetched, {len(changed)} changed, {len(removed)} removed in {elapsed:.2f}s"
+        )
+        return {
+            "full": full,
+            "fetched": fetched,
+            "changed": len(changed),
+            "removed": len(removed),
+            "changed_doc_ids": changed,
+            "elapsed_seconds": round(elapsed, 3),
+        }
+
+
+async def sync_documents() -> dict:
+    """Sync the document mirror of every user with a stored Didox token"""
+    async with AsyncSessionLocal() as db:
+        tokens = (await db.execute(select(Token.user_id, Token.user_key))).all()
+
+    results = {}
+    for user_id, user_key in tokens:
+        try:
+            result = await sync_user_documents(user_id, user_key)
+            results[user_id] = {key: value for key, value in result.items() if key != "changed_doc_ids"}
+        except Exception as e:
+            # An expired Didox token of one user must not stop the others
+            logger.warning(f"Didox document sync for user {user_id} failed: {e}")
+            results[user_id] = {"error": str(e)}
+    return results
+
+
+async def bind_user_company(user_id: int, tax_id: str) -> bool:
+    """
+    Record the Didox company (TIN) whose documents a user's mirror holds.
+
+    When the user logs into another company, the mirrored documents, watermarks and
+    cached details still belong to the previous one, so they are dropped and the
+    next sync starts from scratch.
+
+    Returns:
+        bool: True if the user's mirror was reset
+    """
+    tax_id = tax_id.strip()
+    # Wait for a running sync of the user, which still lists the previous company
+    async with _user_locks.setdefault(user_id, asyncio.Lock()):
+        async with AsyncSessionLocal() as db:
+            previous = await _get_state(db, _company_key(user_id))
+            if previous == tax_id:
+                return False
+            await db.execute(delete(DidoxDocument).where(DidoxDocument.user_id == user_id))
+            await db.execute(delete(SyncState).where(SyncState.key.in_(
+                [_watermark_key(user_id, owner) for owner in OWNERS] + [_full_sync_key(user_id)]
+            )))
+            await _set_state(db, _company_key(user_id), tax_id)
+            await db.commit()
+        await document_detail_cache.invalidate(user_id)
+
+    logger.info(f"Didox company of user {user_id} changed ({previous} -> {tax_id}); document mirror reset")
+    return True
+
+
+async def is_mirrored(db: AsyncSession, user_id: int, owner: int) -> bool:
+    """True once the user's list for this owner has been synced at least once"""
+    return await _get_state(db, _watermark_key(user_id, owner)) is not None
+
+
+def encode_cursor(row: DidoxDocument) -> str:
+    return f"{row.created_unix}:{row.doc_id}"
+
+
+def decode_cursor(cursor: str) -> tuple[int, str]:
+    """Parse a "created_unix:doc_id" cursor returned as next_cursor"""
+    created_unix, _, doc_id = cursor.partition(":")
+    if not created_unix.isdigit() or not doc_id:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return int(created_unix), doc_id
+
+
+def _document_filters(
+    user_id: int,
+    owner: int,
+    document_type: str | None = None,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    partner: str | None = None,
+    status: int | None = None,
+) -> list:
+    filters = [DidoxDocument.user_id == user_id, DidoxDocument.owner == owner]
+    if document_type:
+        filters.append(DidoxDocument.doctype == document_type)
+    if date_from:
+        filters.append(DidoxDocument.created_date >= date_from)
+    if date_to:
+        filters.append(DidoxDocument.created_date <= date_to)
+    if partner:
+        filters.append(or_(
+            DidoxDocument.partner_tin == partner,
+            DidoxDocument.partner_company.ilike(f"%{partner}%"),
+        ))
+    if status is not None:
+        filters.append(DidoxDocument.doc_status == status)
+    return filters
+
+
+async def list_documents(
+    db: AsyncSession,
+    user_id: int,
+    owner: int = 1,
+    limit: int = 20,
+    cursor: str | None = None,
+    page: int = 1,
+    document_type: str | None = None,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    partner: str | None = None,
+    status: int | None = None,
+) -> dict:
+    """
+    List mirrored documents newest first, in the shape of the Didox list response.
+
+    Uses keyset pagination when `cursor` (the previous page's next_cursor) is given,
+    page/limit offsets otherwise.
+
+    Returns:
+        dict: {"data", "total", "next_cursor", "source": "local"}
+
+    Raises:
+        ValueError: If limit is below 1 or the cursor is malformed
+    """
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    filters = _document_filters(user_id, owner, document_type, date_from, date_to, partner, status)
+    total = (await db.execute(select(func.count()).select_from(DidoxDocument).where(*filters))).scalar_one()
+
+    query = (
+        select(DidoxDocument)
+        .where(*filters)
+        .order_by(DidoxDocument.created_unix.desc(), DidoxDocument.doc_id.desc())
+        .limit(limit)
+    )
+    if cursor:
+        created_unix, doc_id = decode_cursor(cursor)
+        query = query.where(or_(
+            DidoxDocument.created_unix < created_unix,
+            and_(DidoxDocument.created_unix == created_unix, DidoxDocument.doc_id < doc_id),
+        ))
+    else:
+        query = query.offset((max(page, 1) - 1) * limit)
+
+    rows = list((await db.execute(query)).scalars())
+    return {
+        "data": [json_loads(row.payload) for row in rows],
+        "total": total,
+        "next_cursor": encode_cursor(rows[-1]) if len(rows) == limit else None,
+        "source": "local",
+    }
+
+
+async def find_document_ids(
+    db: AsyncSession,
+    user_id: int,
+    owner: int = 1,
+    document_type: str | None = None,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    partner: str | None = None,
+    status: int | None = None,
+    limit: int = 1000,
+) -> list[str]:
+    """doc_ids of mirrored documents matching the list filters, newest first"""
+    result = await db.execute(
+        select(DidoxDocument.doc_id)
+        .where(*_document_filters(user_id, owner, document_type, date_from, date_to, partner, status))
+        .order_by(DidoxDocument.created_unix.desc(), DidoxDocument.doc_id.desc())
+        .limit(limit)
+    )
+    return list(result.scalars())
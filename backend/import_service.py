@@ -0,0 +1,617 @@
+"""
+Service for importing Didox documents into REGOS server-side
+"""
+import asyncio
+import time
+from decimal import Decimal, InvalidOperation
+from typing import Any, Awaitable
+import logging
+
+from fastapi import HTTPException
+
+from backend.config import REGOS_IMPORT_CONCURRENCY, IMPORT_BULK_CONCURRENCY
+from backend.database import AsyncSessionLocal
+from backend.partner_service import lookup_partners
+from backend.item_catalog_service import match_products_local, record_new_items
+from backend.document_detail_service import get_document_detail
+from backend.token_service import get_token
+from backend.job_service import job_queue, error_message, ProgressReporter
+from backend.metrics import import_stage_duration_seconds
+from regos.match import cascade_match_products
+from regos.item import add_item
+from regos.docpurchase import add_doc_purchase
+from regos.purchaseoperation import add_purchase_operation
+
+logger = logging.getLogger(__name__)
+
+# REGOS API expects vat_calculation_type in English: "No", "Exclude", "Include"
+VAT_RU_TO_EN = {"Не начислять": "No", "В сумме": "Exclude", "Сверху": "Include"}
+
+
+def regos_new_id(response: dict) -> int | None:
+    """Extract the id of a created entity from a REGOS */Add response"""
+    if response.get("new_id") is not None:
+        return response["new_id"]
+    result = response.get("result")
+    if isinstance(result, int):
+        return result
+    if isinstance(result, dict):
+        return result.get("new_id")
+    return None
+
+
+def _decimal(value: Any, default: Decimal = Decimal(0)) -> Decimal:
+    try:
+        return Decimal(str(value)) if value not in (None, "") else default
+    except (InvalidOperation, ValueError):
+        return default
+
+
+def document_products(detail: dict) -> list[dict]:
+    """Return the product rows of a Didox document detail payload"""
+    data = detail.get("data") or {}
+    productlist = (data.get("json") or {}).get("productlist") or {}
+    return productlist.get("products") or []
+
+
+def document_seller_tin(detail: dict) -> str | None:
+    """TIN of the seller, i.e. the REGOS partner a purchase is received from"""
+    document_json = (detail.get("data") or {}).get("json") or {}
+    return document_json.get("sellertin") or (document_json.get("seller") or {}).get("tin")
+
+
+async def resolve_partner_id(detail: dict, settings: dict) -> int:
+    """Partner from the settings, or the indexed REGOS partner with the seller's TIN"""
+    if settings.get("partner_id"):
+        return settings["partner_id"]
+    tin = document_seller_tin(detail)
+    if not tin:
+        raise HTTPException(status_code=400, detail="partner_id is required: the document has no seller TIN")
+    async with AsyncSessionLocal() as db:
+        partner = (await lookup_partners(db, [tin]))[tin]
+    if partner is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"No REGOS partner with TIN {tin}. Create the partner or pass partner_id"
+        )
+    return partner["id"]
+
+
+def build_match_rows(products: list[dict], overrides: dict[int, dict]) -> list[dict]:
+    """
+    Build cascade match rows for document products.
+
+    User supplied keys (REGOS code, barcode, articul) take precedence;
+    the barcode and name printed on the document are used otherwise. Unlike
+    the old browser flow, which only matched products the user had keyed in,
+    a product without user keys can therefore still be matched (by its
+    barcode, or by name when "Name" is among the strategies) and imported
+    with create_if_not_matched off.
+    """
+    rows = []
+    for index, product in enumerate(products):
+        keys = overrides.get(index, {})
+        rows.append({
+            "index": str(index),
+            "code": keys.get("code"),
+            "barcode": keys.get("barcode") or product.get("barcode") or None,
+            "articul": keys.get("articul"),
+            "name": product.get("name"),
+        })
+    return rows
+
+
+def build_item_data(product: dict, keys: dict, settings: dict) -> dict:
+    """Item/Add body for a document product that has no REGOS item yet"""
+    item_data = {
+        "name": product.get("name") or "Новый товар",
+        "package_code": product.get("packagecode") or "",
+        "group_id": settings.get("item_group_id") or 1,
+        "vat_id": settings.get("vat_id") or 1,
+        "unit_id": settings.get("unit_id") or 1,
+    }
+    code = keys.get("code")
+    if code is not None and str(code).isdigit():
+        item_data["code"] = int(code)
+    # Use barcode as articul if provided
+    if keys.get("barcode"):
+        item_data["articul"] = keys["barcode"]
+    if product.get("catalogcode"):
+        item_data["icps"] = product["catalogcode"]
+    if settings.get("partner_id"):
+        item_data["partner_id"] = settings["partner_id"]
+    return item_data
+
+
+def build_operation(document_id: int, item_id: int, product: dict) -> dict:
+    """PurchaseOperation/Add row for a document product"""
+    count = _decimal(product.get("count"), Decimal(1))
+    quantity = count if count > 0 else Decimal(1)
+    delivery_sum = _decimal(product.get("deliverysum"))
+    delivery_sum_with_vat = _decimal(product.get("deliverysumwithvat"), delivery_sum) or delivery_sum
+    return {
+        "document_id": document_id,
+        "item_id": item_id,
+        "quantity": str(quantity),
+        "cost": str(delivery_sum / quantity),
+        "price": str(delivery_sum_with_vat / quantity),
+        "vat_value": str(_decimal(product.get("vatrate"))),
+    }
+
+
+def build_doc_purchase_data(settings: dict, detail: dict) -> dict:
+    """DocPurchase/Add body from import settings"""
+    doc_purchase_data = {
+        "date": settings.get("date") or int(time.time()),
+        "partner_id": settings["partner_id"],
+        "stock_id": settings["stock_id"],
+        "currency_id": settings["currency_id"],
+        "attached_user_id": settings.get("attached_user_id") or 1,
+    }
+    vat_calculation_type = settings.get("vat_calculation_type")
+    if vat_calculation_type:
+        doc_purchase_data["vat_calculation_type"] = VAT_RU_TO_EN.get(vat_calculation_type, vat_calculation_type)
+    if settings.get("price_type_id") is not None:
+        doc_purchase_data["price_type_id"] = settings["price_type_id"]
+    if settings.get("exchange_rate") is not None:
+        doc_purchase_data["exchange_rate"] = str(settings["exchange_rate"])
+    document = (detail.get("data") or {}).get("document") or {}
+    description = settings.get("description") or (f"Didox: {document['name']}" if document.get("name") else None)
+    if description:
+        doc_purchase_data["description"] = description
+    return doc_purchase_data
+
+
+async def match_items(products: list[dict], overrides: dict[int, dict], settings: dict) -> dict[int, dict]:
+    """
+    Match document products to REGOS items with one batched cascade
+    (local item mirror first, REGOS Item/Match for misses).
+
+    Returns:
+        dict: product index -> {"item_id", "source"} where source is the match type
+    """
+    rows = [
+        row for row in build_match_rows(products, overrides)
+        if any(row.get(key) for key in ("code", "barcode", "articul", "name"))
+    ]
+    strategies = settings.get("match_strategies") or ["Code", "Barcode"]
+    match_result = await cascade_match_products(rows, strategies, matcher=match_products_local)
+    return {
+        int(row["index"]): {"item_id": row["item_id"], "source": row["match_type"]}
+        for row in match_result["result"]
+    }
+
+
+def missing_item_indexes(products: list[dict], matched: dict[int, dict], settings: dict) -> list[int]:
+    """Indexes of unmatched products that should be created in REGOS"""
+    if not settings.get("create_if_not_matched"):
+        return []
+    return [
+        index for index, product in enumerate(products)
+        if index not in matched and product.get("name")
+    ]
+
+
+async def create_items(
+    products: list[dict],
+    indexes: list[int],
+    overrides: dict[int, dict],
+    settings: dict,
+    failed: dict[int, str] | None = None,
+) -> dict[int, dict]:
+    """
+    Create REGOS items for the given products concurrently (bounded by REGOS_IMPORT_CONCURRENCY).
+
+    A failing Item/Add does not cancel the others: every item REGOS created is
+    written through to the local mirror before the first failure is raised, so
+    the next import matches it instead of creating it again. When `failed` is
+    given, failures are collected there (product index -> error) instead.
+
+    Returns:
+        dict: product index -> {"item_id", "source": "created"}
+    """
+    semaphore = asyncio.Semaphore(REGOS_IMPORT_CONCURRENCY)
+    created: dict[int, dict] = {}
+    new_items: dict[int, dict] = {}
+    errors: dict[int, Exception] = {}
+
+    async def create(index: int) -> None:
+        item_data = build_item_data(products[index], overrides.get(index, {}), settings)
+        try:
+            async with semaphore:
+                response = await add_item(item_data)
+        except Exception as e:
+            errors[index] = e
+            return
+        new_id = regos_new_id(response)
+        if new_id:
+            created[index] = {"item_id": new_id, "source": "created"}
+            new_items[new_id] = item_data
+
+    await asyncio.gather(*(create(index) for index in indexes))
+
+    # Write created items through to the local mirror so the next import matches them locally
+    if new_items:
+        await record_new_items(new_items)
+    if errors:
+        logger.warning(f"{len(errors)} of {len(indexes)} items could not be created in REGOS")
+        if failed is None:
+            raise errors[min(errors)]
+        failed.update({index: error_message(error) for index, error in errors.items()})
+    return created
+
+
+async def match_items_guarded(
+    products: list[dict],
+    settings: dict,
+    failed: dict[int, str],
+) -> dict[int, dict]:
+    """
+    match_items for products shared by several documents.
+
+    When the batched cascade fails, every product is matched on its own, so a
+    failing Item/Match only marks the products it was for (collected into
+    `failed`, product index -> error) rather than failing all of them.
+    """
+    try:
+        return await match_items(products, {}, settings)
+    except Exception as e:
+        logger.warning(f"Batched match of {len(products)} products failed ({e}); matching them one by one")
+
+    semaphore = asyncio.Semaphore(REGOS_IMPORT_CONCURRENCY)
+    matched: dict[int, dict] = {}
+
+    async def match(index: int) -> None:
+        try:
+            async with semaphore:
+                result = await match_items([products[index]], {}, settings)
+        except Exception as e:
+            failed[index] = error_message(e)
+            return
+        if 0 in result:
+            matched[index] = result[0]
+
+    await asyncio.gather(*(match(index) for index in range(len(products))))
+    return matched
+
+
+# Import pipeline stages as reported to background jobs
+IMPORT_STAGES = ("fetch", "match", "create_items", "create_doc_purchase", "add_operations")
+# Stages that write to REGOS: an import interrupted after one of them is not re-run automatically
+IMPORT_WRITE_STAGES = ("create_items", "create_doc_purchase", "add_operations")
+
+
+async def _no_progress(stage: str, state: str = "running", **details: Any) -> None:
+    pass
+
+
+async def _staged(report: ProgressReporter, stage: str, awaitable: Awaitable, **details: Any) -> Any:
+    """Await a pipeline step, reporting its stage as running and then done"""
+    await report(stage, "running", **details)
+    started = time.perf_counter()
+    result = await awaitable
+    import_stage_duration_seconds.observe(time.perf_counter() - started, stage=stage)
+    await report(stage, "done")
+    return result
+
+
+async def import_document(
+    user_id: int,
+    user_key: str,
+    doc_id: str,
+    settings: dict,
+    progress: ProgressReporter | None = None,
+) -> dict:
+    """
+    Import a Didox document into REGOS as a purchase document with operations.
+
+    Pipeline: fetch detail (persistent detail cache) → batched cascade match →
+    create missing items → create the DocPurchase → one PurchaseOperation/Add
+    with all rows.
+
+    Args:
+        user_id: Current user id (owner of the cached document detail)
+        user_key: Didox user_key of the current user
+        doc_id: Didox document id
+        settings: Import settings:
+            - stock_id, currency_id (required)
+            - partner_id (default: indexed REGOS partner with the seller's TIN)
+            - attached_user_id, price_type_id, vat_calculation_type, exchange_rate,
+              date, description (optional DocPurchase fields)
+            - item_group_id, vat_id, unit_id, create_if_not_matched (item creation)
+            - match_strategies (cascade order, default Code → Barcode)
+            - products: list of {"index", "code", "barcode", "articul"} key overrides;
+              products without them are matched by the document's barcode/name
+              (see build_match_rows)
+        progress: Optional async report(stage, state, **details) callback (see IMPORT_STAGES)
+
+    Returns:
+        dict: Import summary with the new DocPurchase id and per-product outcome
+
+    Raises:
+        HTTPException: If the document has nothing to import or an upstream call fails
+    """
+    started = time.perf_counter()
+    report = progress or _no_progress
+    overrides = {int(row["index"]): row for row in settings.get("products") or []}
+
+    detail = await _staged(report, "fetch", get_document_detail(user_id, user_key, doc_id))
+    products = document_products(detail)
+    if not products:
+        raise HTTPException(status_code=400, detail="Document has no products to import")
+
+    settings = {**settings, "partner_id": await resolve_partner_id(detail, settings)}
+    matched = await _staged(report, "match", match_items(products, overrides, settings), products=len(products))
+    missing = missing_item_indexes(products, matched, settings)
+    if not matched and not missing:
+        raise HTTPException(
+            status_code=400,
+            detail="No products could be matched or created in REGOS"
+        )
+
+    # Items first: if creating them fails, no purchase document is left behind in REGOS
+    created = await _staged(
+        report, "create_items", create_items(products, missing, overrides, settings),
+        matched=len(matched), to_create=len(missing),
+    )
+    resolved = {**matched, **created}
+    if not resolved:
+        raise HTTPException(status_code=502, detail="REGOS did not return ids for the created items")
+
+    doc_purchase = await _staged(
+        report, "create_doc_purchase", add_doc_purchase(build_doc_purchase_data(settings, detail))
+    )
+    document_id = regos_new_id(doc_purchase)
+    if document_id is None:
+        raise HTTPException(status_code=502, detail="REGOS did not return the new purchase document id")
+
+    operations = [
+        build_operation(document_id, resolved[index]["item_id"], products[index])
+        for index in sorted(resolved)
+    ]
+    operations_result = await _staged(
+        report, "add_operations", add_purchase_operation(operations), operations=len(operations)
+    )
+    operations_info = operations_result.get("result")
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"Imported Didox document {doc_id} into REGOS DocPurchase {document_id}: "
+        f"{len(operations)}/{len(products)} products in {elapsed:.2f}s"
+    )
+    return {
+        "ok": True,
+        "doc_id": doc_id,
+        "doc_purchase_id": document_id,
+        "operations": len(operations),
+        "operation_ids": operations_info.get("ids", []) if isinstance(operations_info, dict) else [],
+        "products": [
+            {
+                "index": index,
+                "name": product.get("name"),
+                "item_id": resolved.get(index, {}).get("item_id"),
+                "source": resolved.get(index, {}).get("source"),
+            }
+            for index, product in enumerate(products)
+        ],
+        "elapsed_seconds": round(elapsed, 3),
+    }
+
+
+def product_key(product: dict) -> tuple:
+    """Identity of a document product across documents (same barcode, name and catalog code)"""
+    return (
+        str(product.get("barcode") or "").strip(),
+        str(product.get("name") or "").strip().lower(),
+        str(product.get("catalogcode") or "").strip(),
+    )
+
+
+async def resolve_partner_ids(details: dict[str, dict], settings: dict) -> dict[str, int | str]:
+    """
+    Partner per document with one partner index lookup for all seller TINs.
+
+    Returns:
+        dict: doc_id -> REGOS partner id, or an error message if it cannot be resolved
+    """
+    if settings.get("partner_id"):
+        return {doc_id: settings["partner_id"] for doc_id in details}
+    tins = {doc_id: document_seller_tin(detail) for doc_id, detail in details.items()}
+    async with AsyncSessionLocal() as db:
+        partners = await lookup_partners(db, list({tin for tin in tins.values() if tin}))
+    resolved: dict[str, int | str] = {}
+    for doc_id, tin in tins.items():
+        if not tin:
+            resolved[doc_id] = "partner_id is required: the document has no seller TIN"
+        elif partners.get(tin) is None:
+            resolved[doc_id] = f"No REGOS partner with TIN {tin}. Create the partner or pass partner_id"
+        else:
+            resolved[doc_id] = partners[tin]["id"]
+    return resolved
+
+
+async def import_documents_bulk(
+    user_id: int,
+    user_key: str,
+    doc_ids: list[str],
+    settings: dict,
+    progress: ProgressReporter | None = None,
+) -> dict:
+    """
+    Import many Didox documents into REGOS, sharing work between them.
+
+    Details are fetched concurrently, partners are resolved with one index lookup,
+    products that repeat across documents are matched and created once, then the
+    DocPurchase documents with their operations are written with at most
+    IMPORT_BULK_CONCURRENCY documents in flight. A failing document does not
+    stop the others: a product that cannot be matched or created only fails
+    the documents that contain it.
+
+    Args:
+        user_id: Current user id (owner of the cached document details)
+        user_key: Didox user_key of the current user
+        doc_ids: Didox document ids
+        settings: Import settings shared by all documents (see import_document; no per-product overrides)
+        progress: Optional async report(stage, state, **details) callback
+
+    Returns:
+        dict: Per-document results and aggregate counts and throughput
+    """
+    started = time.perf_counter()
+    report = progress or _no_progress
+    semaphore = asyncio.Semaphore(IMPORT_BULK_CONCURRENCY)
+    doc_ids = list(dict.fromkeys(doc_ids))
+    results: dict[str, dict] = {doc_id: {"doc_id": doc_id, "ok": False} for doc_id in doc_ids}
+
+    # 1. Fetch all details (persistent detail cache first)
+    details: dict[str, dict] = {}
+
+    async def fetch(doc_id: str) -> None:
+        async with semaphore:
+            try:
+                details[doc_id] = await get_document_detail(user_id, user_key, doc_id)
+            except Exception as e:
+                results[doc_id]["error"] = error_message(e)
+
+    await report("fetch", "running", documents=len(doc_ids))
+    stage_started = time.perf_counter()
+    await asyncio.gather(*(fetch(doc_id) for doc_id in doc_ids))
+    import_stage_duration_seconds.observe(time.perf_counter() - stage_started, stage="fetch")
+    await report("fetch", "done", fetched=len(details))
+
+    # 2. Partners and products shared by all documents
+    partner_ids = await resolve_partner_ids(details, settings)
+    documents: dict[str, list[dict]] = {}
+    for doc_id, detail in details.items():
+        if isinstance(partner_ids[doc_id], str):
+            results[doc_id]["error"] = partner_ids[doc_id]
+        elif not document_products(detail):
+            results[doc_id]["error"] = "Document has no products to import"
+        else:
+            documents[doc_id] = document_products(detail)
+
+    unique_products: list[dict] = []
+    unique_index: dict[tuple, int] = {}
+    product_refs: dict[str, list[int]] = {}
+    for doc_id, products in documents.items():
+        refs = []
+        for product in products:
+            key = product_key(product)
+            if key not in unique_index:
+                unique_index[key] = len(unique_products)
+                unique_products.append(product)
+            refs.append(unique_index[key])
+        product_refs[doc_id] = refs
+
+    # Unique product index -> error; only the documents containing a failed product fail
+    failed_products: dict[int, str] = {}
+    matched = await _staged(
+        report, "match", match_items_guarded(unique_products, settings, failed_products),
+        products=sum(len(products) for products in documents.values()), unique_products=len(unique_products),
+    )
+    # A product whose match failed may exist in REGOS already, so it is not created
+    missing = [
+        index for index in missing_item_indexes(unique_products, matched, settings)
+        if index not in failed_products
+    ]
+    # Shared items are not tied to the partner of one document
+    item_settings = {**settings, "partner_id": None}
+    created = await _staged(
+        report, "create_items", create_items(unique_products, missing, {}, item_settings, failed=failed_products),
+        matched=len(matched), to_create=len(missing),
+    )
+    resolved_items = {**matched, **created}
+
+    # 3. One DocPurchase with its operations per document, bounded in parallel
+    written = 0
+
+    async def write(doc_id: str) -> None:
+        nonlocal written
+        products = documents[doc_id]
+        refs = product_refs[doc_id]
+        failed_ref = next((ref for ref in refs if ref in failed_products), None)
+        if failed_ref is not None:
+            name = unique_products[failed_ref].get("name") or f"#{refs.index(failed_ref) + 1}"
+            results[doc_id]["error"] = f"Product {name}: {failed_products[failed_ref]}"
+            return
+        resolved = {index: resolved_items[ref] for index, ref in enumerate(refs) if ref in resolved_items}
+        if not resolved:
+            results[doc_id]["error"] = "No products could be matched or created in REGOS"
+            return
+        doc_settings = {**settings, "partner_id": partner_ids[doc_id]}
+        try:
+            async with semaphore:
+                doc_purchase = await add_doc_purchase(build_doc_purchase_data(doc_settings, details[doc_id]))
+                document_id = regos_new_id(doc_purchase)
+                if document_id is None:
+                    raise HTTPException(status_code=502, detail="REGOS did not return the new purchase document id")
+                results[doc_id]["doc_purchase_id"] = document_id
+                operations = [
+                    build_operation(document_id, resolved[index]["item_id"], products[index])
+                    for index in sorted(resolved)
+                ]
+                await add_purchase_operation(operations)
+        except Exception as e:
+            results[doc_id]["error"] = error_message(e)
+            return
+        results[doc_id].update({
+            "ok": True,
+            "operations": len(operations),
+            "products": len(products),
+            "unresolved": len(products) - len(resolved),
+        })
+        written += 1
+        await report("create_documents", "running", written=written)
+
+    await report("create_documents", "running", written=0, documents=len(documents))
+    stage_started = time.perf_counter()
+    await asyncio.gather(*(write(doc_id) for doc_id in documents))
+    import_stage_duration_seconds.observe(time.perf_counter() - stage_started, stage="create_documents")
+    await report("create_documents", "done", written=written)
+
+    elapsed = time.perf_counter() - started
+    succeeded = [result for result in results.values() if result["ok"]]
+    operations_total = sum(result["operations"] for result in succeeded)
+    logger.info(
+        f"Bulk imported {len(succeeded)}/{len(doc_ids)} Didox documents into REGOS "
+        f"({operations_total} operations, {len(unique_products)} unique products) in {elapsed:.2f}s"
+    )
+    return {
+        "ok": len(succeeded) == len(doc_ids),
+        "documents": len(doc_ids),
+        "succeeded": len(succeeded),
+        "failed": len(doc_ids) - len(succeeded),
+        "operations": operations_total,
+        "unique_products": len(unique_products),
+        "matched_products": len(matched),
+        "created_items": len(created),
+        "failed_products": len(failed_products),
+        "elapsed_seconds": round(elapsed, 3),
+        "documents_per_second": round(len(succeeded) / elapsed, 2) if elapsed else None,
+        "operations_per_second": round(operations_total / elapsed, 2) if elapsed else None,
+        "results": [results[doc_id] for doc_id in doc_ids],
+    }
+
+
+async def run_import_document_job(job: dict, report: ProgressReporter) -> dict:
+    """Job handler for "import_document": params {"doc_id", "settings"}"""
+    async with AsyncSessionLocal() as db:
+        user_key = await get_token(db, job["user_id"])
+    if not user_key:
+        raise ValueError("No Didox token found. Please login to Didox first using /api/auth/didox-login")
+    params = job["params"]
+    return await import_document(job["user_id"], user_key, params["doc_id"], params["settings"], progress=report)
+
+
+async def run_import_bulk_job(job: dict, report: ProgressReporter) -> dict:
+    """Job handler for "import_bulk": params {"doc_ids", "settings"}"""
+    async with AsyncSessionLocal() as db:
+        user_key = await get_token(db, job["user_id"])
+    if not user_key:
+        raise ValueError("No Didox token found. Please login to Didox first using /api/auth/didox-login")
+    params = job["params"]
+    return await import_documents_bulk(job["user_id"], user_key, params["doc_ids"], params["settings"], progress=report)
+
+
+job_queue.register("import_document", run_import_document_job, side_effect_stages=IMPORT_WRITE_STAGES)
+job_queue.register("import_bulk", run_import_bulk_job, side_effect_stages=("create_items", "create_documents"))
@@ -0,0 +1,157 @@
+"""
+Service for the local REGOS item catalog mirror
+"""
+import hashlib
+import json
+import logging
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete
+
+from backend.config import REGOS_ITEM_SYNC_PAGE_SIZE
+from backend.database import AsyncSessionLocal, RegosItem, RegosItemBarcode
+from backend.regos_sync import sync_list, write_through
+from regos.item import get_items
+from regos.match import MatchType, match_products_bulk
+
+logger = logging.getLogger(__name__)
+
+ITEM_SYNC_STATE_KEY = "regos_items.last_sync"
+
+
+def _text(value) -> str | None:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def item_barcodes(item: dict) -> list[str]:
+    """Barcodes of a REGOS item: Item/Get returns them in barcode_list, separated by commas"""
+    barcodes = []
+    for value in str(item.get("barcode_list") or "").split(","):
+        value = _text(value)
+        if value and value not in barcodes:
+            barcodes.append(value)
+    return barcodes
+
+
+def _item_fields(item: dict) -> dict:
+    payload = json.dumps(item, sort_keys=True, ensure_ascii=False, default=str)
+    group = item.get("group")
+    group_id = item.get("group_id") or (group.get("id") if isinstance(group, dict) else None)
+    return {
+        "code": _text(item.get("code")),
+        "articul": _text(item.get("articul")),
+        "icps": _text(item.get("icps")),
+        "name": _text(item.get("name")),
+        "group_id": group_id,
+        "deleted_mark": bool(item.get("deleted_mark")),
+        "content_hash": hashlib.sha256(payload.encode("utf-8")).hexdigest(),
+        "payload": payload,
+    }
+
+
+async def upsert_items(db: AsyncSession, items: list[dict]) -> int:
+    """Insert new items and update changed ones with their barcodes. Returns the number of written rows"""
+    items = [item for item in items if item.get("id") is not None]
+    if not items:
+        return 0
+    ids = [int(item["id"]) for item in items]
+    result = await db.execute(select(RegosItem).where(RegosItem.id.in_(ids)))
+    existing = {row.id: row for row in result.scalars()}
+
+    changed_ids = []
+    barcodes = []
+    for item in items:
+        item_id = int(item["id"])
+        fields = _item_fields(item)
+        row = existing.get(item_id)
+        if row is None:
+            db.add(RegosItem(id=item_id, **fields))
+        elif row.content_hash != fields["content_hash"]:
+            for key, value in fields.items():
+                setattr(row, key, value)
+        else:
+            continue
+        changed_ids.append(item_id)
+        barcodes.extend(RegosItemBarcode(item_id=item_id, barcode=barcode) for barcode in item_barcodes(item))
+
+    if changed_ids:
+        await db.execute(delete(RegosItemBarcode).where(RegosItemBarcode.item_id.in_(changed_ids)))
+        db.add_all(barcodes)
+    await db.flush()
+    return len(changed_ids)
+
+
+async def record_new_items(items: dict[int, dict]) -> None:
+    """Write items created via Item/Add (new id -> Item/Add body) into the mirror right away (best effort)"""
+    await write_through(
+        upsert_items, [{**item_data, "id": item_id} for item_id, item_data in items.items()], "REGOS items"
+    )
+
+
+async def sync_items(page_size: int = REGOS_ITEM_SYNC_PAGE_SIZE) -> dict:
+    """
+    Page through REGOS Item/Get and bring the local catalog mirror up to date (see regos_sync.sync_list).
+
+    Returns:
+        dict: {"fetched", "written", "removed", "complete", "elapsed_seconds"}
+    """
+    return await sync_list(
+        "items", get_items, upsert_items, RegosItem, ITEM_SYNC_STATE_KEY, page_size,
+        dependents=(RegosItemBarcode.item_id,),
+    )
+
+
+async def find_local_matches(db: AsyncSession, match_type: MatchType, values: list[str]) -> dict[str, int]:
+    """Map match values to mirrored, non-deleted item ids (lowest id wins on duplicates)"""
+    values = list({value for value in values if value})
+    if not values:
+        return {}
+    if match_type == "Barcode":
+        column = RegosItemBarcode.barcode
+        query = select(column, RegosItem.id).join(RegosItem, RegosItem.id == RegosItemBarcode.item_id)
+    else:
+        column = {"Code": RegosItem.code, "Articul": RegosItem.articul, "Name": RegosItem.name}[match_type]
+        query = select(column, RegosItem.id)
+    query = query.where(RegosItem.deleted_mark.is_(False)).order_by(RegosItem.id.desc())
+
+    matches: dict[str, int] = {}
+    for i in range(0, len(values), 500):
+        result = await db.execute(query.where(column.in_(values[i:i + 500])))
+        # Rows come highest id first, so the lowest id is written last and wins
+        for value, item_id in result.all():
+            matches[value] = item_id
+    return matches
+
+
+async def match_products_local(match_type: MatchType, products: list[dict]) -> dict:
+    """
+    Match products against the local item mirror, asking REGOS only for misses.
+
+    Same arguments and result shape as regos.match.match_products_bulk, so it can
+    be used as the `matcher` of regos.match.cascade_match_products.
+    """
+    values = [str(product["value"]).strip() for product in products]
+    async with AsyncSessionLocal() as db:
+        local = await find_local_matches(db, match_type, values)
+
+    rows: dict[str, dict] = {}
+    misses = []
+    for product, value in zip(products, values):
+        if value in local:
+            rows[str(product["index"])] = {"index": str(product["index"]), "item_id": local[value], "value": product["value"]}
+        else:
+            misses.append(product)
+
+    if misses:
+        response = await match_products_bulk(match_type, misses)
+        for row in response.get("result") or []:
+            rows[str(row.get("index"))] = row
+
+    logger.info(f"Item/Match {match_type}: {len(products) - len(misses)} local hits, {len(misses)} sent to REGOS")
+    return {
+        "ok": True,
+        "result": [rows[str(product["index"])] for product in products if str(product["index"]) in rows],
+    }
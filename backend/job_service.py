@@ -0,0 +1,261 @@
+"""
+Persistent background job queue with per-stage progress and live subscribers
+"""
+import asyncio
+import json
+import uuid
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable
+import logging
+
+from fastapi import HTTPException
+from sqlalchemy import select, update
+
+from backend.config import IMPORT_JOB_WORKERS
+from backend.database import AsyncSessionLocal, ImportJob
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+# report(stage, state, **details): called by handlers as the pipeline moves on
+ProgressReporter = Callable[..., Awaitable[None]]
+JobHandler = Callable[[dict, ProgressReporter], Awaitable[dict]]
+
+
+def job_snapshot(job: ImportJob) -> dict:
+    """Public view of a job row"""
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "stage": job.stage,
+        "progress": json.loads(job.progress or "{}"),
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def error_message(error: Exception) -> str:
+    """Readable message of a failed step (HTTPException detail or the exception text)"""
+    if isinstance(error, HTTPException):
+        return str(error.detail)
+    return str(error) or error.__class__.__name__
+
+
+class JobQueue:
+    """
+    Jobs are rows in import_jobs; an in-process asyncio.Queue feeds their ids to
+    a fixed pool of worker tasks. Every progress report is written to the row and
+    pushed to subscribers (the SSE endpoint).
+
+    On startup queued jobs are queued again. Jobs that were running when the
+    process stopped are queued again only if they had not reached a stage with
+    side effects (see `register`); otherwise they fail so nothing is written twice.
+    """
+
+    def __init__(self, workers: int = IMPORT_JOB_WORKERS):
+        self.workers = workers
+        self._handlers: dict[str, tuple[JobHandler, tuple[str, ...]]] = {}
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._subscribers: dict[str, set[asyncio.Queue]] = {}
+
+    def register(self, kind: str, handler: JobHandler, side_effect_stages: tuple[str, ...] = ()) -> None:
+        """
+        Register the handler for a job kind.
+
+        Args:
+            kind: Job kind stored with each job
+            handler: async handler(job_snapshot, report) returning the JSON result
+            side_effect_stages: Stages after whose start a job must not be re-run automatically
+        """
+        self._handlers[kind] = (handler, side_effect_stages)
+
+    async def start(self) -> None:
+        """Start the workers and pick up jobs left over from the previous run"""
+        self._queue = asyncio.Queue()
+        requeued = await self._recover()
+        for job_id in requeued:
+            self._queue.put_nowait(job_id)
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"import_job_worker_{n}")
+            for n in range(self.workers)
+        ]
+        logger.info(f"Job queue started with {self.workers} workers ({len(requeued)} jobs resumed)")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _recover(self) -> list[str]:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(ImportJob).where(ImportJob.status.in_(("queued", "running"))).order_by(ImportJob.created_at)
+            )
+            requeued = []
+            for job in result.scalars():
+                if job.status == "running":
+                    _, side_effect_stages = self._handlers.get(job.kind, (None, ()))
+                    stages = json.loads(job.progress or "{}").get("stages", {})
+                    if any(stage in stages for stage in side_effect_stages):
+                        job.status = "failed"
+                        job.error = (
+                            f"Interrupted by a restart during '{job.stage}'. "
+                            "Check REGOS for partially imported data before retrying"
+                        )
+                        job.finished_at = datetime.utcnow()
+                        continue
+                    job.status = "queued"
+                requeued.append(job.id)
+            await db.commit()
+        return requeued
+
+    async def enqueue(self, user_id: int, kind: str, params: dict) -> dict:
+        """Store a new job and hand it to the workers. Returns the job snapshot"""
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if self._queue is None:
+            raise RuntimeError("Job queue is not running")
+        job = ImportJob(
+            id=uuid.uuid4().hex,
+            user_id=user_id,
+            kind=kind,
+            status="queued",
+            progress="{}",
+            params=json.dumps(params, ensure_ascii=False, default=str),
+        )
+        async with AsyncSessionLocal() as db:
+            db.add(job)
+            await db.commit()
+        self._queue.put_nowait(job.id)
+        return job_snapshot(job)
+
+    async def get(self, job_id: str, user_id: int | None = None) -> dict | None:
+        """Job snapshot, or None if it does not exist (or belongs to another user)"""
+        async with AsyncSessionLocal() as db:
+            job = await db.get(ImportJob, job_id)
+        if job is None or (user_id is not None and job.user_id != user_id):
+            return None
+        return job_snapshot(job)
+
+    async def list(self, user_id: int, limit: int = 50) -> list[dict]:
+        """Most recent jobs of a user"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(ImportJob)
+                .where(ImportJob.user_id == user_id)
+                .order_by(ImportJob.created_at.desc())
+                .limit(limit)
+            )
+            return [job_snapshot(job) for job in result.scalars()]
+
+    async def events(self, job_id: str, heartbeat: float = 15) -> AsyncIterator[dict | None]:
+        """
+        Yield the job snapshot now and after every change until the job finishes.
+        Yields None every `heartbeat` seconds without changes (for keep-alives).
+        """
+        subscriber: asyncio.Queue = asyncio.Queue()
+        # Subscribe before reading the snapshot so no update falls in between
+        self._subscribers.setdefault(job_id, set()).add(subscriber)
+        try:
+            snapshot = await self.get(job_id)
+            if snapshot is None:
+                return
+            yield snapshot
+            while snapshot["status"] not in TERMINAL_STATUSES:
+                try:
+                    snapshot = await asyncio.wait_for(subscriber.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                yield snapshot
+        finally:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[job_id]
+
+    def _publish(self, snapshot: dict) -> None:
+        for subscriber in self._subscribers.get(snapshot["id"], ()):
+            subscriber.put_nowait(snapshot)
+
+    async def _update(self, job_id: str, **fields: Any) -> dict:
+        async with AsyncSessionLocal() as db:
+            job = await db.get(ImportJob, job_id)
+            for key, value in fields.items():
+                setattr(job, key, value)
+            await db.commit()
+            snapshot = job_snapshot(job)
+        self._publish(snapshot)
+        return snapshot
+
+    async def _claim(self, job_id: str) -> ImportJob | None:
+        """Mark a queued job running; None if another worker or node got it first"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(ImportJob)
+                .where(ImportJob.id == job_id, ImportJob.status == "queued")
+                .values(status="running", started_at=datetime.utcnow(), error=None)
+            )
+            await db.commit()
+            if result.rowcount != 1:
+                return None
+            job = await db.get(ImportJob, job_id)
+        self._publish(job_snapshot(job))
+        return job
+
+    async def _run(self, job_id: str) -> None:
+        row = await self._claim(job_id)
+        if row is None:
+            return
+        job = {**job_snapshot(row), "user_id": row.user_id, "params": json.loads(row.params)}
+        handler, _ = self._handlers[row.kind]
+        progress = job["progress"]
+        progress.setdefault("stages", {})
+        # Handlers may report from concurrent steps; keep the writes in order
+        lock = asyncio.Lock()
+
+        async def report(stage: str, state: str = "running", **details: Any) -> None:
+            async with lock:
+                progress["stages"][stage] = state
+                if details:
+                    progress.setdefault("details", {}).update(details)
+                await self._update(job_id, stage=stage, progress=json.dumps(progress, ensure_ascii=False, default=str))
+
+        try:
+            result = await handler(job, report)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Job {job_id} ({row.kind}) failed: {error_message(e)}")
+            await self._update(job_id, status="failed", error=error_message(e), finished_at=datetime.utcnow())
+            return
+        await self._update(
+            job_id,
+            status="succeeded",
+            stage="done",
+            result=json.dumps(result, ensure_ascii=False, default=str),
+            finished_at=datetime.utcnow(),
+        )
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job worker failed on job {job_id}: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+
+job_queue = JobQueue()
@@ -0,0 +1,48 @@
+"""
+Fast JSON encoding/decoding (orjson) for upstream request bodies and responses,
+cached payloads and API responses
+"""
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(value: Any) -> Any:
+    """Types orjson does not serialize natively"""
+    if isinstance(value, Decimal):
+        # Same as model_dump(mode="json"): keeps the exact digits REGOS expects
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {value.__class__.__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    """Compact UTF-8 JSON; Decimal as string, datetime as ISO 8601"""
+    return orjson.dumps(value, default=_default, option=OPTIONS)
+
+
+def dumps_str(value: Any) -> str:
+    """dumps() as text, for JSON stored in the database"""
+    return dumps(value).decode("utf-8")
+
+
+def loads(data: bytes | bytearray | memoryview | str) -> Any:
+    return orjson.loads(data)
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with orjson.
+
+    As the default response class of a router it only replaces the final
+    encoding step; return it directly (ORJSONResponse(payload)) to also skip
+    FastAPI's jsonable_encoder pass over large upstream payloads.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -11,9 +11,20 @@ sys.path.append(str(Path(__file__).parent.parent))
 from backend.database import init_db
 from backend.user_service import ensure_superuser_exists
 from backend.database import AsyncSessionLocal
+from regos.api import regos_client
+from didox.api import didox_client
+from backend import background
+from backend.config import REGOS_PARTNER_SYNC_INTERVAL, REGOS_ITEM_SYNC_INTERVAL, DIDOX_DOCUMENT_SYNC_INTERVAL
+from backend.partner_service import sync_partners
+from backend.item_catalog_service import sync_items
+from backend.document_service import sync_documents
+from backend.job_service import job_queue
+from backend.metrics import MetricsMiddleware
+from backend.profiling import ProfilingMiddleware
+from backend.compression import CompressionMiddleware
 
 # Import routes
-from backend.routes import auth, didox, regos
+from backend.routes import auth, didox, regos, imports, status
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -23,7 +34,7 @@ logger = logging.getLogger(__name__)
 # Startup event
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Initialize database and create superuser on startup"""
+    """Initialize database, create superuser and open upstream connection pools on startup"""
     logger.info("Initializing database...")
     await init_db()
     
@@ -45,9 +56,27 @@ async def lifespan(app: FastAPI):
             logger.error(f"✗ Error creating superuser: {e}", exc_info=True)
             raise
     
+    # Shared pooled HTTP clients for all REGOS and Didox calls
+    await regos_client.open()
+    await didox_client.open()
+    
+    # Keep the local REGOS partner index, item mirror and Didox document mirror fresh
+    background.start_periodic("regos_partner_sync", sync_partners, REGOS_PARTNER_SYNC_INTERVAL)
+    background.start_periodic("regos_item_sync", sync_items, REGOS_ITEM_SYNC_INTERVAL)
+    background.start_periodic("didox_document_sync", sync_documents, DIDOX_DOCUMENT_SYNC_INTERVAL)
+    
+    # Workers for background import jobs (resumes jobs left over from the last run)
+    await job_queue.start()
+    
     logger.info("Application startup complete")
-    yield
-    logger.info("Application shutdown")
+    try:
+        yield
+    finally:
+        await job_queue.stop()
+        await background.stop_all()
+        await regos_client.close()
+        await didox_client.close()
+        logger.info("Application shutdown")
 
 
 app = FastAPI(
@@ -56,6 +85,15 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# gzip/brotli for clients that accept it (innermost, so timings include compression)
+app.add_middleware(CompressionMiddleware)
+
+# Opt-in profiling of single requests by superusers (X-Profile header or ?profile=1)
+app.add_middleware(ProfilingMiddleware)
+
+# Request latency and status per route for /metrics
+app.add_middleware(MetricsMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -63,6 +101,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],  # Read by the frontend to revalidate POST /api/regos/get-* lists
 )
 
 
@@ -75,6 +114,9 @@ async def root():
 app.include_router(auth.router)
 app.include_router(didox.router)
 app.include_router(regos.router)
+app.include_router(imports.router)
+app.include_router(status.router)
+app.include_router(status.metrics_router)
     
 
 if __name__ == "__main__":
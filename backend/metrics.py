@@ -0,0 +1,230 @@
+"""
+Minimal Prometheus-style metrics: counters, gauges and histograms rendered in
+the text exposition format, plus the request timing middleware
+"""
+import bisect
+import time
+from typing import Callable, Iterable
+import logging
+
+from backend.cache import all_cache_stats
+
+logger = logging.getLogger(__name__)
+
+# Every metric registers itself here in creation order; collectors add values computed at scrape time
+metrics_registry: dict[str, "_Metric"] = {}
+# collector() -> [(name, type, help, [(labels, value), ...]), ...]
+Collector = Callable[[], Iterable[tuple[str, str, str, list[tuple[dict, float]]]]]
+collectors: list[Collector] = []
+
+# Latency buckets in seconds; upstream buckets reach the 30 s REGOS / 60 s Didox timeouts
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+UPSTREAM_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple, object] = {}
+        metrics_registry[name] = self
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _samples(self) -> list[tuple[str, dict, float]]:
+        return [(self.name, dict(zip(self.labelnames, key)), value) for key, value in self._values.items()]
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self._samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        series = self._values.get(key)
+        if series is None:
+            # Per-bucket counts (the last one is +Inf), sum, count
+            series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def _samples(self) -> list[tuple[str, dict, float]]:
+        samples = []
+        for key, (counts, total, count) in self._values.items():
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+def register_collector(collector: Collector) -> Collector:
+    """Add a function reporting values that are read at scrape time (pool sizes, cache counters)"""
+    collectors.append(collector)
+    return collector
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in metrics_registry.values():
+        lines += metric.render()
+    for collector in collectors:
+        try:
+            families = list(collector())
+        except Exception as e:
+            logger.warning(f"Metrics collector {collector.__name__} failed: {e}")
+            continue
+        for name, kind, documentation, samples in families:
+            lines += [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples]
+    return "\n".join(lines) + "\n"
+
+
+# HTTP
+http_requests_total = Counter(
+    "http_requests_total", "HTTP requests by route template and status", ("method", "route", "status")
+)
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds", "HTTP request latency until the response is fully sent", ("method", "route")
+)
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests being handled")
+http_requests_in_flight.set(0)
+
+# Upstreams (one sample per attempt, so retries are visible)
+upstream_request_duration_seconds = Histogram(
+    "upstream_request_duration_seconds",
+    "REGOS / Didox request latency per endpoint",
+    ("upstream", "endpoint"),
+    UPSTREAM_BUCKETS,
+)
+upstream_errors_total = Counter(
+    "upstream_errors_total", "Failed REGOS / Didox requests per endpoint and returned status", ("upstream", "endpoint", "status")
+)
+upstream_requests_in_flight = Gauge(
+    "upstream_requests_in_flight", "REGOS / Didox requests waiting for a response", ("upstream", "endpoint")
+)
+
+# Database
+db_query_duration_seconds = Histogram(
+    "db_query_duration_seconds", "Database statement execution time by statement type", ("operation",), DB_BUCKETS
+)
+
+# Import pipeline
+import_stage_duration_seconds = Histogram(
+    "import_stage_duration_seconds", "Duration of Didox → REGOS import pipeline stages", ("stage",), UPSTREAM_BUCKETS
+)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request, labelled by the matched route
+    template (e.g. /api/documents/{doc_id}) so ids do not create new series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec()
+            # The router stores the matched route in the scope
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            http_request_duration_seconds.observe(time.perf_counter() - started, method=scope["method"], route=route_path)
+            http_requests_total.inc(method=scope["method"], route=route_path, status=status)
+
+
+@register_collector
+def _cache_metrics():
+    stats = all_cache_stats()
+    hits, misses, ratios = [], [], []
+    for name, cache in stats.items():
+        labels = {"cache": name}
+        hits.append((labels, cache.get("hits", 0) + cache.get("stale_hits", 0)))
+        misses.append((labels, cache.get("misses", 0)))
+        if cache.get("hit_rate") is not None:
+            ratios.append((labels, cache["hit_rate"]))
+    return [
+        ("cache_hits_total", "counter", "Cache hits (including stale hits)", hits),
+        ("cache_misses_total", "counter", "Cache misses", misses),
+        ("cache_hit_ratio", "gauge", "Cache hits / lookups since start", ratios),
+    ]
@@ -0,0 +1,117 @@
+"""
+Service for the local REGOS partner index keyed by TIN/PINFL
+"""
+import hashlib
+import json
+import re
+import logging
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, or_
+
+from backend.config import REGOS_PARTNER_SYNC_PAGE_SIZE
+from backend.database import RegosPartner
+from backend.regos_sync import sync_list, write_through
+from regos.partner import get_partners
+
+logger = logging.getLogger(__name__)
+
+PARTNER_SYNC_STATE_KEY = "regos_partners.last_sync"
+
+
+def normalize_tin(value) -> str | None:
+    """Keep only the digits of a TIN/PINFL; None if nothing is left"""
+    if value is None:
+        return None
+    digits = re.sub(r"\D", "", str(value))
+    return digits or None
+
+
+def _partner_fields(partner: dict) -> dict:
+    payload = json.dumps(partner, sort_keys=True, ensure_ascii=False, default=str)
+    return {
+        "tin": normalize_tin(partner.get("tin") or partner.get("inn")),
+        "pinfl": normalize_tin(partner.get("pinfl")),
+        "name": partner.get("name"),
+        "fullname": partner.get("fullname"),
+        "deleted_mark": bool(partner.get("deleted_mark")),
+        "content_hash": hashlib.sha256(payload.encode("utf-8")).hexdigest(),
+        "payload": payload,
+    }
+
+
+async def upsert_partners(db: AsyncSession, partners: list[dict]) -> int:
+    """Insert new partners and update changed ones. Returns the number of written rows"""
+    partners = [partner for partner in partners if partner.get("id") is not None]
+    if not partners:
+        return 0
+    ids = [int(partner["id"]) for partner in partners]
+    result = await db.execute(select(RegosPartner).where(RegosPartner.id.in_(ids)))
+    existing = {row.id: row for row in result.scalars()}
+
+    written = 0
+    for partner in partners:
+        fields = _partner_fields(partner)
+        row = existing.get(int(partner["id"]))
+        if row is None:
+            db.add(RegosPartner(id=int(partner["id"]), **fields))
+            written += 1
+        elif row.content_hash != fields["content_hash"]:
+            for key, value in fields.items():
+                setattr(row, key, value)
+            written += 1
+    await db.flush()
+    return written
+
+
+async def record_new_partner(partner_id: int, partner_data: dict) -> None:
+    """Write a partner created via Partner/Add into the index right away (best effort, see write_through)"""
+    await write_through(upsert_partners, [{**partner_data, "id": partner_id}], "REGOS partners")
+
+
+async def lookup_partners(db: AsyncSession, tins: list[str]) -> dict[str, dict | None]:
+    """
+    Resolve TINs/PINFLs to indexed REGOS partners.
+
+    Returns:
+        dict: requested TIN -> {"id", "name", "fullname", "tin", "pinfl"} or None if unknown.
+        Non-deleted partners win when several share a TIN.
+    """
+    normalized = {tin: normalize_tin(tin) for tin in tins}
+    keys = {value for value in normalized.values() if value}
+    found: dict[str, RegosPartner] = {}
+    if keys:
+        result = await db.execute(
+            select(RegosPartner)
+            .where(or_(RegosPartner.tin.in_(keys), RegosPartner.pinfl.in_(keys)))
+            .order_by(RegosPartner.deleted_mark.desc(), RegosPartner.id)
+        )
+        # Later rows overwrite earlier ones, so non-deleted partners come last and win
+        for row in result.scalars():
+            for key in (row.tin, row.pinfl):
+                if key in keys:
+                    found[key] = row
+
+    return {
+        tin: (
+            {
+                "id": found[key].id,
+                "name": found[key].name,
+                "fullname": found[key].fullname,
+                "tin": found[key].tin,
+                "pinfl": found[key].pinfl,
+            }
+            if key in found else None
+        )
+        for tin, key in normalized.items()
+    }
+
+
+async def sync_partners(page_size: int = REGOS_PARTNER_SYNC_PAGE_SIZE) -> dict:
+    """
+    Page through REGOS Partner/Get and bring the local index up to date (see regos_sync.sync_list).
+
+    Returns:
+        dict: {"fetched", "written", "removed", "complete", "elapsed_seconds"}
+    """
+    return await sync_list("partners", get_partners, upsert_partners, RegosPartner, PARTNER_SYNC_STATE_KEY, page_size)
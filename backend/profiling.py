@@ -0,0 +1,270 @@
+"""
+Opt-in profiling of single requests for superusers.
+
+Send "X-Profile: 1" (or ?profile=1) with a superuser token on any route. The
+request is profiled and saved to PROFILE_DIR; the response carries the
+profile name in X-Profile-Id. Modes:
+
+- sample (default): samples the event loop thread every PROFILE_SAMPLE_INTERVAL
+  seconds and writes folded stacks ("frame;frame;frame count" per line) for
+  flamegraph.pl, speedscope or inferno. While the loop is idle the request's own
+  await chain is recorded under "[await]", so time spent waiting on REGOS,
+  Didox or the database shows up where it is awaited.
+- cprofile ("X-Profile: cprofile"): deterministic cProfile of the event loop
+  thread, saved as a pstats .prof file (snakeviz, flameprof, gprof2dot).
+
+Both modes see everything the event loop runs meanwhile, so profile on a quiet
+instance for clean results. Work in thread pools (bcrypt) is seen as waiting.
+"""
+import asyncio
+import cProfile
+import json
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from types import FrameType
+import logging
+
+from backend.auth import user_from_token
+from backend.config import PROFILING_ENABLED, PROFILE_DIR, PROFILE_SAMPLE_INTERVAL, PROFILE_MAX_FILES
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("sample", "cprofile")
+
+# sys.setprofile is per thread: only one cProfile can run on the event loop at a time
+_cprofile_lock = threading.Lock()
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})"
+
+
+def _thread_stack(frame: FrameType | None) -> list[str]:
+    """Frame labels from the outermost call to `frame`"""
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _await_chain(task: asyncio.Task) -> list[str]:
+    """Frame labels of the coroutines a suspended task is awaiting, outermost first"""
+    stack = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None) \
+            or getattr(awaitable, "ag_frame", None)
+        if frame is None:
+            break
+        stack.append(_frame_label(frame))
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None) \
+            or getattr(awaitable, "ag_await", None)
+    return stack
+
+
+# Innermost frames of an idle event loop: asyncio waits in selector.select(); under uvloop
+# the loop is C code, so only the asyncio runner frame that started it is left
+IDLE_FRAMES = ("select (", "poll (", "_run_once (", "run_forever (", "run_until_complete (", "run (runners.py")
+
+
+def _is_idle(stack: list[str]) -> bool:
+    return not stack or stack[-1].startswith(IDLE_FRAMES)
+
+
+class StackSampler:
+    """Background thread that samples the event loop thread's stack"""
+
+    def __init__(self, task: asyncio.Task, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.task = task
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.samples: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = _thread_stack(frame)
+            if _is_idle(stack):
+                chain = _await_chain(self.task)
+                stack = ["[await]", *chain] if chain else ["[idle]"]
+            self.samples[";".join(stack)] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+def profile_dir() -> Path:
+    path = Path(PROFILE_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _prune(directory: Path) -> None:
+    """Keep the newest PROFILE_MAX_FILES profiles"""
+    metas = sorted(directory.glob("*.json"), key=lambda meta: meta.stat().st_mtime, reverse=True)
+    for meta in metas[PROFILE_MAX_FILES:]:
+        for path in directory.glob(f"{meta.stem}.*"):
+            path.unlink(missing_ok=True)
+
+
+def _save(profile_id: str, suffix: str, write, meta: dict) -> None:
+    directory = profile_dir()
+    write(directory / f"{profile_id}{suffix}")
+    (directory / f"{profile_id}.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+    _prune(directory)
+
+
+def list_profiles() -> list[dict]:
+    """Saved profiles, newest first"""
+    directory = profile_dir()
+    profiles = []
+    for meta_path in directory.glob("*.json"):
+        try:
+            profiles.append(json.loads(meta_path.read_text(encoding="utf-8")))
+        except (OSError, ValueError):
+            continue
+    return sorted(profiles, key=lambda meta: meta["created_at"], reverse=True)
+
+
+def profile_path(profile_id: str) -> Path | None:
+    """Data file of a saved profile; None for unknown ids"""
+    if not re.fullmatch(r"[\w.-]+", profile_id):
+        return None
+    for suffix in (".folded", ".prof"):
+        path = profile_dir() / f"{profile_id}{suffix}"
+        if path.is_file():
+            return path
+    return None
+
+
+def requested_mode(scope) -> str | None:
+    """Profiling mode asked for by the X-Profile header or ?profile= query flag, if any"""
+    value = None
+    for name, header_value in scope.get("headers", []):
+        if name == b"x-profile":
+            value = header_value.decode("latin-1")
+            break
+    if value is None:
+        match = re.search(r"(?:^|&)profile=([^&]*)", scope.get("query_string", b"").decode("latin-1"))
+        value = match.group(1) if match else None
+    if not value or value.lower() in ("0", "false", "no"):
+        return None
+    return value.lower() if value.lower() in PROFILE_MODES else "sample"
+
+
+def _bearer_token(scope) -> str | None:
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            return token.strip() if scheme.lower() == "bearer" else None
+    return None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling requests flagged with X-Profile / ?profile= by a superuser"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        mode = requested_mode(scope) if scope["type"] == "http" and PROFILING_ENABLED else None
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+
+        token = _bearer_token(scope)
+        user = await user_from_token(token) if token else None
+        if user is None or not user.is_superuser:
+            # Not allowed to profile: serve the request as usual
+            await self.app(scope, receive, send)
+            return
+
+        if mode == "cprofile" and not _cprofile_lock.acquire(blocking=False):
+            await self.app(scope, receive, self._with_headers(send, {"x-profile-skipped": "cprofile busy"}))
+            return
+
+        profile_id = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        status = 500
+        inner_send = self._with_headers(send, {"x-profile-id": profile_id})
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await inner_send(message)
+
+        profiler = sampler = None
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            sampler = StackSampler(asyncio.current_task())
+            sampler.start()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            if profiler is not None:
+                profiler.disable()
+                _cprofile_lock.release()
+            else:
+                sampler.stop()
+            route = scope.get("route")
+            meta = {
+                "id": profile_id,
+                "mode": mode,
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": getattr(route, "path", None),
+                "status": status,
+                "duration_seconds": round(elapsed, 4),
+                "user": user.username,
+                "created_at": datetime.utcnow().isoformat(),
+            }
+            try:
+                if profiler is not None:
+                    meta["format"] = "pstats"
+                    await asyncio.to_thread(_save, profile_id, ".prof", lambda path: profiler.dump_stats(path), meta)
+                else:
+                    meta["format"] = "folded"
+                    meta["samples"] = sum(sampler.samples.values())
+                    folded = sampler.folded()
+                    await asyncio.to_thread(
+                        _save, profile_id, ".folded", lambda path: path.write_text(folded, encoding="utf-8"), meta
+                    )
+                logger.info(f"Saved {mode} profile {profile_id} of {scope['method']} {scope['path']} ({elapsed:.3f}s)")
+            except OSError as e:
+                logger.error(f"Could not save profile {profile_id}: {e}")
+
+    @staticmethod
+    def _with_headers(send, headers: dict[str, str]):
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message = {
+                    **message,
+                    "headers": [
+                        *message.get("headers", []),
+                        *((name.encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()),
+                    ],
+                }
+            await send(message)
+        return send_with_headers
@@ -0,0 +1,146 @@
+"""
+Paged sync of REGOS reference lists into local tables (partner index, item catalog mirror)
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable
+import logging
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete
+
+from backend.database import AsyncSessionLocal, SyncState
+
+logger = logging.getLogger(__name__)
+
+# REGOS */Get call with a filter body
+Fetch = Callable[[dict], Awaitable[dict]]
+# Writes new or changed rows, returns how many were written
+Upsert = Callable[[AsyncSession, list[dict]], Awaitable[int]]
+
+# One sync per list at a time (background loop and manual trigger share it)
+_sync_locks: dict[str, asyncio.Lock] = {}
+
+
+def page_rows(response: dict) -> tuple[list[dict], dict]:
+    """Rows of a REGOS */Get response and the paging info (next_offset, total) next to them"""
+    result = response.get("result") or {}
+    if isinstance(result, dict):
+        return result.get("result", []), result
+    return result, {}
+
+
+async def write_through(upsert: Upsert, rows: list[dict], what: str) -> None:
+    """
+    Write rows just created in REGOS via */Add into the local table.
+
+    Best effort: the rows already exist in REGOS, so a local database error is
+    only logged and the next sync picks them up.
+    """
+    try:
+        async with AsyncSessionLocal() as db:
+            await upsert(db, rows)
+            await db.commit()
+    except Exception as e:
+        logger.warning(f"Could not write {len(rows)} new {what} locally, left to the next sync: {e}")
+
+
+async def _removed_ids(fetch: Fetch, candidate_ids: list[int], page_size: int) -> list[int]:
+    """Of the local ids a pass did not see, those REGOS no longer returns when asked by id"""
+    present: set[int] = set()
+    for i in range(0, len(candidate_ids), page_size):
+        chunk = candidate_ids[i:i + page_size]
+        rows, _ = page_rows(await fetch({"ids": chunk, "limit": len(chunk)}))
+        present.update(int(row["id"]) for row in rows if row.get("id") is not None)
+    return [row_id for row_id in candidate_ids if row_id not in present]
+
+
+async def sync_list(
+    what: str,
+    fetch: Fetch,
+    upsert: Upsert,
+    model: Any,
+    state_key: str,
+    page_size: int,
+    dependents: tuple = (),
+) -> dict:
+    """
+    Page through a REGOS */Get list and bring its local table up to date.
+
+    REGOS */Get has no modified-since filter, so every run re-reads the whole
+    list; only new or changed rows (by payload hash, see `upsert`) are written.
+
+    The list is paged by offset, so rows added or removed during a pass shift
+    the pages and some rows can be skipped. Removal therefore only runs after a
+    pass that saw as many distinct ids as REGOS reports in total, and only for
+    ids that REGOS no longer returns when asked by id.
+
+    Args:
+        what: Name of the rows for logs, e.g. "partners"
+        fetch: REGOS */Get wrapper (e.g. regos.partner.get_partners)
+        upsert: Writes a page of rows into `model`
+        model: Local table keyed by the REGOS id in `id`
+        state_key: SyncState key that records the last sync time
+        page_size: */Get limit
+        dependents: Columns of other tables referencing `model.id`, whose rows are removed along with it
+
+    Returns:
+        dict: {"fetched", "written", "removed", "complete", "elapsed_seconds"}
+    """
+    async with _sync_locks.setdefault(state_key, asyncio.Lock()):
+        started = time.perf_counter()
+        fetched = written = 0
+        seen_ids: set[int] = set()
+        offset = 0
+        total = None
+        removed_ids: list[int] = []
+
+        async with AsyncSessionLocal() as db:
+            while True:
+                rows, result = page_rows(await fetch({"limit": page_size, "offset": offset}))
+                total = result.get("total", total)
+                if not rows:
+                    break
+
+                fetched += len(rows)
+                seen_ids.update(int(row["id"]) for row in rows if row.get("id") is not None)
+                written += await upsert(db, rows)
+                await db.commit()
+
+                next_offset = result.get("next_offset")
+                if next_offset is None or next_offset <= offset or (total is not None and next_offset >= total):
+                    break
+                offset = next_offset
+
+            complete = total is not None and len(seen_ids) >= total
+            if complete:
+                existing_ids = set((await db.execute(select(model.id))).scalars())
+                removed_ids = await _removed_ids(fetch, sorted(existing_ids - seen_ids), page_size)
+                for i in range(0, len(removed_ids), 500):
+                    chunk = removed_ids[i:i + 500]
+                    for column in dependents:
+                        await db.execute(delete(column.class_).where(column.in_(chunk)))
+                    await db.execute(delete(model).where(model.id.in_(chunk)))
+            else:
+                logger.warning(f"REGOS {what} pass saw {len(seen_ids)} of {total}; skipping removal this run")
+
+            state = await db.get(SyncState, state_key)
+            if state is None:
+                state = SyncState(key=state_key)
+                db.add(state)
+            state.value = datetime.utcnow().isoformat()
+            await db.commit()
+
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"REGOS {what} synced: {fetched} fetched, {written} written, "
+            f"{len(removed_ids)} removed in {elapsed:.2f}s"
+        )
+        return {
+            "fetched": fetched,
+            "written": written,
+            "removed": len(removed_ids),
+            "complete": complete,
+            "elapsed_seconds": round(elapsed, 3),
+        }
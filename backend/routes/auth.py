@@ -9,9 +9,10 @@ import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent.parent))
 
-from backend.database import get_db
-from backend.auth import verify_password, create_access_token
+from backend.database import get_read_db, User
+from backend.auth import verify_password_async, create_access_token, get_current_active_user, principal_cache
 from backend.user_service import get_user_by_username
+from backend.token_service import user_key_cache
 
 router = APIRouter(prefix="/api/auth", tags=["Authentication"])
 
@@ -29,12 +30,12 @@ class TokenResponse(BaseModel):
 @router.post("/user-login", response_model=TokenResponse)
 async def user_login(
     user_credentials: UserLogin,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Login with username and password to get JWT token"""
     user = await get_user_by_username(db, user_credentials.username)
     
-    if not user or not verify_password(user_credentials.password, user.password_hash):
+    if not user or not await verify_password_async(user_credentials.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -43,3 +44,17 @@ async def user_login(
     
     access_token = create_access_token(data={"sub": user.username})
     return TokenResponse(access_token=access_token)
+
+
+@router.get("/cache/stats")
+async def auth_cache_stats(
+    current_user: User = Depends(get_current_active_user)
+):
+    """Hit/miss counters of the authenticated-principal and Didox user_key caches (requires authentication)"""
+    return {
+        "ok": True,
+        "result": {
+            "principals": principal_cache.stats(),
+            "user_keys": user_key_cache.stats(),
+        },
+    }
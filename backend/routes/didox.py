@@ -1,8 +1,11 @@
 """
 Didox API routes
 """
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
+from typing import Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 import logging
 
@@ -10,16 +13,24 @@ import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent.parent))
 
-from backend.database import get_db
+from backend.database import get_db, get_read_db
 from backend.auth import get_current_active_user
 from backend.token_service import get_token
 from backend.database import User
-from backend.config import PARTNER_TOKEN, DIDOX_PARTNER_BASE_URL
-from didox.api import didox_async_api_request
+from backend.config import PARTNER_TOKEN, DIDOX_PARTNER_BASE_URL, DIDOX_STREAM_LISTINGS
+from didox.api import didox_async_api_request, didox_stream_request
+from backend import background
+from backend.document_service import is_mirrored, list_documents, sync_user_documents
+from backend.document_detail_service import get_document_detail
+from backend.json_codec import ORJSONResponse
+from backend.compression import etag_response
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api", tags=["Didox"])
+router = APIRouter(prefix="/api", tags=["Didox"], default_response_class=ORJSONResponse)
+
+# Largest page of /api/documents, served locally or proxied to Didox
+DOCUMENTS_MAX_LIMIT = 100
 
 
 class DidoxLoginRequest(BaseModel):
@@ -79,8 +90,7 @@ async def didox_login(
             )
         
         # Store token in database (not exposed to frontend)
-        await save_token(db, current_user.id, token)
-        await db.commit()
+        await save_token(db, current_user.id, token, tax_id=request.tax_id)
         
         logger.info(f"Token saved for user {current_user.username}")
         return AuthResponse(success=True, message="Didox token saved successfully")
@@ -93,17 +103,47 @@ async def didox_login(
 
 @router.get("/documents")
 async def get_documents(
+    request: Request,
     owner: int = 1,
-    page: int = 1,
-    limit: int = 20,
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=DOCUMENTS_MAX_LIMIT),
     document_type: str = None,
     date_from: str = None,
     date_to: str = None,
     partner: str = None,
+    status: Optional[int] = None,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get list of documents from Didox (requires authentication and stored token)"""
+    """
+    Get list of documents (requires authentication and stored token).
+
+    Served from the local document mirror once it has been synced, with keyset
+    pagination (pass the previous response's next_cursor as `cursor`) or page/limit.
+    Until then the request is proxied to Didox and a first sync is started; with
+    DIDOX_STREAM_LISTINGS the Didox body is streamed through unparsed.
+    `status` (doc_status) is only applied to the local mirror.
+    """
+    if await is_mirrored(db, current_user.id, owner):
+        try:
+            # Returned as a response so the rows skip FastAPI's jsonable_encoder pass
+            return ORJSONResponse(await list_documents(
+                db,
+                current_user.id,
+                owner=owner,
+                limit=limit,
+                cursor=cursor,
+                page=page,
+                document_type=document_type,
+                date_from=date_from,
+                date_to=date_to,
+                partner=partner,
+                status=status,
+            ))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
     # Get stored token from database
     user_key = await get_token(db, current_user.id)
     
@@ -113,6 +153,9 @@ async def get_documents(
             detail="No Didox token found. Please login to Didox first using /api/auth/didox-login"
         )
     
+    user_id = current_user.id
+    background.run_once(f"didox_document_sync:{user_id}", lambda: sync_user_documents(user_id, user_key))
+    
     # Build query parameters (matching test.py format)
     params = {
         "owner": owner,
@@ -128,6 +171,17 @@ async def get_documents(
     if partner:
         params["partner"] = partner
     
+    if DIDOX_STREAM_LISTINGS:
+        stream = await didox_stream_request(
+            endpoint="documents",
+            request_data=params,
+            user_key=user_key,
+            partner_auth=PARTNER_TOKEN,
+            accept_encoding=request.headers.get("accept-encoding", "identity"),
+        )
+        # The background task releases the connection if the client goes away before the body starts
+        return StreamingResponse(stream.body(), headers=stream.headers, background=BackgroundTask(stream.aclose))
+
     data = await didox_async_api_request(
         endpoint="documents",
         request_data=params,
@@ -135,16 +189,49 @@ async def get_documents(
         partner_auth=PARTNER_TOKEN,
         method="GET"
     )
-    return data
+    return ORJSONResponse(data)
+
+
+@router.post("/documents/sync")
+async def sync_documents_endpoint(
+    full: bool = False,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Sync the current user's local document mirror from Didox now (requires authentication and stored token)"""
+    user_key = await get_token(db, current_user.id)
+    
+    if not user_key:
+        raise HTTPException(
+            status_code=400,
+            detail="No Didox token found. Please login to Didox first using /api/auth/didox-login"
+        )
+    
+    try:
+        result = await sync_user_documents(current_user.id, user_key, full=full or None)
+        result.pop("changed_doc_ids", None)
+        return {"ok": True, "result": result}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error syncing Didox documents: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/documents/{document_id}")
 async def get_document(
     document_id: str,
+    request: Request,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get a single document by ID from Didox (requires authentication and stored token)"""
+    """
+    Get a single document by ID from Didox (requires authentication and stored token).
+
+    Served from the persistent detail cache: final documents until the document
+    mirror sees them change, others for DIDOX_DETAIL_CACHE_TTL seconds. Carries an
+    ETag; If-None-Match with it returns 304 without a body.
+    """
     # Get stored token from database
     user_key = await get_token(db, current_user.id)
     
@@ -154,13 +241,4 @@ async def get_document(
             detail="No Didox token found. Please login to Didox first using /api/auth/didox-login"
         )
     
-    # Use DIDOX_PARTNER_BASE_URL for document details endpoint
-    data = await didox_async_api_request(
-        endpoint=f"documents/{document_id}",
-        request_data=None,
-        user_key=user_key,
-        partner_auth=PARTNER_TOKEN,
-        base_url=DIDOX_PARTNER_BASE_URL,
-        method="GET"
-    )
-    return data
+    return etag_response(request, await get_document_detail(current_user.id, user_key, document_id))
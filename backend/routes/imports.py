@@ -0,0 +1,256 @@
+"""
+Didox → REGOS import routes
+"""
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import Literal, Optional, List
+from decimal import Decimal
+from sqlalchemy.ext.asyncio import AsyncSession
+import json
+import logging
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.config import IMPORT_BULK_MAX_DOCUMENTS
+from backend.database import get_read_db
+from backend.auth import get_current_active_user
+from backend.token_service import get_token
+from backend.database import User
+from backend.import_service import import_document
+from backend.job_service import job_queue
+from backend.document_service import is_mirrored, find_document_ids
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/import", tags=["Import"])
+
+
+class ImportProductKeys(BaseModel):
+    """REGOS keys entered by the user for one document product"""
+    index: int  # Position of the product in the document productlist
+    code: Optional[str] = None
+    barcode: Optional[str] = None
+    articul: Optional[str] = None
+
+
+class ImportSettingsRequest(BaseModel):
+    """Import settings shared by single and bulk imports"""
+    partner_id: Optional[int] = None  # ID контрагента (default: partner with the seller's TIN from the partner index)
+    stock_id: int  # Required: ID склада
+    currency_id: int  # Required: ID валюты
+    attached_user_id: int = 1  # ID ответственного пользователя
+    price_type_id: Optional[int] = None
+    vat_calculation_type: Optional[Literal["Не начислять", "В сумме", "Сверху"]] = None
+    exchange_rate: Optional[Decimal] = None
+    date: Optional[int] = None  # Unix timestamp in seconds (default: now)
+    description: Optional[str] = None
+    item_group_id: Optional[int] = None  # Group for items created during import
+    vat_id: int = 1
+    unit_id: int = 1
+    create_if_not_matched: bool = False
+    match_strategies: List[Literal["Code", "Name", "Articul", "Barcode"]] = ["Code", "Barcode"]
+
+
+class ImportDocumentRequest(ImportSettingsRequest):
+    doc_id: str  # Didox document id
+    products: Optional[List[ImportProductKeys]] = None
+
+
+class ImportBulkRequest(ImportSettingsRequest):
+    """Documents to import: explicit doc_ids, or a filter over the local document mirror"""
+    doc_ids: Optional[List[str]] = None
+    owner: int = 0  # Incoming documents are the ones received as purchases
+    document_type: Optional[str] = None
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+    partner: Optional[str] = None
+    status: Optional[int] = None
+
+
+@router.post("/document")
+async def import_document_endpoint(
+    request: ImportDocumentRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Import a Didox document into REGOS in one call (requires authentication and stored Didox token).
+
+    Runs the whole pipeline server-side: fetches the document, matches all products
+    in batched cascade passes, creates missing items (if create_if_not_matched), then
+    creates the DocPurchase and adds all purchase operations in one request.
+
+    Products are matched by the keys in `products` and, where the user gave none, by
+    the barcode printed on the document (and its name when "Name" is in
+    match_strategies). Such products are imported even with create_if_not_matched off.
+
+    Returns:
+    - doc_purchase_id: ID of the created REGOS purchase document
+    - operations: Number of purchase operations added
+    - products: Per-product item_id and how it was resolved (match type or "created")
+    """
+    user_key = await get_token(db, current_user.id)
+
+    if not user_key:
+        raise HTTPException(
+            status_code=400,
+            detail="No Didox token found. Please login to Didox first using /api/auth/didox-login"
+        )
+
+    try:
+        settings = request.model_dump(exclude={"doc_id"})
+        return await import_document(current_user.id, user_key, request.doc_id, settings)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error importing document {request.doc_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/jobs", status_code=202)
+async def enqueue_import_job(
+    request: ImportDocumentRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Queue a Didox → REGOS import to run in the background (requires authentication and stored Didox token).
+
+    Returns immediately with the job; follow it with GET /api/import/jobs/{job_id}
+    or stream its progress from /api/import/jobs/{job_id}/events. The import keeps
+    running if the browser tab is closed.
+    """
+    if not await get_token(db, current_user.id):
+        raise HTTPException(
+            status_code=400,
+            detail="No Didox token found. Please login to Didox first using /api/auth/didox-login"
+        )
+    
+    settings = request.model_dump(mode="json", exclude={"doc_id"})
+    return await job_queue.enqueue(
+        current_user.id,
+        "import_document",
+        {"doc_id": request.doc_id, "settings": settings},
+    )
+
+
+@router.post("/bulk", status_code=202)
+async def enqueue_bulk_import(
+    request: ImportBulkRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Queue an import of many Didox documents into REGOS (requires authentication and stored Didox token).
+
+    Pass doc_ids, or leave them out to import the mirrored documents matching
+    owner/document_type/date_from/date_to/partner/status. Documents are fetched
+    and written in parallel, products shared between documents are matched and
+    created once, and one failing document does not stop the others.
+
+    Returns the job immediately (kind "import_bulk"); its result lists the
+    outcome of every document with aggregate throughput.
+    """
+    if not await get_token(db, current_user.id):
+        raise HTTPException(
+            status_code=400,
+            detail="No Didox token found. Please login to Didox first using /api/auth/didox-login"
+        )
+
+    doc_ids = request.doc_ids
+    if doc_ids is None:
+        if not await is_mirrored(db, current_user.id, request.owner):
+            raise HTTPException(
+                status_code=400,
+                detail="Documents are not synced yet. Pass doc_ids or run POST /api/documents/sync first"
+            )
+        doc_ids = await find_document_ids(
+            db,
+            current_user.id,
+            owner=request.owner,
+            document_type=request.document_type,
+            date_from=request.date_from,
+            date_to=request.date_to,
+            partner=request.partner,
+            status=request.status,
+            limit=IMPORT_BULK_MAX_DOCUMENTS + 1,
+        )
+    doc_ids = list(dict.fromkeys(doc_ids))
+    if not doc_ids:
+        raise HTTPException(status_code=400, detail="No documents to import")
+    if len(doc_ids) > IMPORT_BULK_MAX_DOCUMENTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many documents: at most {IMPORT_BULK_MAX_DOCUMENTS} per bulk import"
+        )
+
+    settings = request.model_dump(
+        mode="json",
+        exclude={"doc_ids", "owner", "document_type", "date_from", "date_to", "partner", "status"},
+    )
+    return await job_queue.enqueue(
+        current_user.id,
+        "import_bulk",
+        {"doc_ids": doc_ids, "settings": settings},
+    )
+
+
+@router.get("/jobs")
+async def list_import_jobs(
+    limit: int = 50,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Most recent import jobs of the current user (requires authentication)"""
+    return {"ok": True, "result": await job_queue.list(current_user.id, limit=min(limit, 500))}
+
+
+@router.get("/jobs/{job_id}")
+async def get_import_job(
+    job_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Status of an import job (requires authentication).
+
+    Returns:
+    - status: queued, running, succeeded or failed
+    - stage / progress.stages: fetch, match, create_items, create_doc_purchase, add_operations
+    - result: Import summary once succeeded; error once failed
+    """
+    job = await job_queue.get(job_id, user_id=current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_import_job(
+    job_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Server-Sent Events stream of an import job (requires authentication).
+
+    Sends the job snapshot right away and after every stage change, then closes
+    once the job has succeeded or failed. Comment lines keep idle connections open.
+    """
+    if await job_queue.get(job_id, user_id=current_user.id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        async for snapshot in job_queue.events(job_id):
+            if snapshot is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"data: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
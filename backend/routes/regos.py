@@ -1,8 +1,9 @@
 """
 REGOS API routes
 """
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Literal, Optional, List, Dict, Any
 from decimal import Decimal
 import logging
@@ -12,8 +13,8 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent.parent))
 
 from backend.auth import get_current_active_user
-from backend.database import User
-from regos.match import match_products
+from backend.database import User, get_read_db
+from regos.match import match_products, cascade_match_products, CASCADE_STRATEGIES
 from regos.item import add_item
 from regos.partner import add_partner, get_partners, get_partner_groups
 from regos.docpurchase import add_doc_purchase
@@ -22,10 +23,16 @@ from regos.stock import get_stocks
 from regos.currency import get_currencies
 from regos.pricetype import get_price_types
 from regos.itemgroup import get_item_groups
+from backend.import_service import VAT_RU_TO_EN, regos_new_id
+from backend.partner_service import lookup_partners, record_new_partner, sync_partners
+from backend.item_catalog_service import match_products_local, record_new_items, sync_items
+from regos.cache import reference_cache
+from backend.json_codec import ORJSONResponse
+from backend.compression import etag_response
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api/regos", tags=["REGOS"])
+router = APIRouter(prefix="/api/regos", tags=["REGOS"], default_response_class=ORJSONResponse)
 
 
 class ProductMatchingData(BaseModel):
@@ -38,6 +45,20 @@ class MatchProductsRequest(BaseModel):
     data: list[ProductMatchingData]
 
 
+class CascadeProductData(BaseModel):
+    """Product with candidate keys for the cascade matcher"""
+    index: str
+    code: Optional[str] = None
+    barcode: Optional[str] = None
+    articul: Optional[str] = None
+    name: Optional[str] = None
+
+
+class CascadeMatchProductsRequest(BaseModel):
+    strategies: List[Literal["Code", "Name", "Articul", "Barcode"]] = list(CASCADE_STRATEGIES)
+    data: list[CascadeProductData]
+
+
 class AddItemRequest(BaseModel):
     group_id: int
     vat_id: int
@@ -99,6 +120,11 @@ class GetPartnersRequest(BaseModel):
     model_config = {"extra": "allow"}
 
 
+class LookupPartnersRequest(BaseModel):
+    """Request body for resolving TINs/PINFLs against the local partner index"""
+    tins: List[str]
+
+
 class GetPartnerGroupsRequest(BaseModel):
     """Request body for PartnerGroup/Get. See https://docs.regos.uz/uz/api/references/partnergroup/get"""
     ids: Optional[List[int]] = None  # Optional: Массив id групп
@@ -137,6 +163,11 @@ class PurchaseOperationItem(BaseModel):
     model_config = {"extra": "allow"}
 
 
+class InvalidateCacheRequest(BaseModel):
+    """Request body for reference cache invalidation"""
+    entity: Optional[Literal["Stock/Get", "Currency/Get", "PriceType/Get", "ItemGroup/Get", "PartnerGroup/Get"]] = None  # Optional: drop only this entity
+
+
 class AddPurchaseOperationRequest(BaseModel):
     """Request body for PurchaseOperation/Add. See https://docs.regos.uz/uz/api/store/purchaseoperation/add"""
     operations: List[PurchaseOperationItem]  # Array of purchase operations
@@ -180,16 +211,81 @@ async def match_products_endpoint(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/match-products-bulk")
+async def match_products_bulk_endpoint(
+    request: MatchProductsRequest,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Match any number of products with REGOS API (requires authentication).
+
+    Matches products by Code, Name, Articul, or Barcode.
+    Values found in the local item mirror are answered directly; the rest are
+    split into 250-item Item/Match calls that run with bounded concurrency.
+    Results are merged back by index in request order. Indexes must be unique.
+    """
+    try:
+        products_data = [
+            {"index": item.index, "value": item.value}
+            for item in request.data
+        ]
+        
+        result = await match_products_local(request.type, products_data)
+        
+        return result
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error bulk matching products: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/match-products-cascade")
+async def match_products_cascade_endpoint(
+    request: CascadeMatchProductsRequest,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Match products with REGOS API trying several strategies in one call (requires authentication).
+
+    Each product may carry code, barcode, articul and name. Strategies run in the
+    given order (default: Code → Barcode → Articul → Name), each as one batched
+    pass over the products that are still unmatched: the local item mirror first,
+    REGOS Item/Match for the rest.
+
+    Returns:
+    - result: Matched rows with the "match_type" that found them
+    - unmatched: Indexes no strategy could match
+    - passes: Number of strategy passes run through the matcher (answered by REGOS or the local item mirror)
+    """
+    try:
+        products_data = [item.model_dump() for item in request.data]
+        
+        result = await cascade_match_products(products_data, request.strategies, matcher=match_products_local)
+        
+        return result
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error cascade matching products: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/add-item")
 async def add_item_endpoint(
     request: AddItemRequest,
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user),
 ):
     """
     Add a new item to REGOS (requires authentication).
     
     Creates a new item in REGOS using the Item/Add endpoint.
     Required fields: group_id, vat_id, unit_id
+    The new item is written into the local item mirror right away.
     """
     try:
         # Convert Pydantic model to dict, excluding None values
@@ -197,6 +293,9 @@ async def add_item_endpoint(
         
         # Call REGOS API
         result = await add_item(item_data)
+        new_id = regos_new_id(result)
+        if new_id is not None:
+            await record_new_items({new_id: item_data})
         
         return result
     except HTTPException:
@@ -216,10 +315,14 @@ async def add_partner_endpoint(
 
     Uses REGOS Partner/Add endpoint.
     Documentation: https://docs.regos.uz/uz/api/references/partner/add
+    The new partner is written into the local partner index right away.
     """
     try:
         partner_data = request.model_dump(exclude_none=True)
         result = await add_partner(partner_data)
+        new_id = regos_new_id(result)
+        if new_id is not None:
+            await record_new_partner(new_id, partner_data)
         return result
     except HTTPException:
         raise
@@ -231,6 +334,7 @@ async def add_partner_endpoint(
 @router.post("/get-partners")
 async def get_partners_endpoint(
     request: GetPartnersRequest,
+    http_request: Request,
     current_user: User = Depends(get_current_active_user),
 ):
     """
@@ -257,7 +361,7 @@ async def get_partners_endpoint(
         # Convert Pydantic model to dict, excluding None values
         filter_data = request.model_dump(exclude_none=True)
         result = await get_partners(filter_data)
-        return result
+        return etag_response(http_request, result)
     except HTTPException:
         raise
     except Exception as e:
@@ -265,9 +369,56 @@ async def get_partners_endpoint(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/partners/lookup")
+async def lookup_partners_endpoint(
+    request: LookupPartnersRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    Resolve TINs/PINFLs to REGOS partners from the local partner index (requires authentication).
+
+    The index is filled by paging Partner/Get and refreshed in the background;
+    partners created via /add-partner are added immediately.
+
+    Returns:
+    - result: Object mapping every requested TIN to {id, name, fullname, tin, pinfl} or null
+    """
+    return {"ok": True, "result": await lookup_partners(db, request.tins)}
+
+
+@router.post("/partners/sync")
+async def sync_partners_endpoint(
+    current_user: User = Depends(get_current_active_user),
+):
+    """Refresh the local partner index from REGOS Partner/Get now (requires authentication)"""
+    try:
+        return {"ok": True, "result": await sync_partners()}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error syncing partner index: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/items/sync")
+async def sync_items_endpoint(
+    current_user: User = Depends(get_current_active_user),
+):
+    """Refresh the local item mirror from REGOS Item/Get now (requires authentication)"""
+    try:
+        return {"ok": True, "result": await sync_items()}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error syncing item mirror: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/get-partner-groups")
 async def get_partner_groups_endpoint(
     request: GetPartnerGroupsRequest,
+    http_request: Request,
     current_user: User = Depends(get_current_active_user),
 ):
     """
@@ -288,7 +439,7 @@ async def get_partner_groups_endpoint(
         # Convert Pydantic model to dict, excluding None values
         filter_data = request.model_dump(exclude_none=True)
         result = await get_partner_groups(filter_data)
-        return result
+        return etag_response(http_request, result)
     except HTTPException:
         raise
     except Exception as e:
@@ -305,6 +456,7 @@ class GetStocksRequest(BaseModel):
 
 @router.post("/get-stocks")
 async def get_stocks_endpoint(
+    http_request: Request,
     request: GetStocksRequest = GetStocksRequest(deleted_mark=False),
     current_user: User = Depends(get_current_active_user),
 ):
@@ -322,7 +474,7 @@ async def get_stocks_endpoint(
     try:
         filter_data = request.model_dump(exclude_none=True)
         result = await get_stocks(filter_data)
-        return result
+        return etag_response(http_request, result)
     except HTTPException:
         raise
     except Exception as e:
@@ -332,6 +484,7 @@ async def get_stocks_endpoint(
 
 @router.post("/get-currencies")
 async def get_currencies_endpoint(
+    http_request: Request,
     current_user: User = Depends(get_current_active_user),
 ):
     """
@@ -347,7 +500,7 @@ async def get_currencies_endpoint(
     """
     try:
         result = await get_currencies({})
-        return result
+        return etag_response(http_request, result)
     except HTTPException:
         raise
     except Exception as e:
@@ -357,6 +510,7 @@ async def get_currencies_endpoint(
 
 @router.post("/get-price-types")
 async def get_price_types_endpoint(
+    http_request: Request,
     current_user: User = Depends(get_current_active_user),
 ):
     """
@@ -372,7 +526,7 @@ async def get_price_types_endpoint(
     """
     try:
         result = await get_price_types({})
-        return result
+        return etag_response(http_request, result)
     except HTTPException:
         raise
     except Exception as e:
@@ -382,6 +536,7 @@ async def get_price_types_endpoint(
 
 @router.post("/get-item-groups")
 async def get_item_groups_endpoint(
+    http_request: Request,
     current_user: User = Depends(get_current_active_user),
 ):
     """
@@ -395,7 +550,7 @@ async def get_item_groups_endpoint(
     """
     try:
         result = await get_item_groups({})
-        return result
+        return etag_response(http_request, result)
     except HTTPException:
         raise
     except Exception as e:
@@ -426,9 +581,8 @@ async def add_doc_purchase_endpoint(
         # Use mode='json' to ensure Decimal and other types are JSON-serializable
         doc_purchase_data = request.model_dump(mode='json', exclude_none=True)
         # REGOS API expects vat_calculation_type in English: "No", "Exclude", "Include"
-        vat_ru_to_en = {"Не начислять": "No", "В сумме": "Exclude", "Сверху": "Include"}
-        if "vat_calculation_type" in doc_purchase_data and doc_purchase_data["vat_calculation_type"] in vat_ru_to_en:
-            doc_purchase_data["vat_calculation_type"] = vat_ru_to_en[doc_purchase_data["vat_calculation_type"]]
+        if "vat_calculation_type" in doc_purchase_data and doc_purchase_data["vat_calculation_type"] in VAT_RU_TO_EN:
+            doc_purchase_data["vat_calculation_type"] = VAT_RU_TO_EN[doc_purchase_data["vat_calculation_type"]]
         logger.info(f"Creating purchase document with data: {doc_purchase_data}")
         result = await add_doc_purchase(doc_purchase_data)
         return result
@@ -473,3 +627,28 @@ async def add_purchase_operation_endpoint(
     except Exception as e:
         logger.error(f"Error adding purchase operations to REGOS: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/cache/invalidate")
+async def invalidate_reference_cache_endpoint(
+    request: InvalidateCacheRequest = InvalidateCacheRequest(),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Drop cached REGOS reference data (requires authentication).
+
+    Stocks, currencies, price types, item groups and partner groups are cached in
+    memory. Call this after changing them in REGOS to make the next read reload them.
+    Without "entity" the whole reference cache is cleared.
+    """
+    dropped = reference_cache.invalidate(request.entity)
+    logger.info(f"User {current_user.username} invalidated reference cache ({request.entity or 'all'}): {dropped} entries")
+    return {"ok": True, "invalidated": dropped}
+
+
+@router.get("/cache/stats")
+async def reference_cache_stats_endpoint(
+    current_user: User = Depends(get_current_active_user),
+):
+    """Hit/miss counters of the REGOS reference data cache (requires authentication)"""
+    return {"ok": True, "result": reference_cache.stats()}
@@ -0,0 +1,88 @@
+"""
+Service status routes
+"""
+import secrets
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import PlainTextResponse, FileResponse
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.config import METRICS_TOKEN
+from backend.database import User
+from backend.auth import get_current_active_user, get_current_superuser
+from backend.upstream import upstream_status
+from backend.metrics import render_metrics
+from backend.profiling import list_profiles, profile_path
+# Importing the clients registers their rate limiters and circuit breakers
+import regos.api  # noqa: F401
+import didox.api  # noqa: F401
+
+router = APIRouter(prefix="/api/status", tags=["Status"])
+# Scraped by Prometheus at the conventional path, outside /api
+metrics_router = APIRouter(tags=["Status"])
+
+
+@router.get("/upstreams")
+async def upstreams_status(
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Circuit breaker state and rate limiter counters of REGOS and Didox (requires authentication).
+
+    Returns per upstream:
+    - circuit.state: closed, open (calls fail fast with 503) or half_open (trial calls)
+    - circuit.window_failure_rate: Share of failed or slow calls in the sliding window
+    - rate_limit: Configured and current rate, requests delayed by the limiter, retries, 429s
+    """
+    status = upstream_status()
+    return {
+        "ok": all(upstream["circuit"] is None or upstream["circuit"]["state"] == "closed" for upstream in status.values()),
+        "result": status,
+    }
+
+
+@router.get("/profiles")
+async def profiles_index(
+    current_user: User = Depends(get_current_superuser)
+):
+    """
+    Saved request profiles, newest first (superuser only).
+
+    Profile a request by sending "X-Profile: 1" (sampling, folded stacks for
+    flamegraph.pl / speedscope) or "X-Profile: cprofile" (pstats for snakeviz)
+    as a superuser; the id is returned in the X-Profile-Id response header.
+    """
+    return {"ok": True, "result": list_profiles()}
+
+
+@router.get("/profiles/{profile_id}")
+async def download_profile(
+    profile_id: str,
+    current_user: User = Depends(get_current_superuser)
+):
+    """Download a saved profile (.folded text or .prof pstats) (superuser only)"""
+    path = profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    media_type = "text/plain; charset=utf-8" if path.suffix == ".folded" else "application/octet-stream"
+    return FileResponse(path, media_type=media_type, filename=path.name)
+
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+async def metrics(request: Request):
+    """
+    Metrics in the Prometheus text format: request latency per route, upstream
+    latency/errors/in-flight per REGOS and Didox endpoint, DB statement timing,
+    import stage durations, cache hit ratios, circuit breaker and rate limiter state.
+
+    Requires "Authorization: Bearer <METRICS_TOKEN>" when METRICS_TOKEN is set.
+    """
+    if METRICS_TOKEN:
+        authorization = request.headers.get("Authorization", "")
+        if not secrets.compare_digest(authorization, f"Bearer {METRICS_TOKEN}"):
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
@@ -4,10 +4,23 @@ Service for managing Didox tokens in the database
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, delete
 from backend.database import Token
+from backend.config import AUTH_CACHE_TTL, AUTH_CACHE_SIZE
+from backend.cache import TTLCache
+from backend.document_service import bind_user_company
 
+# user_id -> Didox user_key (None when the user has no token), replaced by save_token
+user_key_cache = TTLCache("didox_user_keys", maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
 
-async def save_token(db: AsyncSession, user_id: int, user_key: str) -> Token:
-    """Save or update token for a user"""
+_MISSING = object()
+
+
+async def save_token(db: AsyncSession, user_id: int, user_key: str, tax_id: str | None = None) -> Token:
+    """
+    Save or update token for a user (commits the session).
+
+    With `tax_id` (the company the key was issued for), a login into another
+    company than before resets the user's local document mirror.
+    """
     # Delete existing token for this user
     await db.execute(delete(Token).where(Token.user_id == user_id))
     await db.flush()
@@ -15,13 +28,25 @@ async def save_token(db: AsyncSession, user_id: int, user_key: str) -> Token:
     # Create new token
     token = Token(user_id=user_id, user_key=user_key)
     db.add(token)
-    await db.flush()
+    await db.commit()
     await db.refresh(token)
+    
+    # Only once committed: a get_token running before that would cache the old row again
+    user_key_cache.set(user_id, user_key)
+
+    if tax_id:
+        await bind_user_company(user_id, tax_id)
     return token
 
 
 async def get_token(db: AsyncSession, user_id: int) -> str | None:
-    """Get token for a user"""
+    """Get token for a user (cached for AUTH_CACHE_TTL seconds)"""
+    user_key = user_key_cache.get(user_id, _MISSING)
+    if user_key is not _MISSING:
+        return user_key
+    
     result = await db.execute(select(Token).where(Token.user_id == user_id))
     token = result.scalar_one_or_none()
-    return token.user_key if token else None
+    user_key = token.user_key if token else None
+    user_key_cache.set(user_id, user_key)
+    return user_key
@@ -0,0 +1,560 @@
+"""
+Outbound call policies shared by the REGOS and Didox clients: token-bucket rate
+limits, retries with exponential backoff and jitter, circuit breakers and
+single-flight coalescing of identical reads
+"""
+import asyncio
+import copy
+import random
+import re
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, TypeVar
+import logging
+
+from fastapi import HTTPException
+
+from backend.metrics import (
+    register_collector,
+    upstream_errors_total,
+    upstream_request_duration_seconds,
+    upstream_requests_in_flight,
+)
+from backend.config import (
+    UPSTREAM_RETRY_ATTEMPTS,
+    UPSTREAM_RETRY_BASE_DELAY,
+    UPSTREAM_RETRY_MAX_DELAY,
+    UPSTREAM_RETRY_AFTER_MAX,
+    UPSTREAM_BREAKER_FAILURE_RATE,
+    UPSTREAM_BREAKER_MIN_CALLS,
+    UPSTREAM_BREAKER_WINDOW,
+    UPSTREAM_BREAKER_SLOW_CALL_SECONDS,
+    UPSTREAM_BREAKER_OPEN_SECONDS,
+    UPSTREAM_BREAKER_HALF_OPEN_CALLS,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Every limiter, breaker and single-flight group registers itself here so stats can be reported in one place
+rate_limiters: dict[str, "RateLimiter"] = {}
+circuit_breakers: dict[str, "CircuitBreaker"] = {}
+single_flights: dict[str, "SingleFlight"] = {}
+
+# A throttled bucket never drops below this share of its configured rate
+MIN_RATE_FRACTION = 0.1
+# Share of the configured rate won back by every successful request after throttling
+RECOVERY_FRACTION = 0.05
+
+
+class RetryableUpstreamError(HTTPException):
+    """
+    Upstream failure that may succeed when repeated: timeout, connection error,
+    5xx or 429. `retry_after` is the server's Retry-After in seconds, if any.
+    """
+
+    def __init__(
+        self,
+        status_code: int,
+        detail: str,
+        retry_after: float | None = None,
+        throttled: bool = False,
+    ):
+        headers = {"Retry-After": str(int(retry_after + 0.999))} if retry_after else None
+        super().__init__(status_code=status_code, detail=detail, headers=headers)
+        self.retry_after = retry_after
+        self.throttled = throttled
+
+
+class CircuitOpenError(HTTPException):
+    """Raised without calling the upstream while its circuit breaker is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(
+            status_code=503,
+            detail=f"{name} is unavailable (circuit open), retry in {retry_after:.0f}s",
+            headers={"Retry-After": str(int(retry_after + 0.999))},
+        )
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Seconds to wait from a Retry-After header (delta seconds or HTTP date)"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def status_error(status: int, detail: str, retry_after: str | None = None) -> HTTPException:
+    """
+    HTTPException for a non-200 upstream status: retryable for 429 and 5xx,
+    a plain 502 otherwise.
+    """
+    if status == 429:
+        return RetryableUpstreamError(503, detail, parse_retry_after(retry_after), throttled=True)
+    if status >= 500:
+        return RetryableUpstreamError(502, detail, parse_retry_after(retry_after))
+    return HTTPException(status_code=502, detail=detail)
+
+
+def backoff_delay(
+    attempt: int,
+    base: float = UPSTREAM_RETRY_BASE_DELAY,
+    cap: float = UPSTREAM_RETRY_MAX_DELAY,
+) -> float:
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2^(attempt-1)))"""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class TokenBucket:
+    """
+    Token bucket allowing `rate` requests per second with bursts of up to `burst`.
+
+    Waiters are served in arrival order. `throttle` pauses the bucket and halves
+    its rate; every later success wins back RECOVERY_FRACTION of the configured
+    rate, so a busy upstream is approached again gradually.
+    """
+
+    def __init__(self, rate: float, burst: int | None = None):
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = max(1, burst if burst is not None else int(rate))
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        start = max(self.updated, self.paused_until)
+        if now > start:
+            self.tokens = min(self.burst, self.tokens + (now - start) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> float:
+        """Take one token, waiting for it if needed. Returns the seconds waited"""
+        if self.base_rate <= 0:
+            return 0.0
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    delay = self.paused_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return waited
+                    delay = (1 - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+
+    def throttle(self, pause: float) -> None:
+        """Upstream said slow down: stop issuing for `pause` seconds and halve the rate"""
+        if self.base_rate <= 0:
+            return
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens = 0.0
+        self.paused_until = max(self.paused_until, now + pause)
+        self.rate = max(self.base_rate * MIN_RATE_FRACTION, self.rate / 2)
+
+    def recover(self) -> None:
+        if self.rate < self.base_rate:
+            self.rate = min(self.base_rate, self.rate + self.base_rate * RECOVERY_FRACTION)
+
+
+def endpoint_key(endpoint: str) -> str:
+    """Limiter key of an endpoint: path without query, id-like segments as {id}"""
+    path = endpoint.split("?", 1)[0].strip("/")
+    return "/".join("{id}" if re.search(r"\d", segment) else segment for segment in path.split("/"))
+
+
+class RateLimiter:
+    """
+    Outbound limits of one upstream: a bucket shared by all its requests plus
+    optional buckets for individual endpoints (e.g. {"Item/Add": 10}).
+    """
+
+    def __init__(self, name: str, rate: float, burst: int, endpoint_rates: dict[str, float] | None = None):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.endpoint_buckets = {
+            endpoint: TokenBucket(endpoint_rate) for endpoint, endpoint_rate in (endpoint_rates or {}).items()
+        }
+        self.requests = 0
+        self.delayed = 0
+        self.waited_seconds = 0.0
+        self.retries = 0
+        self.throttled = 0
+        rate_limiters[name] = self
+
+    def _buckets(self, endpoint: str) -> list[TokenBucket]:
+        endpoint_bucket = self.endpoint_buckets.get(endpoint_key(endpoint))
+        return [endpoint_bucket, self.bucket] if endpoint_bucket else [self.bucket]
+
+    async def acquire(self, endpoint: str) -> None:
+        """Wait until a request to `endpoint` is within the limits"""
+        waited = 0.0
+        for bucket in self._buckets(endpoint):
+            waited += await bucket.acquire()
+        self.requests += 1
+        if waited:
+            self.delayed += 1
+            self.waited_seconds += waited
+
+    def throttle(self, endpoint: str, pause: float) -> None:
+        """Pause the buckets of an endpoint (at most UPSTREAM_RETRY_AFTER_MAX seconds) and halve their rate"""
+        pause = min(pause, UPSTREAM_RETRY_AFTER_MAX)
+        self.throttled += 1
+        for bucket in self._buckets(endpoint):
+            bucket.throttle(pause)
+        logger.warning(
+            f"{self.name} throttled on {endpoint_key(endpoint)}: pausing {pause:.1f}s, "
+            f"rate now {self.bucket.rate:g}/s"
+        )
+
+    def succeeded(self, endpoint: str) -> None:
+        for bucket in self._buckets(endpoint):
+            bucket.recover()
+
+    def stats(self) -> dict:
+        return {
+            "rate": self.bucket.base_rate,
+            "current_rate": round(self.bucket.rate, 3),
+            "burst": self.bucket.burst,
+            "endpoint_rates": {
+                endpoint: round(bucket.rate, 3) for endpoint, bucket in self.endpoint_buckets.items()
+            },
+            "requests": self.requests,
+            "delayed": self.delayed,
+            "waited_seconds": round(self.waited_seconds, 3),
+            "retries": self.retries,
+            "throttled": self.throttled,
+        }
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker for one upstream.
+
+    Closed: calls pass and their outcomes are kept for the last `window` seconds.
+    Once at least `min_calls` were seen and the share of failures (retryable
+    errors, or calls slower than `slow_call_seconds`) reaches `failure_rate`,
+    the breaker opens. Open: calls fail fast with CircuitOpenError for
+    `open_seconds`. Half-open: up to `half_open_calls` trial calls go through;
+    if all succeed the breaker closes, any failure opens it again.
+
+    Errors that prove the upstream is up (4xx, REGOS ok:false, 429) count as successes.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate: float = UPSTREAM_BREAKER_FAILURE_RATE,
+        min_calls: int = UPSTREAM_BREAKER_MIN_CALLS,
+        window: float = UPSTREAM_BREAKER_WINDOW,
+        slow_call_seconds: float = UPSTREAM_BREAKER_SLOW_CALL_SECONDS,
+        open_seconds: float = UPSTREAM_BREAKER_OPEN_SECONDS,
+        half_open_calls: int = UPSTREAM_BREAKER_HALF_OPEN_CALLS,
+    ):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_calls = max(1, half_open_calls)
+        self.state = "closed"
+        self.opened_at = 0.0
+        self._outcomes: deque[tuple[float, bool]] = deque()
+        self._trials = 0
+        self._trial_successes = 0
+        self.rejected = 0
+        self.opened = 0
+        self.last_failure: str | None = None
+        circuit_breakers[name] = self
+
+    def _trim(self, now: float) -> None:
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            self._outcomes.popleft()
+
+    def _open(self, now: float) -> None:
+        self.state = "open"
+        self.opened_at = now
+        self.opened += 1
+        self._outcomes.clear()
+        logger.warning(f"{self.name} circuit opened for {self.open_seconds:g}s (last failure: {self.last_failure})")
+
+    def check(self) -> None:
+        """Raise CircuitOpenError while the breaker is open"""
+        if self.state == "open":
+            remaining = self.opened_at + self.open_seconds - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, remaining)
+
+    def before_call(self) -> None:
+        """Admit a call or raise CircuitOpenError. Every admitted call must be followed by after_call"""
+        self.check()
+        if self.state == "open":
+            self.state = "half_open"
+            self._trials = 0
+            self._trial_successes = 0
+            logger.info(f"{self.name} circuit half-open, sending trial calls")
+        if self.state == "half_open":
+            if self._trials >= self.half_open_calls:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, 1)
+            self._trials += 1
+
+    def after_call(self, failed: bool | None, elapsed: float = 0.0, error: str | None = None) -> None:
+        """
+        Record the outcome of an admitted call.
+
+        Args:
+            failed: True for a failure, False for a success, None if the call was abandoned (no verdict)
+            elapsed: Seconds the call took; slower than slow_call_seconds counts as a failure
+            error: Failure description shown in the status
+        """
+        now = time.monotonic()
+        if failed is False and elapsed > self.slow_call_seconds:
+            failed = True
+            error = f"slow call ({elapsed:.1f}s)"
+        if failed:
+            self.last_failure = error
+        if self.state == "half_open":
+            if failed is None:
+                self._trials -= 1
+            elif failed:
+                self._open(now)
+            else:
+                self._trial_successes += 1
+                if self._trial_successes >= self.half_open_calls:
+                    self.state = "closed"
+                    logger.info(f"{self.name} circuit closed")
+            return
+        if self.state != "closed" or failed is None:
+            return
+        self._outcomes.append((now, failed))
+        self._trim(now)
+        calls = len(self._outcomes)
+        if calls >= self.min_calls and sum(1 for _, f in self._outcomes if f) / calls >= self.failure_rate:
+            self._open(now)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        self._trim(now)
+        calls = len(self._outcomes)
+        failures = sum(1 for _, failed in self._outcomes if failed)
+        return {
+            "state": self.state,
+            "retry_in_seconds": (
+                round(max(0.0, self.opened_at + self.open_seconds - now), 1) if self.state == "open" else None
+            ),
+            "window_calls": calls,
+            "window_failure_rate": round(failures / calls, 4) if calls else None,
+            "failure_rate_threshold": self.failure_rate,
+            "slow_call_seconds": self.slow_call_seconds,
+            "times_opened": self.opened,
+            "rejected": self.rejected,
+            "last_failure": self.last_failure,
+        }
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: while a call for a key is in flight,
+    later callers with the same key wait for its result instead of calling again.
+
+    The call runs in its own task, so a caller that is cancelled does not cancel
+    it for the others. Waiters get a deep copy of the result, so nobody sees
+    another caller's mutations. Only use it for reads.
+
+    Coalescers of an upstream register under its name for upstream_status and
+    /metrics; pass register=False for other uses (e.g. local caches).
+    """
+
+    def __init__(self, name: str, register: bool = True):
+        self.name = name
+        self._in_flight: dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.saved = 0
+        if register:
+            single_flights[name] = self
+
+    def _done(self, key: str, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved in case every caller was cancelled
+            task.exception()
+
+    async def do(self, key: str, call: Callable[[], Awaitable[T]]) -> T:
+        """Return the result of call(), sharing it with concurrent callers of the same key"""
+        task = self._in_flight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.create_task(call())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._done(key, done))
+            return await asyncio.shield(task)
+        self.saved += 1
+        return copy.deepcopy(await asyncio.shield(task))
+
+    def stats(self) -> dict:
+        requested = self.calls + self.saved
+        return {
+            "calls": self.calls,
+            "saved_calls": self.saved,
+            "in_flight": len(self._in_flight),
+            "saved_rate": round(self.saved / requested, 4) if requested else None,
+        }
+
+
+def upstream_status() -> dict:
+    """Breaker state, limiter and single-flight counters of every upstream"""
+    return {
+        name: {
+            "circuit": circuit_breakers[name].stats() if name in circuit_breakers else None,
+            "rate_limit": rate_limiters[name].stats() if name in rate_limiters else None,
+            "single_flight": single_flights[name].stats() if name in single_flights else None,
+        }
+        for name in sorted(set(rate_limiters) | set(circuit_breakers) | set(single_flights))
+    }
+
+
+async def _observed(upstream: str, endpoint: str, send: Callable[[], Awaitable[T]]) -> T:
+    """Run one upstream request, recording its latency, outcome and the in-flight gauge"""
+    labels = {"upstream": upstream, "endpoint": endpoint_key(endpoint)}
+    upstream_requests_in_flight.inc(**labels)
+    started = time.perf_counter()
+    try:
+        return await send()
+    except HTTPException as e:
+        upstream_errors_total.inc(status=e.status_code, **labels)
+        raise
+    except Exception:
+        upstream_errors_total.inc(status="error", **labels)
+        raise
+    finally:
+        upstream_requests_in_flight.dec(**labels)
+        upstream_request_duration_seconds.observe(time.perf_counter() - started, **labels)
+
+
+async def _guarded(breaker: CircuitBreaker | None, send: Callable[[], Awaitable[T]]) -> T:
+    """Run one call through the breaker (if any), recording its outcome"""
+    if breaker is None:
+        return await send()
+    breaker.before_call()
+    started = time.monotonic()
+    failed: bool | None = None
+    error = None
+    try:
+        result = await send()
+        failed = False
+        return result
+    except RetryableUpstreamError as e:
+        # Throttling means the upstream is alive and answering
+        failed = not e.throttled
+        error = str(e.detail)
+        raise
+    except HTTPException:
+        failed = False
+        raise
+    except Exception as e:
+        failed = True
+        error = str(e) or e.__class__.__name__
+        raise
+    finally:
+        breaker.after_call(failed, time.monotonic() - started, error)
+
+
+async def call_with_retry(
+    limiter: RateLimiter,
+    endpoint: str,
+    send: Callable[[], Awaitable[T]],
+    idempotent: bool,
+    retries: int = UPSTREAM_RETRY_ATTEMPTS,
+    breaker: CircuitBreaker | None = None,
+) -> T:
+    """
+    Run `send` within the limiter and circuit breaker, retrying RetryableUpstreamError.
+
+    Idempotent calls are retried up to `retries` times on any retryable error.
+    Other calls are only retried when throttled (429), which the upstream sends
+    before doing any work. The delay is Retry-After when the upstream sent one,
+    exponential backoff with full jitter otherwise. An open breaker fails the
+    call (or the next retry) immediately with CircuitOpenError.
+    """
+    attempt = 1
+    while True:
+        if breaker is not None:
+            # Fail fast before waiting for a rate limit token
+            breaker.check()
+        await limiter.acquire(endpoint)
+        try:
+            result = await _guarded(breaker, lambda: _observed(limiter.name, endpoint, send))
+        except RetryableUpstreamError as e:
+            delay = e.retry_after if e.retry_after is not None else backoff_delay(attempt)
+            if attempt > retries or not (idempotent or e.throttled) or delay > UPSTREAM_RETRY_AFTER_MAX:
+                raise
+            if e.throttled:
+                limiter.throttle(endpoint, delay)
+            limiter.retries += 1
+            logger.warning(
+                f"{limiter.name} {endpoint_key(endpoint)} failed ({e.detail}); "
+                f"retry {attempt}/{retries} in {delay:.2f}s"
+            )
+            attempt += 1
+            if not e.throttled:
+                # A throttled bucket already holds the next acquire back for `delay`
+                await asyncio.sleep(delay)
+            continue
+        limiter.succeeded(endpoint)
+        return result
+
+
+CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+@register_collector
+def _upstream_metrics():
+    """Breaker, limiter and single-flight counters for /metrics"""
+    families = {
+        "upstream_circuit_state": ("gauge", "Circuit breaker state: 0 closed, 1 half-open, 2 open", []),
+        "upstream_circuit_rejected_total": ("counter", "Calls failed fast by an open circuit", []),
+        "upstream_rate_limit_delayed_total": ("counter", "Requests held back by the rate limiter", []),
+        "upstream_rate_limit_wait_seconds_total": ("counter", "Time spent waiting for the rate limiter", []),
+        "upstream_rate_limit_current_rate": ("gauge", "Current allowed requests per second", []),
+        "upstream_retries_total": ("counter", "Retried upstream requests", []),
+        "upstream_throttled_total": ("counter", "429 responses from the upstream", []),
+        "upstream_single_flight_saved_total": ("counter", "Reads answered by an identical in-flight request", []),
+    }
+    for name, status in upstream_status().items():
+        labels = {"upstream": name}
+        if status["circuit"]:
+            families["upstream_circuit_state"][2].append((labels, CIRCUIT_STATES.get(status["circuit"]["state"], 0)))
+            families["upstream_circuit_rejected_total"][2].append((labels, status["circuit"]["rejected"]))
+        if status["rate_limit"]:
+            rate_limit = status["rate_limit"]
+            families["upstream_rate_limit_delayed_total"][2].append((labels, rate_limit["delayed"]))
+            families["upstream_rate_limit_wait_seconds_total"][2].append((labels, rate_limit["waited_seconds"]))
+            families["upstream_rate_limit_current_rate"][2].append((labels, rate_limit["current_rate"]))
+            families["upstream_retries_total"][2].append((labels, rate_limit["retries"]))
+            families["upstream_throttled_total"][2].append((labels, rate_limit["throttled"]))
+        if status["single_flight"]:
+            families["upstream_single_flight_saved_total"][2].append((labels, status["single_flight"]["saved_calls"]))
+    return [(name, kind, documentation, samples) for name, (kind, documentation, samples) in families.items()]
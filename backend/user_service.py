@@ -4,7 +4,7 @@ Service for managing users
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from backend.database import User
-from backend.auth import get_password_hash
+from backend.auth import get_password_hash_async, invalidate_user
 
 
 async def get_user_by_username(db: AsyncSession, username: str) -> User | None:
@@ -20,7 +20,7 @@ async def create_user(
     is_superuser: bool = False
 ) -> User:
     """Create a new user"""
-    password_hash = get_password_hash(password)
+    password_hash = await get_password_hash_async(password)
     user = User(
         username=username,
         password_hash=password_hash,
@@ -29,6 +29,7 @@ async def create_user(
     db.add(user)
     await db.flush()
     await db.refresh(user)
+    invalidate_user(username)
     return user
 
 
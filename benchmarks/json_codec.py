@@ -0,0 +1,110 @@
+"""
+JSON benchmark: the stdlib json / FastAPI path vs. the orjson path in backend/json_codec.py.
+
+Measures CPU time per call for the three places JSON is handled on the request path:
+    encode_regos_body   PurchaseOperation/Add body of --rows Decimal-heavy operations
+                        (json.dumps of model_dump(mode="json") vs. json_codec.dumps)
+    decode_didox_detail Didox document detail with --products products
+                        (json.loads vs. json_codec.loads)
+    render_response     the same detail returned from a route
+                        (jsonable_encoder + JSONResponse vs. ORJSONResponse)
+
+Usage:
+    python benchmarks/json_codec.py --rows 2000 --products 500
+"""
+import argparse
+import copy
+import json
+import sys
+import time
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+ROOT = Path(__file__).parent.parent
+
+
+def cpu_per_call(call, number: int, repeat: int = 5) -> float:
+    """Best CPU seconds per call over `repeat` rounds of `number` calls"""
+    call()
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.process_time()
+        for _ in range(number):
+            call()
+        best = min(best, (time.process_time() - started) / number)
+    return best
+
+
+def detail_payload(products: int) -> dict:
+    """Recorded Didox detail with its productlist grown to `products` rows"""
+    detail = json.loads(next(ROOT.glob("documents_*.json")).read_text(encoding="utf-8"))
+    productlist = detail["data"]["json"]["productlist"]
+    template = productlist["products"]
+    productlist["products"] = [
+        {**copy.deepcopy(template[n % len(template)]), "ordno": n + 1} for n in range(products)
+    ]
+    return detail
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000, help="Purchase operations in the REGOS body")
+    parser.add_argument("--products", type=int, default=500, help="Products in the Didox detail")
+    parser.add_argument("--number", type=int, default=20, help="Calls per round")
+    args = parser.parse_args()
+
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from backend import json_codec
+    from backend.routes.regos import AddPurchaseOperationRequest
+
+    request = AddPurchaseOperationRequest.model_validate({
+        "operations": [
+            {
+                "document_id": 1,
+                "item_id": n + 1,
+                "quantity": Decimal("12.500"),
+                "cost": Decimal("15300.75"),
+                "price": Decimal("18900.00"),
+                "vat_value": Decimal("12"),
+                "description": f"Строка {n}",
+            }
+            for n in range(args.rows)
+        ]
+    })
+    operations = [item.model_dump(mode="json", exclude_none=True) for item in request.operations]
+    detail = detail_payload(args.products)
+    detail_bytes = json.dumps(detail, ensure_ascii=False).encode("utf-8")
+    assert json_codec.loads(detail_bytes) == json.loads(detail_bytes)
+    assert json_codec.loads(json_codec.dumps(operations)) == json.loads(json.dumps(operations))
+
+    cases = {
+        "encode_regos_body": (
+            lambda: json.dumps(operations),
+            lambda: json_codec.dumps(operations),
+        ),
+        "decode_didox_detail": (
+            lambda: json.loads(detail_bytes),
+            lambda: json_codec.loads(detail_bytes),
+        ),
+        "render_response": (
+            lambda: JSONResponse(jsonable_encoder(detail)).body,
+            lambda: json_codec.ORJSONResponse(detail).body,
+        ),
+    }
+
+    print(f"{len(detail_bytes) / 1024:.0f} KiB detail payload, {args.rows} operations\n")
+    print(f"{'case':<22}{'stdlib ms':>12}{'orjson ms':>12}{'speedup':>10}{'CPU saved':>11}")
+    for name, (stdlib_call, fast_call) in cases.items():
+        stdlib = cpu_per_call(stdlib_call, args.number)
+        fast = cpu_per_call(fast_call, args.number)
+        print(
+            f"{name:<22}{stdlib * 1000:>12.3f}{fast * 1000:>12.3f}{stdlib / fast:>9.1f}x"
+            f"{1 - fast / stdlib:>11.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Login throughput benchmark: bcrypt verification inline vs. in the bcrypt thread pool.
+
+Runs a burst of concurrent password checks (the CPU work of /api/auth/user-login)
+while a probe task measures event loop lag, i.e. how long every other in-flight
+request would be stalled.
+
+Usage:
+    python benchmarks/login_throughput.py --logins 32 --concurrency 16 --rounds 12
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def probe_lag(stop: asyncio.Event, interval: float, lags: list[float]) -> None:
+    """Sleep `interval` in a loop and record how late each wake-up is"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - started - interval)
+
+
+async def run(mode: str, logins: int, concurrency: int, password: str, password_hash: str) -> dict:
+    from backend.auth import verify_password, verify_password_async
+
+    async def verify_inline(plain_password: str, hashed_password: str) -> bool:
+        # What the login route did before: bcrypt directly on the event loop
+        return verify_password(plain_password, hashed_password)
+
+    check = verify_password_async if mode == "pool" else verify_inline
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def login() -> None:
+        async with semaphore:
+            assert await check(password, password_hash)
+
+    lags: list[float] = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_lag(stop, 0.005, lags))
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe
+
+    lags_ms = [lag * 1000 for lag in lags] or [0.0]
+    return {
+        "mode": mode,
+        "logins_per_second": round(logins / elapsed, 2),
+        "elapsed_seconds": round(elapsed, 3),
+        "loop_lag_p50_ms": round(statistics.median(lags_ms), 2),
+        "loop_lag_p99_ms": round(percentile(lags_ms, 99), 2),
+        "loop_lag_max_ms": round(max(lags_ms), 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=32, help="Number of logins in the burst")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent logins")
+    parser.add_argument("--rounds", type=int, default=None, help="bcrypt work factor (default: BCRYPT_ROUNDS)")
+    parser.add_argument("--pool-size", type=int, default=None, help="bcrypt threads (default: BCRYPT_POOL_SIZE)")
+    parser.add_argument("--mode", choices=["inline", "pool", "both"], default="both")
+    args = parser.parse_args()
+
+    # Settings are read from the environment when backend.config is imported
+    if args.rounds is not None:
+        os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    if args.pool_size is not None:
+        os.environ["BCRYPT_POOL_SIZE"] = str(args.pool_size)
+
+    from backend.auth import get_password_hash
+    from backend.config import BCRYPT_ROUNDS, BCRYPT_POOL_SIZE
+
+    password = "benchmark-password"
+    password_hash = get_password_hash(password)
+    print(f"bcrypt rounds={BCRYPT_ROUNDS}, pool size={BCRYPT_POOL_SIZE}, "
+          f"logins={args.logins}, concurrency={args.concurrency}")
+
+    modes = ["inline", "pool"] if args.mode == "both" else [args.mode]
+    for mode in modes:
+        result = asyncio.run(run(mode, args.logins, args.concurrency, password, password_hash))
+        print(
+            f"{result['mode']:>6}: {result['logins_per_second']:8.2f} logins/s  "
+            f"loop lag p50={result['loop_lag_p50_ms']}ms p99={result['loop_lag_p99_ms']}ms "
+            f"max={result['loop_lag_max_ms']}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+"""
+Micro-benchmarks of the request hot paths, compared against a stored baseline.
+
+Cases:
+    regos_request       regos_async_api_request (Item/Get, 100 items) against the local REGOS stub
+    didox_request       didox_async_api_request (documents list) against the local Didox stub
+    validate_add_items  AddItemRequest validation of --rows items
+    validate_operations AddPurchaseOperationRequest validation of --rows operations
+    dump_operations     model_dump(mode='json') of --rows Decimal-heavy operations
+    json_encode_body    json_codec.dumps of the --rows operations sent to REGOS
+    json_decode_detail  json_codec.loads of a Didox detail with --rows / 4 products
+    render_detail       ORJSONResponse of that detail, as GET /api/documents/{id} returns it
+    jwt_encode          create_access_token
+    jwt_decode          jwt.decode of an access token
+    auth_lookup         user_from_token with an empty principal cache (JWT + DB lookup)
+    auth_cached         user_from_token served from the principal cache
+
+Each case runs --repeat timed rounds after a warm-up; its time is the fastest
+round (the least disturbed by other load, as with timeit). A fixed pure-Python
+workload is timed before and after the cases and every case is compared with
+benchmarks/baseline.json relative to it, so a machine that is uniformly faster
+or slower than the one that recorded the baseline (or a noisy CI runner) does
+not show up as a change. The run exits with status 1 when any case is more than
+--threshold slower. Pass --raw to compare absolute times instead.
+
+Usage:
+    python benchmarks/suite.py                      # compare with the baseline
+    python benchmarks/suite.py --save-baseline      # record a new baseline
+    python benchmarks/suite.py --cases jwt_encode,jwt_decode --threshold 0.5
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from decimal import Decimal
+from pathlib import Path
+from typing import Awaitable, Callable
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+
+# name -> async setup(context) returning the call to time (sync or async, no arguments)
+Case = Callable[[dict], Awaitable[Callable]]
+CASES: dict[str, Case] = {}
+
+
+def benchmark(name: str):
+    def register(case: Case) -> Case:
+        CASES[name] = case
+        return case
+    return register
+
+
+def add_item_rows(rows: int) -> list[dict]:
+    return [
+        {
+            "group_id": 1,
+            "vat_id": 1,
+            "unit_id": 1,
+            "type": "Товар",
+            "name": f"Benchmark item {n}",
+            "fullname": f"Benchmark item {n} full name",
+            "articul": f"A{n}",
+            "icps": f"{10000000000000 + n}",
+            "package_code": "1500535",
+            "origin": "Купля продажа",
+        }
+        for n in range(rows)
+    ]
+
+
+def operation_rows(rows: int) -> list[dict]:
+    return [
+        {
+            "document_id": 1,
+            "item_id": n + 1,
+            "quantity": "12.500",
+            "cost": "15300.75",
+            "price": "18900.00",
+            "vat_value": "12",
+            "description": f"Row {n}",
+        }
+        for n in range(rows)
+    ]
+
+
+@benchmark("regos_request")
+async def regos_request(context: dict) -> Callable:
+    from regos.api import regos_async_api_request
+
+    return lambda: regos_async_api_request("Item/Get", {"offset": 0, "limit": 100})
+
+
+@benchmark("didox_request")
+async def didox_request(context: dict) -> Callable:
+    from didox.api import didox_async_api_request
+
+    return lambda: didox_async_api_request(
+        "documents", {"owner": 0, "page": 1, "limit": 20}, user_key="benchmark-user-key"
+    )
+
+
+@benchmark("validate_add_items")
+async def validate_add_items(context: dict) -> Callable:
+    from pydantic import TypeAdapter
+    from backend.routes.regos import AddItemRequest
+
+    adapter = TypeAdapter(list[AddItemRequest])
+    rows = add_item_rows(context["rows"])
+    return lambda: adapter.validate_python(rows)
+
+
+@benchmark("validate_operations")
+async def validate_operations(context: dict) -> Callable:
+    from backend.routes.regos import AddPurchaseOperationRequest
+
+    payload = {"operations": operation_rows(context["rows"])}
+    return lambda: AddPurchaseOperationRequest.model_validate(payload)
+
+
+@benchmark("dump_operations")
+async def dump_operations(context: dict) -> Callable:
+    from backend.routes.regos import AddPurchaseOperationRequest
+
+    request = AddPurchaseOperationRequest.model_validate({"operations": operation_rows(context["rows"])})
+    assert isinstance(request.operations[0].cost, Decimal)
+    # The shape add-purchase-operation sends to REGOS
+    return lambda: [item.model_dump(mode="json", exclude_none=True) for item in request.operations]
+
+
+@benchmark("json_encode_body")
+async def json_encode_body(context: dict) -> Callable:
+    from backend.json_codec import dumps
+    from backend.routes.regos import AddPurchaseOperationRequest
+
+    request = AddPurchaseOperationRequest.model_validate({"operations": operation_rows(context["rows"])})
+    operations = [item.model_dump(mode="json", exclude_none=True) for item in request.operations]
+    return lambda: dumps(operations)
+
+
+@benchmark("json_decode_detail")
+async def json_decode_detail(context: dict) -> Callable:
+    from benchmarks.json_codec import detail_payload
+    from backend.json_codec import dumps, loads
+
+    payload = dumps(detail_payload(context["rows"] // 4))
+    return lambda: loads(payload)
+
+
+@benchmark("render_detail")
+async def render_detail(context: dict) -> Callable:
+    from benchmarks.json_codec import detail_payload
+    from backend.json_codec import ORJSONResponse
+
+    detail = detail_payload(context["rows"] // 4)
+    return lambda: ORJSONResponse(detail)
+
+
+@benchmark("jwt_encode")
+async def jwt_encode(context: dict) -> Callable:
+    from backend.auth import create_access_token
+
+    return lambda: create_access_token(data={"sub": "benchmark"})
+
+
+@benchmark("jwt_decode")
+async def jwt_decode(context: dict) -> Callable:
+    from jose import jwt
+    from backend.auth import create_access_token, SECRET_KEY, ALGORITHM
+
+    token = create_access_token(data={"sub": "benchmark"})
+    return lambda: jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+
+@benchmark("auth_lookup")
+async def auth_lookup(context: dict) -> Callable:
+    from backend.auth import principal_cache, user_from_token
+
+    token = context["token"]
+
+    async def lookup():
+        principal_cache.invalidate()
+        assert await user_from_token(token) is not None
+
+    return lookup
+
+
+@benchmark("auth_cached")
+async def auth_cached(context: dict) -> Callable:
+    from backend.auth import user_from_token
+
+    token = context["token"]
+    assert await user_from_token(token) is not None
+    return lambda: user_from_token(token)
+
+
+CALIBRATION = "calibration"
+
+
+def calibration_workload() -> None:
+    """Interpreter-bound reference work: dict, string and sorting operations"""
+    table = {f"key-{n}": n * 3 for n in range(2000)}
+    sorted(table, key=lambda key: table[key] % 97)
+    "".join(key.upper() for key in table)
+
+
+async def time_case(call: Callable, repeat: int, number: int, warmup: int) -> list[float]:
+    """Seconds per call of each of `repeat` rounds of `number` calls (GC off while timing, like timeit)"""
+    is_async = asyncio.iscoroutinefunction(call)
+
+    async def invoke():
+        result = call()
+        if is_async or asyncio.iscoroutine(result):
+            await result
+
+    for _ in range(warmup):
+        await invoke()
+    rounds = []
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for _ in range(number):
+                await invoke()
+            rounds.append((time.perf_counter() - started) / number)
+    finally:
+        gc.enable()
+    return rounds
+
+
+async def setup_environment(context: dict) -> list:
+    """Local stubs and a throwaway database with one user; returns what to clean up"""
+    from loadtest.stubs import StubProfile, start_stubs
+    from backend.auth import create_access_token
+    from backend.database import AsyncSessionLocal, init_db
+    from backend.user_service import create_user
+    from regos.api import regos_client
+    from didox.api import didox_client
+
+    runners = await start_stubs(
+        StubProfile(latency_ms=0, jitter_ms=0, documents=100, catalog_size=1000),
+        regos_port=context["regos_port"],
+        didox_port=context["didox_port"],
+    )
+    await init_db()
+    async with AsyncSessionLocal() as db:
+        await create_user(db, "benchmark", "benchmark-password")
+        await db.commit()
+    context["token"] = create_access_token(data={"sub": "benchmark"})
+    await regos_client.open()
+    await didox_client.open()
+    return runners
+
+
+async def teardown_environment(runners: list) -> None:
+    from backend.database import engine
+    from regos.api import regos_client
+    from didox.api import didox_client
+
+    await regos_client.close()
+    await didox_client.close()
+    for runner in runners:
+        await runner.cleanup()
+    await engine.dispose()
+
+
+async def run(names: list[str], args: argparse.Namespace, context: dict) -> dict:
+    runners = await setup_environment(context)
+    results = {}
+    calibration_rounds = []
+    try:
+        calibration_rounds += await time_case(calibration_workload, args.repeat, 20, args.warmup)
+        for name in names:
+            call = await CASES[name](context)
+            # Fewer calls per round for the expensive cases so every case takes similar time
+            probe = await time_case(call, 1, 10, 1)
+            number = max(1, int(args.round_seconds / max(probe[0], 1e-7)))
+            rounds = await time_case(call, args.repeat, number, args.warmup)
+            results[name] = {
+                "median_ms": round(statistics.median(rounds) * 1000, 4),
+                "min_ms": round(min(rounds) * 1000, 4),
+                "stdev_ms": round(statistics.stdev(rounds) * 1000, 4) if len(rounds) > 1 else 0.0,
+                "calls_per_round": number,
+            }
+            print(f"{name:<22}{results[name]['min_ms']:>12.4f} ms/call  (median {results[name]['median_ms']:.4f}, "
+                  f"{number} calls x {args.repeat} rounds)")
+        calibration_rounds += await time_case(calibration_workload, args.repeat, 20, 0)
+    finally:
+        await teardown_environment(runners)
+    results[CALIBRATION] = {"min_ms": round(min(calibration_rounds) * 1000, 4)}
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float, raw: bool = False) -> list[str]:
+    """Names of cases slower than the baseline by more than `threshold`"""
+    # How much faster or slower this machine runs the reference work than the baseline machine
+    speed = 1.0
+    if not raw:
+        speed = results[CALIBRATION]["min_ms"] / baseline["cases"][CALIBRATION]["min_ms"]
+        print(f"\nCalibration: this run is {speed:.2f}x the baseline machine's time; changes are relative to that")
+    regressions = []
+    print(f"\n{'case':<22}{'baseline ms':>14}{'current ms':>14}{'change':>10}")
+    for name, result in results.items():
+        if name == CALIBRATION:
+            continue
+        reference = baseline.get("cases", {}).get(name)
+        if reference is None:
+            print(f"{name:<22}{'-':>14}{result['min_ms']:>14.4f}{'new':>10}")
+            continue
+        change = result["min_ms"] / (reference["min_ms"] * speed) - 1
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"{name:<22}{reference['min_ms']:>14.4f}{result['min_ms']:>14.4f}{change:>+10.1%}{flag}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", default=None, help=f"Comma-separated subset of: {', '.join(CASES)}")
+    parser.add_argument("--rows", type=int, default=2000, help="Rows in the validation / serialization cases")
+    parser.add_argument("--repeat", type=int, default=7, help="Timed rounds per case")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed calls before the rounds")
+    parser.add_argument("--round-seconds", type=float, default=0.2, help="Target duration of one round")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown before failing (0.25 = 25%%)")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--raw", action="store_true", help="Compare absolute times, without calibration")
+    args = parser.parse_args()
+
+    names = args.cases.split(",") if args.cases else list(CASES)
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        parser.error(f"Unknown cases: {', '.join(unknown)}")
+
+    from loadtest.run import free_port
+    from loadtest.stubs import stub_env
+
+    workdir = tempfile.TemporaryDirectory(prefix="regos-didox-benchmark-")
+    context = {"rows": args.rows, "regos_port": free_port(), "didox_port": free_port()}
+    # Settings are read from the environment when backend.config is imported
+    os.environ.update({
+        **stub_env("127.0.0.1", context["regos_port"], context["didox_port"]),
+        "DATABASE_URL": f"sqlite+aiosqlite:///{Path(workdir.name) / 'benchmark.db'}",
+        "REGOS_TOKEN": "benchmark",
+        "BCRYPT_ROUNDS": "4",
+        # Measure the client, not the rate limiters
+        "REGOS_RATE_LIMIT": "1000000",
+        "REGOS_RATE_BURST": "1000000",
+        "DIDOX_RATE_LIMIT": "1000000",
+        "DIDOX_RATE_BURST": "1000000",
+    })
+    import logging
+    logging.disable(logging.INFO)
+
+    try:
+        results = asyncio.run(run(names, args, context))
+    finally:
+        workdir.cleanup()
+
+    if args.save_baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline.exists() else {}
+        reference = baseline.get("cases", {}).get(CALIBRATION)
+        if args.cases and reference:
+            # Updating some cases: keep them comparable with the others by scaling to the stored calibration
+            scale = reference["min_ms"] / results.pop(CALIBRATION)["min_ms"]
+            for result in results.values():
+                for key in ("median_ms", "min_ms", "stdev_ms"):
+                    result[key] = round(result[key] * scale, 4)
+        baseline.update({
+            "python": platform.python_version(),
+            "machine": f"{platform.system()} {platform.machine()}",
+            "rows": args.rows,
+            "cases": {**baseline.get("cases", {}), **results},
+        })
+        args.baseline.write_text(json.dumps(baseline, indent=2) + "\n", encoding="utf-8")
+        print(f"\nBaseline written to {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print(f"\nNo baseline at {args.baseline}; record one with --save-baseline")
+        return
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    if baseline.get("rows") != args.rows:
+        print(f"Note: baseline was recorded with --rows {baseline.get('rows')}")
+    regressions = compare(results, baseline, args.threshold, args.raw)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print(f"\nNo regressions above {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
-import aiohttp
-import json
+import httpx
 import asyncio
+import importlib.util
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from urllib.parse import urlsplit
 
 from fastapi import HTTPException
 import logging
@@ -9,16 +12,184 @@ import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
-from backend.config import DIDOX_BASE_URL, PARTNER_TOKEN, DIDOX_PARTNER_BASE_URL
+from backend.config import (
+    DIDOX_BASE_URL,
+    PARTNER_TOKEN,
+    DIDOX_PARTNER_BASE_URL,
+    DIDOX_POOL_SIZE,
+    DIDOX_MAX_KEEPALIVE_CONNECTIONS,
+    DIDOX_KEEPALIVE_EXPIRY,
+    DIDOX_MAX_CONCURRENCY_PER_HOST,
+    DIDOX_HTTP2,
+    DIDOX_RATE_LIMIT,
+    DIDOX_RATE_BURST,
+    DIDOX_ENDPOINT_RATE_LIMITS,
+)
+from backend.upstream import (
+    CircuitBreaker,
+    RateLimiter,
+    RetryableUpstreamError,
+    SingleFlight,
+    call_with_retry,
+    status_error,
+)
+from backend.cache import cache_key
+from backend.json_codec import dumps as json_dumps, loads as json_loads
 from didox.utils import write_json_file
 
 logger = logging.getLogger(__name__)
 
+
+class DidoxClient:
+    """
+    Single pooled HTTP transport for every Didox call.
+
+    One httpx client keeps persistent connections to both DIDOX_BASE_URL and
+    DIDOX_PARTNER_BASE_URL (HTTP/2 when the server offers it and `h2` is installed).
+    Concurrent requests to the same host are capped by a per-host semaphore.
+    The FastAPI lifespan opens and closes it; scripts get a lazily opened client.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = DIDOX_POOL_SIZE,
+        max_keepalive_connections: int = DIDOX_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = DIDOX_KEEPALIVE_EXPIRY,
+        max_concurrency_per_host: int = DIDOX_MAX_CONCURRENCY_PER_HOST,
+        http2: bool = DIDOX_HTTP2,
+    ):
+        self.pool_size = pool_size
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.max_concurrency_per_host = max_concurrency_per_host
+        self.http2 = http2
+        self._client: httpx.AsyncClient | None = None
+        self._host_semaphores: dict[str, asyncio.Semaphore] = {}
+
+    @property
+    def closed(self) -> bool:
+        return self._client is None or self._client.is_closed
+
+    async def open(self) -> httpx.AsyncClient:
+        """Create the pooled client if it is not open yet"""
+        if self.closed:
+            http2 = self.http2
+            if http2 and importlib.util.find_spec("h2") is None:
+                logger.warning("HTTP/2 requested for Didox but 'h2' is not installed, using HTTP/1.1")
+                http2 = False
+            limits = httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            )
+            self._client = httpx.AsyncClient(limits=limits, http2=http2)
+            self._host_semaphores = {}
+            logger.info(
+                f"Didox connection pool opened (limit={self.pool_size}, "
+                f"per_host={self.max_concurrency_per_host}, http2={http2})"
+            )
+        return self._client
+
+    async def get_client(self) -> httpx.AsyncClient:
+        """Return the shared client, opening it lazily if needed"""
+        if self.closed:
+            return await self.open()
+        return self._client
+
+    async def close(self) -> None:
+        """Close the pooled client and release all connections"""
+        if not self.closed:
+            await self._client.aclose()
+            logger.info("Didox connection pool closed")
+        self._client = None
+        self._host_semaphores = {}
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency_per_host)
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    @asynccontextmanager
+    async def host_slot(self, url: str):
+        """Hold one of the per-host concurrency slots for the duration of a request"""
+        async with self._host_semaphore(url):
+            yield
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request over the shared pool, respecting the per-host concurrency cap"""
+        client = await self.get_client()
+        async with self.host_slot(url):
+            return await client.request(method, url, **kwargs)
+
+    async def open_stream(self, method: str, url: str, **kwargs) -> "DidoxStream":
+        """
+        Send a request and return as soon as the response headers arrive, body unread.
+        The per-host slot is held until the returned stream is closed.
+        """
+        client = await self.get_client()
+        semaphore = self._host_semaphore(url)
+        await semaphore.acquire()
+        try:
+            response = await client.send(client.build_request(method, url, **kwargs), stream=True)
+        except BaseException:
+            semaphore.release()
+            raise
+        return DidoxStream(response, semaphore)
+
+
+class DidoxStream:
+    """Didox response whose body is forwarded as it arrives instead of being parsed"""
+
+    # Headers that describe the raw body and are passed on to our client unchanged
+    FORWARDED_HEADERS = ("content-type", "content-encoding", "content-length")
+
+    def __init__(self, response: httpx.Response, semaphore: asyncio.Semaphore):
+        self.response = response
+        self._semaphore = semaphore
+        self._closed = False
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return {name: self.response.headers[name] for name in self.FORWARDED_HEADERS if name in self.response.headers}
+
+    async def body(self) -> AsyncIterator[bytes]:
+        """Raw body chunks, still content-encoded as Didox sent them; closes the stream at the end"""
+        try:
+            async for chunk in self.response.aiter_raw():
+                yield chunk
+        finally:
+            await self.aclose()
+
+    async def aclose(self) -> None:
+        """Release the connection and the per-host slot (safe to call more than once)"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            await self.response.aclose()
+        finally:
+            self._semaphore.release()
+
+
+# Shared client used by didox/api.py and didox/login.py
+didox_client = DidoxClient()
+
+# Limits for both Didox hosts; endpoint limits are keyed like "documents/{id}"
+didox_limiter = RateLimiter("didox", DIDOX_RATE_LIMIT, DIDOX_RATE_BURST, DIDOX_ENDPOINT_RATE_LIMITS)
+# Fails Didox calls fast while the API is down or unusably slow
+didox_breaker = CircuitBreaker("didox")
+# Identical concurrent GETs (same user_key, URL and params) share one request
+didox_single_flight = SingleFlight("didox")
+
+
 async def didox_async_api_request(
-                                    endpoint: str, 
+                                    endpoint: str,
                                     request_data: dict | list = None,
                                     user_key: str | None = None,
-                                    base_url: str = DIDOX_BASE_URL, 
+                                    base_url: str = DIDOX_BASE_URL,
                                     partner_auth: str = PARTNER_TOKEN,
                                     timeout_seconds: int = 60,
                                     method: str = "GET"
@@ -27,6 +198,11 @@ async def didox_async_api_request(
     Make an asynchronous request to the Didox API.
     Based on working test.py implementation.
 
+    Requests go through the Didox rate limiter. GET requests are retried with
+    backoff on timeouts, connection errors, 5xx and 429; POST requests only on 429.
+    While the Didox circuit breaker is open, requests fail fast with 503.
+    Identical concurrent GET requests of the same user share one request.
+
     Parameters:
         endpoint (str): The specific API endpoint to call (e.g., "documents").
         request_data (dict | list): Query parameters for GET requests or body data for POST requests.
@@ -41,71 +217,191 @@ async def didox_async_api_request(
     Raises:
         HTTPException: For various API errors including timeouts, client errors, and non-200 status codes.
     """
-    # Construct full URL - matching test.py format: f"{base_url}/documents"
-    endpoint = endpoint.lstrip('/')
-    base_url = base_url.rstrip('/')
-    full_url = f"{base_url}/{endpoint}"
-    logger.info(f"Making {method} request to: {full_url}")
+    idempotent = method.upper() == "GET"
+
+    async def call() -> dict:
+        return await call_with_retry(
+            didox_limiter,
+            endpoint,
+            lambda: _send_request(endpoint, request_data, user_key, base_url, partner_auth, timeout_seconds, method),
+            breaker=didox_breaker,
+            idempotent=idempotent,
+        )
+
+    if not idempotent:
+        return await call()
+    # Responses depend on the caller, so the user and partner keys are part of the key
+    key = cache_key(user_key, partner_auth, base_url.rstrip("/"), endpoint.lstrip("/"), request_data or None)
+    return await didox_single_flight.do(key, call)
+
+
+async def didox_stream_request(
+    endpoint: str,
+    request_data: dict | None = None,
+    user_key: str | None = None,
+    base_url: str = DIDOX_BASE_URL,
+    partner_auth: str = PARTNER_TOKEN,
+    timeout_seconds: int = 60,
+    accept_encoding: str = "identity",
+) -> DidoxStream:
+    """
+    Open a Didox GET request for pass-through streaming: the body is neither
+    decoded nor parsed, so memory stays flat however large the response is.
+
+    Goes through the rate limiter and circuit breaker like didox_async_api_request
+    and is retried until a 200 response starts; a failure while the body is
+    streaming is not retried. The caller must consume stream.body() or call
+    stream.aclose().
 
-    # Headers matching test.py format and order
+    Parameters:
+        endpoint (str): The specific API endpoint to call (e.g., "documents").
+        request_data (dict | None): Query parameters.
+        user_key (str | None): User key token for authentication.
+        base_url (str): Base URL of the API (default: DIDOX_BASE_URL).
+        partner_auth (str): Partner authorization token.
+        timeout_seconds (int): Timeout in seconds for connecting and for each read (default: 60).
+        accept_encoding (str): Accept-Encoding of our own client, passed on so the raw body
+            is in an encoding it can read (default: "identity").
+    Returns:
+        DidoxStream: The open response with its status checked.
+
+    Raises:
+        HTTPException: For various API errors including timeouts, client errors, and non-200 status codes.
+    """
+    return await call_with_retry(
+        didox_limiter,
+        endpoint,
+        lambda: _open_stream(endpoint, request_data, user_key, base_url, partner_auth, timeout_seconds, accept_encoding),
+        breaker=didox_breaker,
+        idempotent=True,
+    )
+
+
+def _headers(user_key: str | None, partner_auth: str) -> dict[str, str]:
+    # Headers matching test.py format and order (unset values are not sent)
     headers = {
         "user-key": user_key,
         "Partner-Authorization": partner_auth,
         "Accept": "application/json"
     }
+    return {key: value for key, value in headers.items() if value is not None}
+
 
-    # Create timeout configuration
-    timeout = aiohttp.ClientTimeout(total=timeout_seconds)
+async def _open_stream(
+    endpoint: str,
+    request_data: dict | None,
+    user_key: str | None,
+    base_url: str,
+    partner_auth: str,
+    timeout_seconds: int,
+    accept_encoding: str,
+) -> DidoxStream:
+    """One streamed Didox GET without retries"""
+    full_url = f"{base_url.rstrip('/')}/{endpoint.lstrip('/')}"
+    logger.info(f"Streaming GET request to: {full_url}")
+    headers = {**_headers(user_key, partner_auth), "Accept-Encoding": accept_encoding}
 
     try:
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            if method.upper() == "GET":
-                # For GET requests, use params (query parameters) - matching test.py
-                async with session.get(
-                        full_url,
-                        headers=headers,
-                        params=request_data if request_data else None
-                ) as response:
-                    # Check if response is successful (equivalent to raise_for_status())
-                    if response.status == 200:
-                        data = await response.json()
-                        logger.info(f"Successfully received response from {full_url}")
-                        return data
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"API returned status {response.status}: {error_text[:500]}")
-                        raise HTTPException(
-                            status_code=502,
-                            detail=f"{full_url} returned status code {response.status}: {error_text[:500]}"
-                        )
-            else:
-                # For POST requests, use json body
-                async with session.post(
-                        full_url,
-                        headers=headers,
-                        json=request_data if request_data else None
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        logger.info(f"Successfully received response from {full_url}")
-                        return data
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"API returned status {response.status}: {error_text[:500]}")
-                        raise HTTPException(
-                            status_code=502,
-                            detail=f"{full_url} returned status code {response.status}: {error_text[:500]}"
-                        )
-
-    except asyncio.TimeoutError:
+        stream = await didox_client.open_stream(
+            "GET",
+            full_url,
+            headers=headers,
+            params=request_data or None,
+            timeout=timeout_seconds,
+        )
+    except httpx.TimeoutException:
         logger.error(f"Request timed out after {timeout_seconds} seconds")
-        raise HTTPException(
+        raise RetryableUpstreamError(
             status_code=504,
             detail=f"{full_url} request timed out after {timeout_seconds} seconds"
         )
-    except aiohttp.ClientError as e:
+    except httpx.HTTPError as e:
         logger.error(f"Client error occurred: {str(e)}")
-        raise HTTPException(
+        raise RetryableUpstreamError(
+            status_code=502,
+            detail=f"{full_url} client error: {str(e)}"
+        )
+
+    if stream.response.status_code == 200:
+        return stream
+    try:
+        # Error bodies are small; read one for the message
+        error_text = (await stream.response.aread()).decode("utf-8", "replace")
+    except httpx.HTTPError:
+        error_text = ""
+    finally:
+        await stream.aclose()
+    logger.error(f"API returned status {stream.response.status_code}: {error_text[:500]}")
+    raise status_error(
+        stream.response.status_code,
+        f"{full_url} returned status code {stream.response.status_code}: {error_text[:500]}",
+        stream.response.headers.get("Retry-After"),
+    )
+
+
+async def _send_request(
+    endpoint: str,
+    request_data: dict | list | None,
+    user_key: str | None,
+    base_url: str,
+    partner_auth: str,
+    timeout_seconds: int,
+    method: str,
+) -> dict:
+    """One Didox request without retries"""
+    # Construct full URL - matching test.py format: f"{base_url}/documents"
+    endpoint = endpoint.lstrip('/')
+    base_url = base_url.rstrip('/')
+    full_url = f"{base_url}/{endpoint}"
+    logger.info(f"Making {method} request to: {full_url}")
+
+    headers = _headers(user_key, partner_auth)
+
+    try:
+        if method.upper() == "GET":
+            # For GET requests, use params (query parameters) - matching test.py
+            response = await didox_client.request(
+                "GET",
+                full_url,
+                headers=headers,
+                params=request_data if request_data else None,
+                timeout=timeout_seconds
+            )
+        else:
+            # For POST requests, use json body
+            if request_data:
+                headers["Content-Type"] = "application/json"
+            response = await didox_client.request(
+                "POST",
+                full_url,
+                headers=headers,
+                content=json_dumps(request_data) if request_data else None,
+                timeout=timeout_seconds
+            )
+
+        # Check if response is successful (equivalent to raise_for_status())
+        if response.status_code == 200:
+            data = json_loads(response.content)
+            logger.info(f"Successfully received response from {full_url}")
+            return data
+        else:
+            error_text = response.text
+            logger.error(f"API returned status {response.status_code}: {error_text[:500]}")
+            raise status_error(
+                response.status_code,
+                f"{full_url} returned status code {response.status_code}: {error_text[:500]}",
+                response.headers.get("Retry-After"),
+            )
+
+    except httpx.TimeoutException:
+        logger.error(f"Request timed out after {timeout_seconds} seconds")
+        raise RetryableUpstreamError(
+            status_code=504,
+            detail=f"{full_url} request timed out after {timeout_seconds} seconds"
+        )
+    except httpx.HTTPError as e:
+        logger.error(f"Client error occurred: {str(e)}")
+        raise RetryableUpstreamError(
             status_code=502,
             detail=f"{full_url} client error: {str(e)}"
         )
@@ -118,9 +414,9 @@ async def didox_async_api_request(
             detail=f"{full_url} error: {str(e)}"
         )
 
-if __name__ == "__main__": 
+if __name__ == "__main__":
     user_key = "e016e3ce-2a18-47f6-a8d7-236ce034bee6"
     result = asyncio.run(didox_async_api_request(
         endpoint="documents?partner=Regos", user_key=user_key))
     print(result)
-    write_json_file(result, "test.json")
\ No newline at end of file
+    write_json_file(result, "test.json")
@@ -2,11 +2,11 @@ import base64
 import asyncio
 import sys
 from pathlib import Path
-import httpx
 
 sys.path.append(str(Path(__file__).parent.parent))
 
 from didox.eimzo import eimzo_pkcs7_timestamp
+from didox.api import didox_client
 from backend.config import DIDOX_PARTNER_BASE_URL
 
 async def didox_timestamp(pkcs7_64: str, signature_hex: str, base_url: str = DIDOX_PARTNER_BASE_URL):
@@ -18,14 +18,13 @@ async def didox_timestamp(pkcs7_64: str, signature_hex: str, base_url: str = DID
         "pkcs7": pkcs7_64,
         "signatureHex": signature_hex
     }
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(url, json=body)
-        resp.raise_for_status()
-        data = resp.json()
-        ts_token = data.get("timeStampTokenB64")
-        if not ts_token:
-            raise RuntimeError("Timestamp failed")
-        return ts_token
+    resp = await didox_client.request("POST", url, json=body)
+    resp.raise_for_status()
+    data = resp.json()
+    ts_token = data.get("timeStampTokenB64")
+    if not ts_token:
+        raise RuntimeError("Timestamp failed")
+    return ts_token
 
 async def didox_login_company(tax_id: str, ts_token_b64: str, base_url: str = DIDOX_PARTNER_BASE_URL, locale: str="ru"):
     """
@@ -33,10 +32,9 @@ async def didox_login_company(tax_id: str, ts_token_b64: str, base_url: str = DI
     Returns the auth token.
     """
     url = f"{base_url}/auth/{tax_id}/token/{locale}"
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(url, json={"signature": ts_token_b64})
-        resp.raise_for_status()
-        return resp.json()
+    resp = await didox_client.request("POST", url, json={"signature": ts_token_b64})
+    resp.raise_for_status()
+    return resp.json()
 
 # ----------------
 # END-TO-END FUNCTION
@@ -1,4 +1,4 @@
-import axios from 'axios';
+import axios, { type InternalAxiosRequestConfig } from 'axios';
 
 const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
 
@@ -9,6 +9,16 @@ const apiClient = axios.create({
   },
 });
 
+// REGOS reference lists (POST /api/regos/get-*) carry an ETag. Browsers do not cache POST
+// responses, so the last body of each request is kept here and reused when the server answers 304.
+const etagCache = new Map<string, { etag: string; data: unknown }>();
+
+const isRevalidated = (config: InternalAxiosRequestConfig) =>
+  config.method === 'post' && !!config.url?.startsWith('/api/regos/get-');
+
+const etagKey = (config: InternalAxiosRequestConfig) =>
+  `${config.url} ${typeof config.data === 'string' ? config.data : JSON.stringify(config.data ?? null)}`;
+
 // Request interceptor to add JWT token if available
 apiClient.interceptors.request.use(
   (config) => {
@@ -16,6 +26,13 @@ apiClient.interceptors.request.use(
     if (token) {
       config.headers.Authorization = `Bearer ${token}`;
     }
+    if (isRevalidated(config)) {
+      const cached = etagCache.get(etagKey(config));
+      if (cached) {
+        config.headers['If-None-Match'] = cached.etag;
+      }
+      config.validateStatus = (status) => (status >= 200 && status < 300) || status === 304;
+    }
     return config;
   },
   (error) => {
@@ -25,7 +42,22 @@ apiClient.interceptors.request.use(
 
 // Response interceptor to handle errors
 apiClient.interceptors.response.use(
-  (response) => response,
+  (response) => {
+    if (isRevalidated(response.config)) {
+      const key = etagKey(response.config);
+      if (response.status === 304) {
+        const cached = etagCache.get(key);
+        if (cached) {
+          return { ...response, status: 200, data: cached.data };
+        }
+      }
+      const etag = response.headers['etag'];
+      if (etag) {
+        etagCache.set(key, { etag, data: response.data });
+      }
+    }
+    return response;
+  },
   async (error) => {
     if (error.response?.status === 401) {
       // Token expired or invalid, clear token and redirect to login
@@ -32,6 +32,8 @@ export const documentsApi = {
     if (filter.date_from) params.append('date_from', filter.date_from);
     if (filter.date_to) params.append('date_to', filter.date_to);
     if (filter.partner) params.append('partner', filter.partner);
+    if (filter.status !== undefined) params.append('status', String(filter.status));
+    if (filter.cursor) params.append('cursor', filter.cursor);
     params.append('page', String(filter.page || 1));
     params.append('limit', String(filter.limit || 20));
 
@@ -71,6 +73,28 @@ export const regosApi = {
     return response.data;
   },
 
+  /** Match any number of products; the backend splits them into 250-item REGOS calls */
+  matchProductsBulk: async (matchType: 'Code' | 'Name' | 'Articul' | 'Barcode', products: Array<{ index: string; value: string }>) => {
+    const response = await apiClient.post<{ ok: boolean; result: Array<{ index: string; item_id?: number; value?: string }> }>('/api/regos/match-products-bulk', {
+      type: matchType,
+      data: products
+    });
+    return response.data;
+  },
+
+  /** Try several match types in order (e.g. Code, then Barcode) in one call */
+  matchProductsCascade: async (
+    products: Array<{ index: string; code?: string; barcode?: string; articul?: string; name?: string }>,
+    strategies: Array<'Code' | 'Name' | 'Articul' | 'Barcode'> = ['Code', 'Barcode', 'Articul', 'Name']
+  ) => {
+    const response = await apiClient.post<{
+      ok: boolean;
+      result: Array<{ index: string; item_id: number; value?: string; match_type: 'Code' | 'Name' | 'Articul' | 'Barcode' }>;
+      unmatched: string[];
+    }>('/api/regos/match-products-cascade', { strategies, data: products });
+    return response.data;
+  },
+
   addItem: async (itemData: any) => {
     const response = await apiClient.post('/api/regos/add-item', itemData);
     return response.data;
@@ -89,6 +113,15 @@ export const regosApi = {
     return response.data;
   },
 
+  /** Resolve TINs to REGOS partners using the backend partner index */
+  lookupPartners: async (tins: string[]) => {
+    const response = await apiClient.post<{
+      ok: boolean;
+      result: Record<string, { id: number; name?: string; fullname?: string; tin?: string; pinfl?: string } | null>;
+    }>('/api/regos/partners/lookup', { tins });
+    return response.data;
+  },
+
   addPartner: async (partnerData: {
     name?: string;
     fullname?: string;
@@ -166,3 +199,137 @@ export const regosApi = {
     return response.data;
   },
 };
+
+export interface ImportDocumentPayload {
+  doc_id: string;
+  partner_id: number;
+  stock_id: number;
+  currency_id: number;
+  attached_user_id?: number;
+  date?: number;
+  price_type_id?: number;
+  vat_calculation_type?: 'Не начислять' | 'В сумме' | 'Сверху';
+  item_group_id?: number;
+  create_if_not_matched?: boolean;
+  match_strategies?: Array<'Code' | 'Name' | 'Articul' | 'Barcode'>;
+  products?: Array<{ index: number; code?: string; barcode?: string; articul?: string }>;
+}
+
+export type ImportBulkPayload = Omit<ImportDocumentPayload, 'doc_id' | 'partner_id' | 'products'> & {
+  partner_id?: number;
+  doc_ids?: string[];
+  // Used instead of doc_ids: filter over the synced document list
+  owner?: number;
+  document_type?: string;
+  date_from?: string;
+  date_to?: string;
+  partner?: string;
+  status?: number;
+};
+
+export interface ImportBulkResult {
+  ok: boolean;
+  documents: number;
+  succeeded: number;
+  failed: number;
+  operations: number;
+  unique_products: number;
+  matched_products: number;
+  created_items: number;
+  elapsed_seconds: number;
+  documents_per_second: number | null;
+  operations_per_second: number | null;
+  results: Array<{
+    doc_id: string;
+    ok: boolean;
+    doc_purchase_id?: number;
+    operations?: number;
+    products?: number;
+    unresolved?: number;
+    error?: string;
+  }>;
+}
+
+export interface ImportDocumentResult {
+  ok: boolean;
+  doc_id: string;
+  doc_purchase_id: number;
+  operations: number;
+  operation_ids: number[];
+  products: Array<{ index: number; name?: string; item_id?: number | null; source?: string | null }>;
+  elapsed_seconds: number;
+}
+
+export type ImportStage =
+  | 'fetch' | 'match' | 'create_items' | 'create_doc_purchase' | 'add_operations'
+  | 'create_documents';  // bulk imports
+
+export interface ImportJob<TResult = ImportDocumentResult> {
+  id: string;
+  kind: string;
+  status: 'queued' | 'running' | 'succeeded' | 'failed';
+  stage: ImportStage | 'done' | null;
+  progress: { stages?: Partial<Record<ImportStage, 'running' | 'done'>>; details?: Record<string, number> };
+  result: TResult | null;
+  error: string | null;
+  created_at: string | null;
+  started_at: string | null;
+  finished_at: string | null;
+}
+
+export const importApi = {
+  /** Run the full Didox → REGOS import for one document on the backend */
+  importDocument: async (payload: ImportDocumentPayload): Promise<ImportDocumentResult> => {
+    const response = await apiClient.post<ImportDocumentResult>('/api/import/document', payload);
+    return response.data;
+  },
+
+  /** Queue the import as a background job; it keeps running if the tab is closed */
+  enqueueImport: async (payload: ImportDocumentPayload): Promise<ImportJob> => {
+    const response = await apiClient.post<ImportJob>('/api/import/jobs', payload);
+    return response.data;
+  },
+
+  /** Queue a bulk import of many documents (by id or by list filter) */
+  enqueueBulkImport: async (payload: ImportBulkPayload): Promise<ImportJob<ImportBulkResult>> => {
+    const response = await apiClient.post<ImportJob<ImportBulkResult>>('/api/import/bulk', payload);
+    return response.data;
+  },
+
+  getJob: async (jobId: string): Promise<ImportJob> => {
+    const response = await apiClient.get<ImportJob>(`/api/import/jobs/${jobId}`);
+    return response.data;
+  },
+
+  /**
+   * Follow a job's Server-Sent Events until it finishes.
+   * Uses fetch because EventSource cannot send the Authorization header.
+   */
+  watchJob: async (jobId: string, onUpdate: (job: ImportJob) => void, signal?: AbortSignal): Promise<ImportJob | null> => {
+    const token = localStorage.getItem('jwt_token');
+    const response = await fetch(`${apiClient.defaults.baseURL}/api/import/jobs/${jobId}/events`, {
+      headers: token ? { Authorization: `Bearer ${token}` } : {},
+      signal,
+    });
+    if (!response.ok || !response.body) {
+      throw new Error(`Failed to follow job ${jobId}: ${response.status}`);
+    }
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+    let buffer = '';
+    let last: ImportJob | null = null;
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) return last;
+      buffer += value;
+      const events = buffer.split('\n\n');
+      buffer = events.pop() ?? '';
+      for (const event of events) {
+        const data = event.split('\n').find((line) => line.startsWith('data: '));
+        if (data) {
+          last = JSON.parse(data.slice(6)) as ImportJob;
+          onUpdate(last);
+        }
+      }
+    }
+  },
+};
@@ -1,6 +1,6 @@
 import { useState, useEffect, useRef, useCallback } from 'react';
 import { useParams, Link, useNavigate } from 'react-router-dom';
-import { documentsApi, regosApi } from '../api/documents';
+import { documentsApi, regosApi, importApi, ImportDocumentPayload } from '../api/documents';
 import { DocumentDetailData, Partner, PartnerGroup } from '../types';
 import { format } from 'date-fns';
 import { ImportSettings } from './ImportSettings';
@@ -222,6 +222,17 @@ const DocumentDetail = () => {
     try {
       const docDetail = await documentsApi.getDocument(documentId);
       setDocumentDetail(docDetail);
+
+      // Preselect the REGOS partner with the seller's TIN from the backend partner index
+      const sellerTin: string | undefined = docDetail.data.json?.sellertin;
+      if (sellerTin) {
+        regosApi.lookupPartners([sellerTin])
+          .then(res => {
+            const partner = res.result[sellerTin];
+            if (partner?.id) setSelectedPartnerId(prev => prev ?? partner.id);
+          })
+          .catch(err => console.error('Failed to look up partner by TIN:', err));
+      }
       
       // Initialize products with REGOS fields
       const products = docDetail.data.json?.productlist?.products || [];
@@ -380,55 +391,47 @@ const DocumentDetail = () => {
   };
 
   const matchAllProducts = async () => {
+    // One cascade request (Code, then Barcode) instead of one request per product
+    const rows: Array<{ index: string; code?: string; barcode?: string }> = [];
+    productsWithRegos.forEach((product, i) => {
+      if (product.regosCode || product.regosBarcode) {
+        rows.push({ index: String(i), code: product.regosCode || undefined, barcode: product.regosBarcode || undefined });
+      }
+    });
+    const pending = rows.map(row => Number(row.index));
+    if (pending.length === 0) return;
+
     setMatching(true);
+    setProductsWithRegos(prev => prev.map((p, i) => (
+      pending.includes(i) ? { ...p, isMatching: true, matchError: undefined } : p
+    )));
     try {
-      for (let i = 0; i < productsWithRegos.length; i++) {
-        const product = productsWithRegos[i];
-        if (product.regosCode || product.regosBarcode) {
-          await matchProduct(i);
+      const matchedIds = new Map<number, number>();
+      const result = await regosApi.matchProductsCascade(rows, ['Code', 'Barcode']);
+      if (result.ok && Array.isArray(result.result)) {
+        for (const match of result.result) {
+          if (match.item_id) matchedIds.set(Number(match.index), match.item_id);
         }
       }
-    } finally {
-      setMatching(false);
-    }
-  };
 
-  /** Match or create product and return REGOS item_id, or null if not found and not creating */
-  const getItemIdForProduct = async (index: number): Promise<number | null> => {
-    const product = productsWithRegos[index];
-    const matchValue = product.regosCode || product.regosBarcode || '';
-
-    if (matchValue) {
-      const matchType = product.regosCode ? 'Code' : 'Barcode';
-      const matchResult = await regosApi.matchProducts(matchType, [{ index: String(index), value: matchValue }]);
-      if (matchResult.ok && matchResult.result && Array.isArray(matchResult.result) && matchResult.result.length > 0) {
-        return matchResult.result[0].item_id ?? null;
-      }
-    }
-
-    if (createIfNotMatched) {
-      const original = product.original;
-      const itemData: any = {
-        name: original?.name || 'Новый товар',
-        package_code: original?.packagecode || '',
-        group_id: selectedItemGroupId ?? 1,
-        vat_id: 1,
-        unit_id: 1,
-        type: 1,
-      };
-      if (product.regosCode) {
-        const codeNum = parseInt(product.regosCode);
-        if (!isNaN(codeNum)) itemData.code = codeNum;
+      const unmatched = pending.filter(i => !matchedIds.has(i));
+      setProductsWithRegos(prev => prev.map((p, i) => {
+        if (matchedIds.has(i)) return { ...p, matchedItemId: matchedIds.get(i), isMatching: false };
+        if (unmatched.includes(i) && !createIfNotMatched) return { ...p, isMatching: false, matchError: 'Not found' };
+        return p;
+      }));
+      if (createIfNotMatched) {
+        for (const i of unmatched) {
+          await createProductInRegos(i);
+        }
       }
-      if (product.regosBarcode) itemData.articul = product.regosBarcode;
-      if (selectedPartnerId) itemData.partner_id = selectedPartnerId;
-
-      const createResult = await regosApi.addItem(itemData);
-      if (!createResult.ok) return null;
-      const newId = typeof createResult.result === 'number' ? createResult.result : (createResult.result as { new_id?: number })?.new_id;
-      return newId ?? null;
+    } catch (err: any) {
+      setProductsWithRegos(prev => prev.map((p, i) => (
+        pending.includes(i) ? { ...p, isMatching: false, matchError: err.response?.data?.detail || 'Match failed' } : p
+      )));
+    } finally {
+      setMatching(false);
     }
-    return null;
   };
 
   const handleAddToRegos = async () => {
@@ -452,68 +455,38 @@ const DocumentDetail = () => {
       2: 'В сумме',
       3: 'Сверху',
     };
-    const docPayload: any = {
+    const importPayload: ImportDocumentPayload = {
+      doc_id: id as string,
       date: Math.floor(Date.now() / 1000),
       partner_id: Number(selectedPartnerId),
       stock_id: Number(selectedStockId),
       currency_id: Number(selectedCurrencyId),
       attached_user_id: 1,
       vat_calculation_type: vatTypeMap[vatCalculationType ?? 1],
+      create_if_not_matched: createIfNotMatched,
+      products: products
+        .map((p, i) => ({ index: i, code: p.regosCode || undefined, barcode: p.regosBarcode || undefined }))
+        .filter(p => p.code || p.barcode),
     };
     if (selectedPriceTypeId != null) {
-      docPayload.price_type_id = Number(selectedPriceTypeId);
+      importPayload.price_type_id = Number(selectedPriceTypeId);
+    }
+    if (selectedItemGroupId != null) {
+      importPayload.item_group_id = Number(selectedItemGroupId);
     }
-    console.log('Sending purchase document payload:', docPayload);
+    console.log('Sending import payload:', importPayload);
 
     try {
-      const docRes = await regosApi.addDocPurchase(docPayload);
-      if (!docRes.ok) {
-        alert('Не удалось создать документ поступления.');
-        return;
-      }
-      const docId = typeof docRes.result === 'number' ? docRes.result : (docRes.result as { new_id?: number })?.new_id;
-      if (docId == null) {
-        alert('Не удалось создать документ поступления.');
-        return;
-      }
-
-      const operations: Array<{ document_id: number; item_id: number; quantity: number; cost: number; vat_value: number; price?: number }> = [];
-      for (let i = 0; i < products.length; i++) {
-        const p = products[i];
-        const hasRegosId = p.regosCode || p.regosBarcode;
-        if (!hasRegosId && !createIfNotMatched) continue;
-        if (!hasRegosId && createIfNotMatched && !p.original?.name) continue;
-        const itemId = await getItemIdForProduct(i);
-        if (!itemId) continue;
-        const orig = p.original;
-        const count = orig?.count != null ? Number(orig.count) : 1;
-        const qty = count > 0 ? count : 1;
-        const deliverysum = Number(orig?.deliverysum) || 0;
-        const deliverysumwithvat = Number(orig?.deliverysumwithvat) || deliverysum;
-        const cost = qty > 0 ? deliverysum / qty : deliverysum;
-        const vatrate = Number(orig?.vatrate) ?? 0;
-        const price = qty > 0 ? deliverysumwithvat / qty : undefined;
-        operations.push({
-          document_id: docId,
-          item_id: itemId,
-          quantity: qty,
-          cost,
-          vat_value: vatrate,
-          ...(price != null && !isNaN(price) ? { price } : {}),
-        });
-      }
-
-      if (operations.length === 0) {
-        alert('Нет товаров для добавления (сопоставьте или создайте товары).');
-        return;
-      }
-
-      await regosApi.addPurchaseOperation(operations);
-      await matchAllProducts();
-      alert(`Документ поступления создан (ID: ${docId}). Добавлено операций: ${operations.length}.`);
+      // The whole pipeline (match, create items, DocPurchase, operations) runs on the backend
+      const result = await importApi.importDocument(importPayload);
+      setProductsWithRegos(prev => prev.map((p, i) => {
+        const imported = result.products.find(row => row.index === i);
+        return imported?.item_id ? { ...p, matchedItemId: imported.item_id, matchError: undefined } : p;
+      }));
+      alert(`Документ поступления создан (ID: ${result.doc_purchase_id}). Добавлено операций: ${result.operations}.`);
     } catch (err: any) {
       console.error('Add to Regos failed:', err);
-      console.error('Request payload:', docPayload);
+      console.error('Request payload:', importPayload);
       console.error('Error response:', err.response?.data);
       
       let errorMessage = 'Ошибка при добавлении в Regos';
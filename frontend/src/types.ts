@@ -93,7 +93,8 @@ export interface DocumentListResponse {
   data: DocumentListItem[];
   total: number;
   next_page_url?: string;
-  source?: string;
+  next_cursor?: string | null;  // Keyset cursor for the next page (local mirror only)
+  source?: string;  // "local" when served from the document mirror
 }
 
 export interface DocumentType {
@@ -113,6 +114,8 @@ export interface DocumentFilter {
   date_to?: string;
   owner?: number;  // 1 = outgoing, 0 = incoming
   partner?: string;  // Partner TIN/ID
+  status?: number;  // doc_status (local mirror only)
+  cursor?: string;  // next_cursor of the previous page
   page?: number;
   limit?: number;
   use_mock?: boolean;
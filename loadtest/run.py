@@ -0,0 +1,323 @@
+"""
+End-to-end load generator: concurrent simulated users driving the app over HTTP.
+
+Every simulated user logs in once, then repeats the everyday flow until the run ends:
+list incoming documents, open one of them and, for --import-ratio of the
+iterations, import it into REGOS. Reports per-operation throughput, error counts
+and p50/p95/p99 latency.
+
+With --start-app the whole setup is local: the REGOS/Didox stand-ins from
+loadtest/stubs.py and the app (uvicorn backend.main:app) are started as
+subprocesses on a throwaway SQLite database, seeded with --users accounts that
+already have a Didox token (E-IMZO login cannot be simulated). Without it,
+point --base-url at a running app and pass an account with a stored Didox token.
+
+Usage:
+    python loadtest/run.py --start-app --users 20 --duration 60 --latency 80 --error-rate 0.01
+    python loadtest/run.py --base-url http://127.0.0.1:8000 --username admin --password admin --users 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from loadtest.stubs import add_profile_arguments, stub_env
+
+ROOT = Path(__file__).parent.parent
+PASSWORD = "loadtest-password"
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Recorder:
+    """Latencies and failures per operation"""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    async def call(self, operation: str, request) -> httpx.Response | None:
+        started = time.perf_counter()
+        try:
+            response = await request
+        except httpx.HTTPError as e:
+            self.errors[operation][e.__class__.__name__] += 1
+            return None
+        self.latencies[operation].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[operation][str(response.status_code)] += 1
+            return None
+        return response
+
+    def report(self, elapsed: float) -> dict:
+        operations = {}
+        for operation in sorted(set(self.latencies) | set(self.errors)):
+            latencies_ms = [latency * 1000 for latency in self.latencies[operation]] or [0.0]
+            errors = dict(self.errors[operation])
+            requests = len(self.latencies[operation]) + sum(
+                count for status, count in errors.items() if not status.isdigit()
+            )
+            operations[operation] = {
+                "requests": requests,
+                "errors": errors,
+                "requests_per_second": round(requests / elapsed, 2),
+                "p50_ms": round(percentile(latencies_ms, 50), 1),
+                "p95_ms": round(percentile(latencies_ms, 95), 1),
+                "p99_ms": round(percentile(latencies_ms, 99), 1),
+                "max_ms": round(max(latencies_ms), 1),
+            }
+        total = sum(operation["requests"] for operation in operations.values())
+        return {
+            "elapsed_seconds": round(elapsed, 2),
+            "requests": total,
+            "requests_per_second": round(total / elapsed, 2),
+            "operations": operations,
+        }
+
+
+async def simulated_user(
+    client: httpx.AsyncClient,
+    recorder: Recorder,
+    username: str,
+    password: str,
+    deadline: float,
+    iterations: int | None,
+    import_ratio: float,
+    think_time: float,
+) -> None:
+    response = await recorder.call(
+        "login", client.post("/api/auth/user-login", json={"username": username, "password": password})
+    )
+    if response is None:
+        return
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    iteration = 0
+    while time.monotonic() < deadline and (iterations is None or iteration < iterations):
+        iteration += 1
+        response = await recorder.call(
+            "list_documents", client.get("/api/documents", params={"owner": 0, "limit": 20}, headers=headers)
+        )
+        documents = response.json().get("data", []) if response is not None else []
+        if documents:
+            doc_id = random.choice(documents)["doc_id"]
+            await recorder.call("open_document", client.get(f"/api/documents/{doc_id}", headers=headers))
+            if random.random() < import_ratio:
+                await recorder.call(
+                    "import_document",
+                    client.post(
+                        "/api/import/document",
+                        json={
+                            "doc_id": doc_id,
+                            "partner_id": 1,
+                            "stock_id": 1,
+                            "currency_id": 1,
+                            "create_if_not_matched": True,
+                        },
+                        headers=headers,
+                    ),
+                )
+        if think_time:
+            await asyncio.sleep(random.uniform(0, 2 * think_time))
+
+
+async def run_load(args: argparse.Namespace, base_url: str, accounts: list[tuple[str, str]]) -> dict:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        started = time.monotonic()
+        deadline = started + args.duration
+        await asyncio.gather(*(
+            simulated_user(
+                client,
+                recorder,
+                *accounts[n % len(accounts)],
+                deadline,
+                args.iterations,
+                args.import_ratio,
+                args.think_time / 1000,
+            )
+            for n in range(args.users)
+        ))
+        elapsed = time.monotonic() - started
+        metrics = None
+        if args.scrape_metrics:
+            response = await client.get("/metrics")
+            metrics = response.text if response.status_code == 200 else None
+    result = recorder.report(elapsed)
+    if metrics is not None:
+        result["app_metrics"] = metrics
+    return result
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{url} did not come up within {timeout}s")
+            time.sleep(0.2)
+
+
+def seed_users(users: int) -> list[tuple[str, str]]:
+    """Create the load test accounts with a Didox token in the database configured in os.environ"""
+    from backend.database import AsyncSessionLocal, engine, init_db
+    from backend.user_service import create_user, get_user_by_username
+    from backend.token_service import save_token
+
+    async def seed() -> list[tuple[str, str]]:
+        await init_db()
+        accounts = []
+        async with AsyncSessionLocal() as db:
+            for n in range(users):
+                username = f"load-user-{n}"
+                user = await get_user_by_username(db, username) or await create_user(db, username, PASSWORD)
+                await save_token(db, user.id, f"loadtest-user-key-{n}")
+                accounts.append((username, PASSWORD))
+            await db.commit()
+        await engine.dispose()
+        return accounts
+
+    return asyncio.run(seed())
+
+
+def start_local_stack(args: argparse.Namespace, workdir: Path) -> tuple[str, list[tuple[str, str]], list[subprocess.Popen]]:
+    """Start the stubs and the app against them; returns the app URL, accounts and processes"""
+    regos_port, didox_port, app_port = free_port(), free_port(), free_port()
+    env = {
+        **os.environ,
+        **stub_env("127.0.0.1", regos_port, didox_port),
+        "DATABASE_URL": f"sqlite+aiosqlite:///{workdir / 'loadtest.db'}",
+        "REGOS_TOKEN": "loadtest",
+        "PARTNER_TOKEN": "loadtest",
+        "PROFILE_DIR": str(workdir / "profiles"),
+    }
+    # backend.config reads the environment on import, so seed with the same settings as the app
+    os.environ.update(env)
+    accounts = seed_users(args.users)
+
+    stubs = subprocess.Popen(
+        [
+            sys.executable, str(ROOT / "loadtest" / "stubs.py"),
+            "--regos-port", str(regos_port), "--didox-port", str(didox_port),
+            "--latency", str(args.latency), "--jitter", str(args.jitter),
+            "--error-rate", str(args.error_rate), "--rate-limit", str(args.rate_limit),
+            "--documents", str(args.documents), "--catalog-size", str(args.catalog_size),
+        ],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    processes = [stubs]
+    app = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "backend.main:app",
+            "--host", "127.0.0.1", "--port", str(app_port),
+            "--workers", str(args.app_workers), "--log-level", "warning", "--no-access-log",
+        ],
+        cwd=ROOT,
+        env=env,
+    )
+    processes.append(app)
+    base_url = f"http://127.0.0.1:{app_port}"
+    try:
+        wait_for(f"http://127.0.0.1:{didox_port}/v2/documents")
+        wait_for(f"{base_url}/")
+    except RuntimeError:
+        stop_processes(processes)
+        raise
+    return base_url, accounts, processes
+
+
+def stop_processes(processes: list[subprocess.Popen]) -> None:
+    for process in reversed(processes):
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def print_report(result: dict) -> None:
+    print(
+        f"\n{result['requests']} requests in {result['elapsed_seconds']}s "
+        f"({result['requests_per_second']} req/s)\n"
+    )
+    print(f"{'operation':<16}{'requests':>9}{'req/s':>9}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for name, operation in result["operations"].items():
+        errors = sum(operation["errors"].values())
+        print(
+            f"{name:<16}{operation['requests']:>9}{operation['requests_per_second']:>9}{errors:>8}"
+            f"{operation['p50_ms']:>9}{operation['p95_ms']:>9}{operation['p99_ms']:>9}{operation['max_ms']:>9}"
+        )
+        if operation["errors"]:
+            print(f"{'':<16}errors: {operation['errors']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000", help="App to load (ignored with --start-app)")
+    parser.add_argument("--username", default="admin", help="Account used by every simulated user (without --start-app)")
+    parser.add_argument("--password", default="admin")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent simulated users")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run")
+    parser.add_argument("--iterations", type=int, default=None, help="Stop each user after this many iterations")
+    parser.add_argument("--import-ratio", type=float, default=0.1, help="Share of iterations that import the document")
+    parser.add_argument("--think-time", type=float, default=0, help="Mean pause between iterations in ms")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds")
+    parser.add_argument("--scrape-metrics", action="store_true", help="Include the app's /metrics output in --json")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the report to this file")
+    local = parser.add_argument_group("local stack (--start-app)")
+    local.add_argument("--start-app", action="store_true", help="Start the stubs and the app on a throwaway database")
+    local.add_argument("--app-workers", type=int, default=1, help="uvicorn worker processes")
+    add_profile_arguments(local)
+    args = parser.parse_args()
+
+    processes = []
+    workdir = None
+    if args.start_app:
+        workdir = tempfile.TemporaryDirectory(prefix="regos-didox-loadtest-")
+        base_url, accounts, processes = start_local_stack(args, Path(workdir.name))
+    else:
+        base_url, accounts = args.base_url, [(args.username, args.password)]
+
+    print(f"Loading {base_url} with {args.users} users for {args.duration}s")
+    try:
+        result = asyncio.run(run_load(args, base_url, accounts))
+    finally:
+        stop_processes(processes)
+        if workdir is not None:
+            workdir.cleanup()
+
+    print_report(result)
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(result, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""
+Local stand-ins for the REGOS gateway and the Didox v2 / partner APIs, for load tests.
+
+REGOS (POST /gateway/out/{token}/v1/{endpoint}):
+    Stock/Currency/PriceType/ItemGroup/PartnerGroup/Get return small reference lists,
+    Item/Get and Partner/Get page through a generated catalog (the partners include
+    the TINs of the recorded documents), Item/Match matches against that catalog,
+    */Add returns new ids.
+
+Didox:
+    GET /v2/documents           pages through documents cloned from documents.json and test.json
+    GET /v1/documents/{doc_id}  detail cloned from documents_*.json with that doc_id
+
+Every response waits --latency ms (plus up to --jitter ms), fails with 503 at
+--error-rate, and answers 429 with Retry-After once more than --rate-limit
+requests per second arrive at one upstream.
+
+Usage:
+    python loadtest/stubs.py --latency 80 --jitter 40 --error-rate 0.01 --rate-limit 50
+
+Then start the app against them:
+    REGOS_BASE_URL=http://127.0.0.1:18080/gateway/out \\
+    DIDOX_BASE_URL=http://127.0.0.1:18081/v2 DIDOX_PARTNER_BASE_URL=http://127.0.0.1:18081/v1 \\
+    uvicorn backend.main:app
+"""
+import argparse
+import asyncio
+import copy
+import hashlib
+import itertools
+import json
+import random
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from aiohttp import web
+
+ROOT = Path(__file__).parent.parent
+
+
+@dataclass
+class StubProfile:
+    """How a stub upstream misbehaves"""
+    latency_ms: float = 50
+    jitter_ms: float = 25
+    error_rate: float = 0.0
+    rate_limit: float = 0  # Requests per second before answering 429 (0 = unlimited)
+    documents: int = 500
+    catalog_size: int = 5000
+    partners: int = 500
+
+
+@dataclass
+class StubStats:
+    requests: int = 0
+    errors: int = 0
+    throttled: int = 0
+    per_endpoint: dict[str, int] = field(default_factory=dict)
+
+
+class Upstream:
+    """Latency, error and throttling behaviour shared by one stub server"""
+
+    def __init__(self, name: str, profile: StubProfile):
+        self.name = name
+        self.profile = profile
+        self.stats = StubStats()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+
+    async def behave(self, endpoint: str) -> web.Response | None:
+        """Sleep like the real service; return an error response to send instead, if any"""
+        self.stats.requests += 1
+        self.stats.per_endpoint[endpoint] = self.stats.per_endpoint.get(endpoint, 0) + 1
+        if self.profile.rate_limit:
+            now = time.monotonic()
+            if now - self._window_start >= 1:
+                self._window_start, self._window_count = now, 0
+            self._window_count += 1
+            if self._window_count > self.profile.rate_limit:
+                self.stats.throttled += 1
+                return web.json_response(
+                    {"error": "Too many requests"}, status=429, headers={"Retry-After": "1"}
+                )
+        delay = self.profile.latency_ms + random.uniform(0, self.profile.jitter_ms)
+        await asyncio.sleep(delay / 1000)
+        if random.random() < self.profile.error_rate:
+            self.stats.errors += 1
+            return web.json_response({"error": "Service unavailable"}, status=503)
+        return None
+
+
+def _load(name: str) -> dict:
+    return json.loads((ROOT / name).read_text(encoding="utf-8"))
+
+
+def _doc_id(n: int) -> str:
+    return hashlib.md5(f"loadtest-{n}".encode()).hexdigest().upper()
+
+
+class DidoxData:
+    """Documents cloned from the recorded list and detail payloads"""
+
+    def __init__(self, count: int):
+        templates = _load("documents.json")["data"] + _load("test.json")["data"]
+        self.detail_template = _load(next(ROOT.glob("documents_*.json")).name)
+        now = int(time.time())
+        self.documents: dict[int, list[dict]] = {0: [], 1: []}
+        self.seller_tins = set()
+        for n in range(count):
+            document = copy.deepcopy(templates[n % len(templates)])
+            owner = n % 2
+            created_unix = now - n * 3600
+            document.update({
+                "doc_id": _doc_id(n),
+                "owner": owner,
+                "name": f"LT-{n}",
+                "created_unix": created_unix,
+                "updated_unix": created_unix,
+                "created": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(created_unix)),
+            })
+            self.documents[owner].append(document)
+            if document.get("partnerTin"):
+                self.seller_tins.add(document["partnerTin"])
+        self.seller_tins.add(self.detail_template["data"]["json"].get("sellertin"))
+
+    def page(self, query) -> dict:
+        owner = int(query.get("owner", 1))
+        limit = max(1, int(query.get("limit", 20)))
+        page = max(1, int(query.get("page", 1)))
+        documents = self.documents.get(owner, [])
+        return {
+            "data": documents[(page - 1) * limit: page * limit],
+            "total": len(documents),
+            "next_page_url": None,
+            "source": "loadtest",
+        }
+
+    def detail(self, doc_id: str) -> dict:
+        detail = copy.deepcopy(self.detail_template)
+        document = detail["data"]["document"]
+        document["doc_id"] = document["_id"] = document["id"] = doc_id
+        return detail
+
+
+class RegosData:
+    """Generated catalog and reference data"""
+
+    REFERENCE = {
+        "Stock/Get": [{"id": 1, "name": "Main stock"}, {"id": 2, "name": "Second stock"}],
+        "Currency/Get": [{"id": 1, "name": "UZS", "exchange_rate": 1}],
+        "PriceType/Get": [{"id": 1, "name": "Retail"}],
+        "ItemGroup/Get": [{"id": 1, "name": "Goods"}],
+        "PartnerGroup/Get": [{"id": 1, "name": "Suppliers"}],
+    }
+
+    def __init__(self, profile: StubProfile, seller_tins: set[str]):
+        self.items = [
+            {
+                "id": i,
+                "code": i,
+                "name": f"Load test item {i}",
+                "articul": f"A{i}",
+                "barcode_list": f"478{i:010d}",
+                "group": {"id": 1},
+                "deleted_mark": False,
+            }
+            for i in range(1, profile.catalog_size + 1)
+        ]
+        tins = sorted(tin for tin in seller_tins if tin)
+        self.partners = [
+            {"id": i, "name": f"Partner {i}", "inn": tins[i - 1] if i <= len(tins) else f"{300000000 + i}"}
+            for i in range(1, max(profile.partners, len(tins)) + 1)
+        ]
+        self.by_key = {
+            "Code": {str(item["code"]): item["id"] for item in self.items},
+            "Articul": {item["articul"]: item["id"] for item in self.items},
+            "Name": {item["name"]: item["id"] for item in self.items},
+            "Barcode": {item["barcode_list"]: item["id"] for item in self.items},
+        }
+        self.ids = itertools.count(1_000_000)
+
+    @staticmethod
+    def _paged(rows: list[dict], body: dict) -> dict:
+        if body.get("ids"):
+            ids = set(body["ids"])
+            rows = [row for row in rows if row["id"] in ids]
+        offset = int(body.get("offset") or 0)
+        limit = int(body.get("limit") or 1000)
+        page = rows[offset: offset + limit]
+        return {"result": page, "next_offset": offset + len(page), "total": len(rows)}
+
+    def handle(self, endpoint: str, body) -> dict | list:
+        if endpoint in self.REFERENCE:
+            return self.REFERENCE[endpoint]
+        if endpoint == "Item/Get":
+            return self._paged(self.items, body or {})
+        if endpoint == "Partner/Get":
+            return self._paged(self.partners, body or {})
+        if endpoint == "Item/Match":
+            index = self.by_key.get(body.get("type"), {})
+            return [
+                {"index": row["index"], "item_id": index.get(str(row["value"])), "value": row["value"]}
+                for row in body.get("data", [])
+                if index.get(str(row["value"]))
+            ]
+        if endpoint == "PurchaseOperation/Add":
+            return {"row_affected": len(body), "ids": [next(self.ids) for _ in body]}
+        if endpoint.endswith("/Add"):
+            return {"new_id": next(self.ids)}
+        return []
+
+
+def build_regos_app(profile: StubProfile, data: RegosData) -> web.Application:
+    upstream = Upstream("regos", profile)
+
+    async def handler(request: web.Request) -> web.Response:
+        endpoint = request.match_info["endpoint"]
+        error = await upstream.behave(endpoint)
+        if error is not None:
+            return error
+        body = await request.json() if request.can_read_body else {}
+        return web.json_response({"ok": True, "result": data.handle(endpoint, body)})
+
+    app = web.Application()
+    app["upstream"] = upstream
+    app.router.add_post("/gateway/out/{token}/v1/{endpoint:.+}", handler)
+    return app
+
+
+def build_didox_app(profile: StubProfile, data: DidoxData) -> web.Application:
+    upstream = Upstream("didox", profile)
+
+    async def documents(request: web.Request) -> web.Response:
+        error = await upstream.behave("documents")
+        return error or web.json_response(data.page(request.query))
+
+    async def document(request: web.Request) -> web.Response:
+        error = await upstream.behave("documents/{id}")
+        return error or web.json_response(data.detail(request.match_info["doc_id"]))
+
+    app = web.Application()
+    app["upstream"] = upstream
+    app.router.add_get("/v2/documents", documents)
+    app.router.add_get("/v1/documents/{doc_id}", document)
+    app.router.add_get("/v2/documents/{doc_id}", document)
+    return app
+
+
+async def start_stubs(
+    profile: StubProfile,
+    host: str = "127.0.0.1",
+    regos_port: int = 18080,
+    didox_port: int = 18081,
+) -> list[web.AppRunner]:
+    """Start both stub servers on the running loop; clean up the returned runners when done"""
+    didox_data = DidoxData(profile.documents)
+    regos_data = RegosData(profile, didox_data.seller_tins)
+    runners = []
+    for app, port in ((build_regos_app(profile, regos_data), regos_port), (build_didox_app(profile, didox_data), didox_port)):
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        runners.append(runner)
+    return runners
+
+
+def stub_env(host: str = "127.0.0.1", regos_port: int = 18080, didox_port: int = 18081) -> dict[str, str]:
+    """Environment pointing the app at the stubs"""
+    return {
+        "REGOS_BASE_URL": f"http://{host}:{regos_port}/gateway/out",
+        "DIDOX_BASE_URL": f"http://{host}:{didox_port}/v2",
+        "DIDOX_PARTNER_BASE_URL": f"http://{host}:{didox_port}/v1",
+        "DIDOX_HTTP2": "false",
+    }
+
+
+def stub_stats(runners: list[web.AppRunner]) -> dict:
+    return {runner.app["upstream"].name: vars(runner.app["upstream"].stats) for runner in runners}
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", type=float, default=50, help="Base upstream latency in ms")
+    parser.add_argument("--jitter", type=float, default=25, help="Extra random latency up to this many ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument("--rate-limit", type=float, default=0, help="Requests/s per upstream before 429 (0 = off)")
+    parser.add_argument("--documents", type=int, default=500, help="Documents served by the Didox stub")
+    parser.add_argument("--catalog-size", type=int, default=5000, help="Items served by the REGOS stub")
+
+
+def profile_from_args(args: argparse.Namespace) -> StubProfile:
+    return StubProfile(
+        latency_ms=args.latency,
+        jitter_ms=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        documents=args.documents,
+        catalog_size=args.catalog_size,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_profile_arguments(parser)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--regos-port", type=int, default=18080)
+    parser.add_argument("--didox-port", type=int, default=18081)
+    args = parser.parse_args()
+
+    async def serve() -> None:
+        runners = await start_stubs(profile_from_args(args), args.host, args.regos_port, args.didox_port)
+        for name, value in stub_env(args.host, args.regos_port, args.didox_port).items():
+            print(f"{name}={value}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            print(json.dumps(stub_stats(runners), indent=2))
+            for runner in runners:
+                await runner.cleanup()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
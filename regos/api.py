@@ -1,5 +1,4 @@
 import aiohttp
-import json
 import asyncio
 from fastapi import HTTPException
 import logging
@@ -8,19 +7,121 @@ import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
-from backend.config import REGOS_TOKEN
+from backend.config import (
+    REGOS_TOKEN,
+    REGOS_BASE_URL,
+    REGOS_POOL_SIZE,
+    REGOS_POOL_SIZE_PER_HOST,
+    REGOS_DNS_CACHE_TTL,
+    REGOS_KEEPALIVE_TIMEOUT,
+    REGOS_RATE_LIMIT,
+    REGOS_RATE_BURST,
+    REGOS_ENDPOINT_RATE_LIMITS,
+)
+from backend.upstream import (
+    CircuitBreaker,
+    RateLimiter,
+    RetryableUpstreamError,
+    SingleFlight,
+    call_with_retry,
+    status_error,
+)
+from backend.cache import cache_key
+from backend.json_codec import dumps as json_dumps, loads as json_loads
 logger = logging.getLogger("DocVision")
 
+
+class RegosClient:
+    """
+    Long-lived pooled HTTP session for the REGOS gateway.
+
+    A single aiohttp session (and its TCP/TLS connection pool) is shared by every
+    REGOS wrapper. The FastAPI lifespan opens it on startup and closes it on shutdown;
+    if it is used outside the app (scripts) it is opened lazily on first request.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = REGOS_POOL_SIZE,
+        pool_size_per_host: int = REGOS_POOL_SIZE_PER_HOST,
+        dns_cache_ttl: int = REGOS_DNS_CACHE_TTL,
+        keepalive_timeout: float = REGOS_KEEPALIVE_TIMEOUT,
+    ):
+        self.pool_size = pool_size
+        self.pool_size_per_host = pool_size_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self._session: aiohttp.ClientSession | None = None
+
+    @property
+    def closed(self) -> bool:
+        return self._session is None or self._session.closed
+
+    async def open(self) -> aiohttp.ClientSession:
+        """Create the pooled session if it is not open yet"""
+        if self.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_size_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                use_dns_cache=True,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+            logger.info(
+                f"REGOS connection pool opened (limit={self.pool_size}, "
+                f"per_host={self.pool_size_per_host}, dns_ttl={self.dns_cache_ttl}s)"
+            )
+        return self._session
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Return the shared session, opening it lazily if needed"""
+        if self.closed:
+            return await self.open()
+        return self._session
+
+    async def close(self) -> None:
+        """Close the pooled session and release all connections"""
+        if not self.closed:
+            await self._session.close()
+            logger.info("REGOS connection pool closed")
+        self._session = None
+
+
+# Shared client used by all REGOS wrappers (regos/item.py, regos/partner.py, ...)
+regos_client = RegosClient()
+
+regos_limiter = RateLimiter("regos", REGOS_RATE_LIMIT, REGOS_RATE_BURST, REGOS_ENDPOINT_RATE_LIMITS)
+# Fails REGOS calls fast while the gateway is down or unusably slow
+regos_breaker = CircuitBreaker("regos")
+# Identical concurrent reads share one request
+regos_single_flight = SingleFlight("regos")
+
+# Read-only endpoints that are POSTed but safe to repeat
+IDEMPOTENT_ENDPOINTS = {"Item/Match"}
+
+
+def is_idempotent(endpoint: str) -> bool:
+    """REGOS */Get and other read-only endpoints may be retried; */Add, */Edit, ... may not"""
+    return endpoint.endswith("/Get") or endpoint in IDEMPOTENT_ENDPOINTS
+
+
 async def regos_async_api_request(endpoint: str, request_data: dict | list, token: str = REGOS_TOKEN,
-                                  timeout_seconds: int = 30) -> dict:
+                                  timeout_seconds: int = 30, retry: bool | None = None) -> dict:
     """
     Make an asynchronous request to the REGOS API.
 
+    Requests go through the REGOS rate limiter. Idempotent reads are retried
+    with backoff on timeouts, connection errors, 5xx and 429; writes only on 429.
+    While the REGOS circuit breaker is open, requests fail fast with 503.
+    Identical concurrent idempotent reads share one request.
+
     Parameters:
         endpoint (str): The specific API endpoint to call.
         request_data (dict | list): The data to send in the request body.
         token (str): Integration token.
         timeout_seconds (int): Timeout in seconds (default: 30).
+        retry (bool | None): Force retries on or off (default: by endpoint, see is_idempotent).
 
     Returns:
         dict: The API response.
@@ -28,8 +129,26 @@ async def regos_async_api_request(endpoint: str, request_data: dict | list, toke
     Raises:
         HTTPException: For various API errors including timeouts, client errors, and non-200 status codes.
     """
+    idempotent = is_idempotent(endpoint) if retry is None else retry
+
+    async def call() -> dict:
+        return await call_with_retry(
+            regos_limiter,
+            endpoint,
+            lambda: _send_request(endpoint, request_data, token, timeout_seconds),
+            breaker=regos_breaker,
+            idempotent=idempotent,
+        )
+
+    if not idempotent:
+        return await call()
+    return await regos_single_flight.do(cache_key(token, endpoint, request_data), call)
+
+
+async def _send_request(endpoint: str, request_data: dict | list, token: str, timeout_seconds: int) -> dict:
+    """One REGOS request without retries"""
     # Base endpoint URL
-    full_url = f"https://integration.regos.uz/gateway/out/{token}/v1/{endpoint}"
+    full_url = f"{REGOS_BASE_URL}/{token}/v1/{endpoint}"
 
     # Required headers
     headers = {
@@ -40,48 +159,62 @@ async def regos_async_api_request(endpoint: str, request_data: dict | list, toke
     timeout = aiohttp.ClientTimeout(total=timeout_seconds)
 
     try:
-        # Make the POST request asynchronously with timeout
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.post(
-                    full_url,
-                    headers=headers,
-                    data=json.dumps(request_data)
-            ) as response:
-                # Check if response is successful (code 200)
-                if response.status == 200:
-                    data = await response.json()
-
-                    # Check if the API returned an error in the response body
-                    if not data.get("ok"):
-                        err_result = data.get("result", {})
-                        error_code = err_result.get("error", "Unknown")
-                        error_desc = err_result.get("description", "Unknown error")
-                        err_msg = f"REGOS API error: {error_code} - {error_desc}"
-
-                        logger.error(err_msg)
-                        raise HTTPException(status_code=400, detail=err_msg)
-
-                    # Check if the API returned a valid response
-                    result = data.get("result", "There is no result in response")
-                    if not isinstance(result, (dict, list)):
-                        raise HTTPException(status_code=502, detail=f"Invalid response from REGOS API: {result}")
-
-                    return data
-
-                else:
-                    err_msg = f"Error: API returned status code {response.status}"
-                    logger.info(err_msg)
-                    raise HTTPException(status_code=502, detail=f"REGOS API returned status code {response.status}")
+        # Make the POST request over the shared pooled session
+        session = await regos_client.get_session()
+        async with session.post(
+                full_url,
+                headers=headers,
+                data=json_dumps(request_data),
+                timeout=timeout
+        ) as response:
+            # Check if response is successful (code 200)
+            if response.status == 200:
+                data = await response.json(loads=json_loads)
+
+                # Check if the API returned an error in the response body
+                if not data.get("ok"):
+                    err_result = data.get("result", {})
+                    error_code = err_result.get("error", "Unknown")
+                    error_desc = err_result.get("description", "Unknown error")
+                    err_msg = f"REGOS API error: {error_code} - {error_desc}"
+
+                    logger.error(err_msg)
+                    raise HTTPException(status_code=400, detail=err_msg)
+
+                # Check if the API returned a valid response
+                result = data.get("result", "There is no result in response")
+                if not isinstance(result, (dict, list)):
+                    raise HTTPException(status_code=502, detail=f"Invalid response from REGOS API: {result}")
+
+                return data
+
+            else:
+                err_msg = f"Error: API returned status code {response.status}"
+                logger.info(err_msg)
+                raise status_error(
+                    response.status,
+                    f"REGOS API returned status code {response.status}",
+                    response.headers.get("Retry-After"),
+                )
 
     except asyncio.TimeoutError:
         err_msg = f"REGOS API Error: Request timed out after {timeout_seconds} seconds"
         logger.error(err_msg)
-        raise HTTPException(status_code=504, detail=err_msg)
+        raise RetryableUpstreamError(status_code=504, detail=err_msg)
+
+    except aiohttp.ClientResponseError as e:
+        # Reading a 200 response failed (e.g. not JSON): repeating it will not help
+        err_msg = f"REGOS API Error: Invalid response - {str(e)}"
+        logger.error(err_msg)
+        raise HTTPException(status_code=502, detail=err_msg)
 
     except aiohttp.ClientError as e:
         err_msg = f"REGOS API Error: Client error occurred - {str(e)}"
         logger.error(err_msg)
-        raise HTTPException(status_code=502, detail=err_msg)
+        raise RetryableUpstreamError(status_code=502, detail=err_msg)
+
+    except HTTPException:
+        raise
 
     except Exception as e:
         err_msg = f"REGOS API Error: {e}"
@@ -0,0 +1,17 @@
+"""
+REGOS reference data cache
+"""
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from backend.cache import StaleWhileRevalidateCache
+from backend.config import REGOS_CACHE_TTL, REGOS_CACHE_STALE_TTL
+
+# Stocks, currencies, price types, item groups and partner groups change rarely;
+# they are served from memory and refreshed in the background after their TTL.
+reference_cache = StaleWhileRevalidateCache(
+    "regos_reference",
+    ttls=REGOS_CACHE_TTL,
+    stale_ttl=REGOS_CACHE_STALE_TTL,
+)
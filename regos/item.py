@@ -34,3 +34,32 @@ async def add_item(item_data: dict) -> dict:
         endpoint="Item/Add",
         request_data=item_data
     )
+
+
+async def get_items(item_filter_data: dict) -> dict:
+    """
+    Get items (номенклатура) from REGOS.
+
+    Args:
+        item_filter_data: Dictionary with filter parameters according to REGOS API:
+            - ids (Array of int64, optional): Массив id номенклатуры
+            - group_ids (Array of int64, optional): Массив id групп номенклатуры
+            - search (String, optional): Строка поиска
+            - deleted_mark (Boolean, optional): Пометка на удаление
+            - limit (Int32, optional): Лимит возвращаемых данных
+            - offset (Int32, optional): Смещение от начала выборки
+            See: https://docs.regos.uz/uz/api/references/item/get
+
+    Returns:
+        dict: API response with "ok" and "result" containing:
+            - result (Array): Массив номенклатуры
+            - next_offset (Int32): Смещение для следующей выборки данных
+            - total (Int32): Количество элементов выборки
+
+    Raises:
+        HTTPException: If API request fails or returns error
+    """
+    return await regos_async_api_request(
+        endpoint="Item/Get",
+        request_data=item_filter_data
+    )
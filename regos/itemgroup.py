@@ -6,6 +6,7 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from regos.api import regos_async_api_request
+from regos.cache import reference_cache
 
 
 async def get_item_groups(item_group_filter_data: dict = None) -> dict:
@@ -21,10 +22,18 @@ async def get_item_groups(item_group_filter_data: dict = None) -> dict:
         dict: API response with "ok" and "result" containing:
             - result (Array): Массив групп номенклатуры
 
+    Results are cached in memory (see regos.cache.reference_cache); the returned
+    dict is shared and must not be mutated.
+
     Raises:
         HTTPException: If API request fails or returns error.
     """
-    return await regos_async_api_request(
-        endpoint="ItemGroup/Get",
-        request_data=item_group_filter_data or {},
+    request_data = item_group_filter_data or {}
+    return await reference_cache.get_or_load(
+        "ItemGroup/Get",
+        request_data,
+        lambda: regos_async_api_request(
+            endpoint="ItemGroup/Get",
+            request_data=request_data,
+        ),
     )
@@ -1,3 +1,4 @@
+import asyncio
 from typing import Literal
 
 import sys
@@ -5,8 +6,12 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from regos.api import regos_async_api_request
+from backend.config import REGOS_MATCH_CONCURRENCY
 MatchType = Literal["Code", "Name", "Articul", "Barcode"]
 
+# Item/Match accepts at most this many products per request
+MATCH_CHUNK_SIZE = 250
+
 
 async def match_products(match_type: MatchType, products: list[dict]) -> dict:
     """
@@ -27,7 +32,7 @@ async def match_products(match_type: MatchType, products: list[dict]) -> dict:
     Raises:
         HTTPException: If API request fails or returns error
     """
-    if len(products) > 250:
+    if len(products) > MATCH_CHUNK_SIZE:
         raise ValueError("Maximum 250 products allowed per request")
     
     # Validate products structure
@@ -43,4 +48,152 @@ async def match_products(match_type: MatchType, products: list[dict]) -> dict:
     return await regos_async_api_request(
         endpoint="Item/Match",
         request_data=request_data
-    )
\ No newline at end of file
+    )
+
+
+async def match_products_bulk(
+    match_type: MatchType,
+    products: list[dict],
+    chunk_size: int = MATCH_CHUNK_SIZE,
+    concurrency: int = REGOS_MATCH_CONCURRENCY,
+) -> dict:
+    """
+    Match any number of products with the REGOS API.
+
+    Products are split into Item/Match requests of at most `chunk_size` items,
+    which run with at most `concurrency` requests in flight. Results are merged
+    back by "index" and returned in the order of the input products.
+
+    Args:
+        match_type: Type of matching - "Code", "Name", "Articul", or "Barcode"
+        products: List of dictionaries with unique "index" (str) and "value" (str) keys
+        chunk_size: Products per Item/Match request (maximum 250)
+        concurrency: Maximum number of Item/Match requests running at once
+
+    Returns:
+        dict: {"ok": True, "result": [...]} with the same rows as match_products
+
+    Raises:
+        ValueError: If products are malformed or indexes are not unique
+        HTTPException: If any API request fails or returns error
+    """
+    if not 0 < chunk_size <= MATCH_CHUNK_SIZE:
+        raise ValueError(f"chunk_size must be between 1 and {MATCH_CHUNK_SIZE}")
+
+    indexes = set()
+    for product in products:
+        if "index" not in product or "value" not in product:
+            raise ValueError("Each product must have 'index' and 'value' keys")
+        index = str(product["index"])
+        if index in indexes:
+            raise ValueError(f"Duplicate product index: {index}")
+        indexes.add(index)
+
+    chunks = [products[i:i + chunk_size] for i in range(0, len(products), chunk_size)]
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def match_chunk(chunk: list[dict]) -> dict:
+        async with semaphore:
+            return await match_products(match_type, chunk)
+
+    responses = await asyncio.gather(*(match_chunk(chunk) for chunk in chunks))
+
+    matches_by_index = {}
+    for response in responses:
+        for row in response.get("result") or []:
+            matches_by_index[str(row.get("index"))] = row
+
+    result = [
+        matches_by_index[str(product["index"])]
+        for product in products
+        if str(product["index"]) in matches_by_index
+    ]
+    return {"ok": True, "result": result}
+
+
+# Default cascade order: the most specific keys are tried first
+CASCADE_STRATEGIES: tuple[MatchType, ...] = ("Code", "Barcode", "Articul", "Name")
+
+# Product key holding the candidate value for each match strategy
+CASCADE_KEYS: dict[str, str] = {
+    "Code": "code",
+    "Barcode": "barcode",
+    "Articul": "articul",
+    "Name": "name",
+}
+
+
+async def cascade_match_products(
+    products: list[dict],
+    strategies: list[MatchType] | tuple[MatchType, ...] = CASCADE_STRATEGIES,
+    matcher=match_products_bulk,
+) -> dict:
+    """
+    Match products with the REGOS API trying several strategies in order.
+
+    Every strategy runs as one batched pass (see match_products_bulk) over only the
+    products that are still unmatched and have a value for that strategy's key, so
+    each product is matched by the first strategy that finds it.
+
+    Args:
+        products: List of dictionaries with a unique "index" and any of the candidate
+            keys "code", "barcode", "articul", "name"
+        strategies: Match types to try, in order (default: Code → Barcode → Articul → Name)
+        matcher: Coroutine with the signature of match_products_bulk used for each pass
+
+    Returns:
+        dict: {
+            "ok": True,
+            "result": [{"index", "item_id", "value", "match_type"}, ...] in input order,
+            "unmatched": [index, ...],
+            "passes": number of strategy passes run through `matcher` (answered by REGOS or the local item mirror)
+        }
+
+    Raises:
+        ValueError: If products are malformed, indexes are not unique or a strategy is unknown
+        HTTPException: If any API request fails or returns error
+    """
+    for strategy in strategies:
+        if strategy not in CASCADE_KEYS:
+            raise ValueError(f"Unknown match strategy: {strategy}")
+
+    remaining: dict[str, dict] = {}
+    for product in products:
+        if "index" not in product:
+            raise ValueError("Each product must have an 'index' key")
+        index = str(product["index"])
+        if index in remaining:
+            raise ValueError(f"Duplicate product index: {index}")
+        remaining[index] = product
+
+    order = list(remaining)
+    matched: dict[str, dict] = {}
+    passes = 0
+
+    for strategy in strategies:
+        key = CASCADE_KEYS[strategy]
+        rows = [
+            {"index": index, "value": str(product[key])}
+            for index, product in remaining.items()
+            if product.get(key) not in (None, "")
+        ]
+        if not rows:
+            continue
+
+        response = await matcher(strategy, rows)
+        passes += 1
+        for row in response.get("result") or []:
+            index = str(row.get("index"))
+            if row.get("item_id") and index in remaining:
+                matched[index] = {**row, "index": index, "match_type": strategy}
+                del remaining[index]
+
+        if not remaining:
+            break
+
+    return {
+        "ok": True,
+        "result": [matched[index] for index in order if index in matched],
+        "unmatched": [index for index in order if index not in matched],
+        "passes": passes,
+    }
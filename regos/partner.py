@@ -6,6 +6,7 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from regos.api import regos_async_api_request
+from regos.cache import reference_cache
 
 
 async def add_partner(partner_data: dict) -> dict:
@@ -75,10 +76,17 @@ async def get_partner_groups(group_filter_data: dict) -> dict:
         dict: API response with "ok" and "result" containing:
             - result (Array): Массив групп контрагентов
 
+    Results are cached in memory (see regos.cache.reference_cache); the returned
+    dict is shared and must not be mutated.
+
     Raises:
         HTTPException: If API request fails or returns error.
     """
-    return await regos_async_api_request(
-        endpoint="PartnerGroup/Get",
-        request_data=group_filter_data,
+    return await reference_cache.get_or_load(
+        "PartnerGroup/Get",
+        group_filter_data,
+        lambda: regos_async_api_request(
+            endpoint="PartnerGroup/Get",
+            request_data=group_filter_data,
+        ),
     )
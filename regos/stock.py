@@ -6,6 +6,7 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from regos.api import regos_async_api_request
+from regos.cache import reference_cache
 
 
 async def get_stocks(stock_filter_data: dict) -> dict:
@@ -23,10 +24,17 @@ async def get_stocks(stock_filter_data: dict) -> dict:
             - next_offset (Int32): Смещение для следующей выборки данных
             - total (Int32): Количество элементов выборки
 
+    Results are cached in memory (see regos.cache.reference_cache); the returned
+    dict is shared and must not be mutated.
+
     Raises:
         HTTPException: If API request fails or returns error.
     """
-    return await regos_async_api_request(
-        endpoint="Stock/Get",
-        request_data=stock_filter_data,
+    return await reference_cache.get_or_load(
+        "Stock/Get",
+        stock_filter_data,
+        lambda: regos_async_api_request(
+            endpoint="Stock/Get",
+            request_data=stock_filter_data,
+        ),
     )